@@ -11,13 +11,33 @@ Created on Sun Apr 13 07:19:06 2025
 
 
 import os
+import copy
 import json
 import time
+import shutil
+import hashlib
 import logging
-from typing import Dict, Any, Optional
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
 
 # Import the main pipeline
-from pipeline_coordinator import AudioPipeline, get_default_config
+from pipeline_coordinator import AudioPipeline, get_default_config, make_job_config, COMBINED_RESULTS_FILE
+from model_registry import get_registry, warm_up
+from job_queue import JobQueue, QueueFullError
+from inference_server import batching_stats
+from inference_backends import backend_reports
+from result_cache import get_cache
+from job_store import make_job_store, recover_orphans, process_owner
+from event_stream import EventBroker, public_event
+from stage_metrics import PrometheusMetrics
+from quality_tiers import TierPolicy, apply_tier, AUTO_TIER
+from audio_io import probe_duration
+from audio_ingest import ingest_stream, IngestError
+from speaker_index import get_speaker_index
+from search_index import get_transcript_index
+from live_session import LiveSession, live_stats
 
 # Set up logging
 logging.basicConfig(
@@ -39,8 +59,43 @@ class PipelineAPI:
         # Make sure output directory exists
         os.makedirs(self.config["output_dir"], exist_ok=True)
         
-        # Track job status
-        self.jobs = {}
+        # Job records (updated from worker events on a listener thread),
+        # opened on first use so config updates apply to the store
+        self._store = None
+        self._lock = threading.RLock()
+        self._owner = process_owner()
+        
+        # Worker pool, created on first use so config updates apply to it
+        self.queue = None
+        self._cleanup_thread = None
+        self._stop_cleanup = threading.Event()
+        
+        # Job events for streaming clients
+        stream_config = self.config.get("event_stream", {})
+        self.events = EventBroker(
+            history_size=stream_config.get("history_size", 1000),
+            max_jobs=stream_config.get("max_jobs", 256),
+            max_pending=stream_config.get("max_pending", 1000)
+        )
+        
+        # Stage and job metrics of the jobs this process queued
+        self.metrics = PrometheusMetrics()
+        
+        # Picks a quality tier per job when quality_tiers.default is "auto"
+        self.tier_policy = TierPolicy(self.config)
+        
+        # Serialized results of finished jobs, in LRU order
+        self._results_cache = OrderedDict()
+        self._results_cache_bytes = 0
+    
+    @property
+    def store(self):
+        """The job store, opened on first use"""
+        with self._lock:
+            if self._store is None:
+                self._store = make_job_store(self.config)
+                recover_orphans(self._store)
+            return self._store
     
     def update_config(self, config_updates: Dict[str, Any]) -> Dict[str, Any]:
         """Update configuration with provided values"""
@@ -50,15 +105,74 @@ class PipelineAPI:
                     self.config[key].update(value)
                 else:
                     self.config[key] = value
+        if "quality_tiers" in config_updates:
+            self.tier_policy = TierPolicy(self.config)
         
         return self.config
     
+    def warm_up_models(self, models: Optional[list] = None) -> Dict[str, Any]:
+        """Load models into the shared registry before the first job arrives"""
+        logger.info("Warming up models...")
+        return warm_up(self.config, models)
+    
+    def get_model_stats(self) -> Dict[str, Any]:
+        """Get model registry, inference backend, batching and result cache statistics"""
+        cache_config = self.config.get("result_cache", {})
+        cache_dir = cache_config.get("dir") or os.path.join(self.config["output_dir"], ".result_cache")
+        return {
+            "api_process": {
+                "models": get_registry(self.config).stats(),
+                "batching": batching_stats(),
+                "backends": backend_reports()
+            },
+            "quality_tiers": self.tier_policy.stats(),
+            "live": self.get_live_stats(),
+            # Hit counts live in the worker processes; size is shared on disk
+            "result_cache": (get_cache(cache_dir, cache_config.get("max_size_mb", 10240)).usage()
+                             if cache_config.get("enabled", False) else None),
+            "workers": self.queue.worker_stats() if self.queue is not None else {}
+        }
+    
+    def get_live_stats(self) -> Dict[str, Any]:
+        """Latency percentiles and active sessions of live mode in this process"""
+        return live_stats(self.config)
+    
+    def ingest_upload(self, stream, upload_path: str, job_id: str,
+                      output_dir: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Write an upload stream to upload_path in one pass (see audio_ingest),
+        decoding it into the job's output directory when
+        ingest.decode_on_upload is on. Raises IngestError for uploads that
+        must not be queued; pass the result to process_audio as audio_info.
+        """
+        job_output_dir = output_dir or os.path.join(self.config["output_dir"], job_id)
+        decode_path = None
+        created = False
+        if (self.config.get("ingest", {}).get("decode_on_upload", False)
+                and self.config.get("decode", {}).get("enabled", True)):
+            created = not os.path.exists(job_output_dir)
+            os.makedirs(job_output_dir, exist_ok=True)
+            decode_path = os.path.join(job_output_dir, os.path.basename(self.config["intermediate_files"]["pcm"]))
+        try:
+            return ingest_stream(stream, upload_path, self.config, decode_path)
+        except IngestError:
+            if created:
+                shutil.rmtree(job_output_dir, ignore_errors=True)
+            raise
+    
     def process_audio(self, 
                       audio_path: str, 
                       job_id: Optional[str] = None,
                       output_dir: Optional[str] = None,
-                      force_rerun: bool = False) -> Dict[str, Any]:
-        """Process an audio file and return a job ID"""
+                      force_rerun: bool = False,
+                      quality_tier: Optional[str] = None,
+                      audio_info: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Queue an audio file for processing and return the job ID straight away.
+        quality_tier overrides quality_tiers.default (a tier name or "auto").
+        audio_info is what ingest_upload found out about the file (its hash
+        and duration are not computed again).
+        """
         # Generate a job ID if not provided
         if not job_id:
             job_id = f"job_{int(time.time())}"
@@ -71,90 +185,383 @@ class PipelineAPI:
         
         os.makedirs(job_output_dir, exist_ok=True)
         
-        # Create job config
-        job_config = self.config.copy()
-        job_config["audio_path"] = audio_path
-        job_config["output_dir"] = job_output_dir
+        # Create job config (deep copy so jobs never share nested dicts)
+        job_config = make_job_config(self.config, audio_path, job_output_dir, job_id=job_id)
+        if audio_info is not None:
+            job_config["audio_hash"] = audio_info["sha256"]
+        try:
+            selection = self._select_tier(quality_tier, audio_path,
+                                          audio_info.get("duration") if audio_info is not None else None)
+        except ValueError as e:
+            return {"job_id": job_id, "status": "rejected", "error": str(e)}
+        if selection is not None:
+            job_config = apply_tier(job_config, *selection)
         
-        # Update intermediate file paths to include job ID
-        for key, value in job_config["intermediate_files"].items():
-            job_config["intermediate_files"][key] = os.path.join(job_output_dir, os.path.basename(value))
+        # A rerun under the same job ID replaces its results
+        self._drop_cached_results(job_id)
         
         # Initialize job status
-        self.jobs[job_id] = {
-            "status": "started",
-            "start_time": time.time(),
+        self.store.create(job_id, {
+            "status": "queued",
+            "submit_time": time.time(),
+            "start_time": None,
+            "end_time": None,
+            "output_dir": job_output_dir,
+            "owner": self._owner,
+            "current_stage": None,
+            "stages_running": [],
+            "quality_tier": (job_config.get("quality_tier") or {}).get("name"),
+            "audio": ({key: audio_info.get(key) for key in ("format", "codec", "size", "sha256", "duration")}
+                      if audio_info is not None else None),
             "config": job_config,
             "results": None
+        })
+        
+        if not self.config.get("job_queue", {}).get("enabled", True):
+            return self._run_job(job_id, job_config, force_rerun)
+        
+        try:
+            position = self._get_queue().submit(job_id, job_config, force_rerun=force_rerun)
+        except QueueFullError as e:
+            logger.warning(f"Rejected job {job_id}: {str(e)}")
+            self.store.delete(job_id)
+            self._drop_cached_results(job_id)
+            return {
+                "job_id": job_id,
+                "status": "rejected",
+                "error": str(e)
+            }
+        
+        self.events.publish(job_id, {"type": "job_queued", "job_id": job_id,
+                                     "queue_position": position, "time": time.time()})
+        return {
+            "job_id": job_id,
+            "status": "queued",
+            "queue_position": position,
+            "output_dir": job_output_dir,
+            "quality_tier": (job_config.get("quality_tier") or {}).get("name")
         }
+    
+    def _select_tier(self, requested: Optional[str], audio_path: str,
+                     audio_s: Optional[float] = None) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """The tier for a new job and how it was chosen, or None when tiers are not in use"""
+        tiers_config = self.config.get("quality_tiers", {})
+        name = requested or tiers_config.get("default")
+        if not name:
+            return None
+        if name != AUTO_TIER:
+            if name not in tiers_config.get("tiers", {}):
+                raise ValueError(f"Unknown quality tier '{name}'")
+            return name, {"selected_by": "request" if requested else "default"}
         
+        queue_config = self.config.get("job_queue", {})
+        slots = queue_config.get("num_workers", 2) * queue_config.get("jobs_per_worker", 1)
+        if audio_s is None:
+            try:
+                audio_s = probe_duration(audio_path)
+            except Exception:
+                audio_s = None
+        tier, selection = self.tier_policy.choose(self.queue.depth() if self.queue is not None else 0,
+                                                  slots, audio_s)
+        logger.info(f"Selected quality tier {tier} ({selection['estimated_turnaround_s']}s expected "
+                    f"with {selection['queue_depth']} jobs queued)")
+        return tier, selection
+    
+    def _run_job(self, job_id: str, job_config: Dict[str, Any], force_rerun: bool) -> Dict[str, Any]:
+        """Run a job synchronously in this process (used when the queue is disabled)"""
+        self._handle_event({"type": "job_running", "job_id": job_id, "time": time.time()})
         try:
-            # Initialize and run pipeline
-            pipeline = AudioPipeline(job_config, force_rerun=force_rerun)
+            pipeline = AudioPipeline(job_config, force_rerun=force_rerun,
+                                     progress_callback=lambda event: self._handle_event(dict(event, job_id=job_id)))
             results = pipeline.run_pipeline()
-            
-            # Update job status
-            self.jobs[job_id]["status"] = results["pipeline_status"]
-            self.jobs[job_id]["end_time"] = time.time()
-            self.jobs[job_id]["duration"] = self.jobs[job_id]["end_time"] - self.jobs[job_id]["start_time"]
-            self.jobs[job_id]["results"] = results
-            
+            self._handle_event({"type": "job_finished", "job_id": job_id, "results": results, "time": time.time()})
             return {
                 "job_id": job_id,
                 "status": results["pipeline_status"],
-                "output_dir": job_output_dir,
+                "output_dir": job_config["output_dir"],
                 "results": results
             }
-            
         except Exception as e:
             logger.error(f"Error processing job {job_id}: {str(e)}")
-            self.jobs[job_id]["status"] = "failed"
-            self.jobs[job_id]["error"] = str(e)
-            self.jobs[job_id]["end_time"] = time.time()
-            self.jobs[job_id]["duration"] = self.jobs[job_id]["end_time"] - self.jobs[job_id]["start_time"]
-            
+            self._handle_event({"type": "job_failed", "job_id": job_id, "error": str(e), "time": time.time()})
             return {
                 "job_id": job_id,
                 "status": "failed",
                 "error": str(e)
             }
     
+    def _get_queue(self) -> JobQueue:
+        """Create the job queue on first use"""
+        with self._lock:
+            if self.queue is None:
+                queue_config = self.config.get("job_queue", {})
+                self.queue = JobQueue(
+                    base_config=copy.deepcopy(self.config),
+                    on_event=self._handle_event,
+                    num_workers=queue_config.get("num_workers", 2),
+                    max_queue_depth=queue_config.get("max_queue_depth", 50),
+                    start_method=queue_config.get("start_method", "spawn"),
+                    preload_models=queue_config.get("preload_models", True),
+                    jobs_per_worker=queue_config.get("jobs_per_worker", 1)
+                )
+            return self.queue
+    
+    def start_workers(self):
+        """Start the worker pool now instead of on the first upload"""
+        self._get_queue().start()
+        self._start_cleanup()
+    
+    def shutdown(self):
+        """Stop the worker pool and the cleanup thread"""
+        self._stop_cleanup.set()
+        if self.queue is not None:
+            self.queue.stop()
+    
+    def _start_cleanup(self):
+        """Start the thread that deletes expired jobs"""
+        interval = self.config.get("job_store", {}).get("cleanup_interval_s", 3600)
+        if self._cleanup_thread is not None or not interval:
+            return
+        
+        def cleanup_loop():
+            while not self._stop_cleanup.wait(interval):
+                try:
+                    self.cleanup_expired_jobs()
+                except Exception as e:
+                    logger.error(f"Job cleanup failed: {str(e)}")
+        
+        self._cleanup_thread = threading.Thread(target=cleanup_loop, name="job-cleanup", daemon=True)
+        self._cleanup_thread.start()
+    
+    def cleanup_expired_jobs(self, ttl_hours: Optional[float] = None) -> Dict[str, Any]:
+        """Delete finished jobs older than the TTL, with their output directories"""
+        if ttl_hours is None:
+            ttl_hours = self.config.get("job_store", {}).get("ttl_hours", 168)
+        base_dir = os.path.abspath(self.config["output_dir"])
+        removed = []
+        for record in self.store.expired(ttl_hours * 3600):
+            output_dir = record.get("output_dir")
+            # Only directories the API created under its own output dir are removed
+            if output_dir and os.path.abspath(output_dir).startswith(base_dir + os.sep):
+                shutil.rmtree(output_dir, ignore_errors=True)
+            self.store.delete(record["job_id"])
+            self._drop_cached_results(record["job_id"])
+            if self.config.get("search_index", {}).get("enabled", False):
+                get_transcript_index(self.config).delete_job(record["job_id"])
+            if self.config.get("speaker_index", {}).get("enabled", False):
+                get_speaker_index(self.config).delete_job(record["job_id"])
+            removed.append(record["job_id"])
+        if removed:
+            logger.info(f"Removed {len(removed)} expired jobs")
+        return {"removed": removed}
+    
+    def _handle_event(self, event: Dict[str, Any]):
+        """Update job status from a worker event"""
+        job_id = event.get("job_id")
+        if job_id is None:
+            return
+        self.events.publish(job_id, public_event(event))
+        
+        def apply(job):
+            if event["type"] == "job_running":
+                job["status"] = "running"
+                job["start_time"] = event["time"]
+            elif event["type"] == "stage_started":
+                job["stages_running"].append(event["stage"])
+                job["current_stage"] = event["stage"]
+            elif event["type"] == "stage_completed":
+                if event["stage"] in job["stages_running"]:
+                    job["stages_running"].remove(event["stage"])
+                job["current_stage"] = job["stages_running"][-1] if job["stages_running"] else None
+            elif event["type"] in ("job_finished", "job_failed", "job_cancelled"):
+                if event["type"] == "job_finished":
+                    job["status"] = event["results"]["pipeline_status"]
+                    job["results"] = event["results"]
+                elif event["type"] == "job_failed":
+                    job["status"] = "failed"
+                    job["error"] = event.get("error")
+                else:
+                    job["status"] = "cancelled"
+                job["current_stage"] = None
+                job["stages_running"] = []
+                job["end_time"] = event["time"]
+                if job["start_time"] is not None:
+                    job["duration"] = job["end_time"] - job["start_time"]
+        
+        # Events without a status change (e.g. partial transcripts) are only streamed
+        if event["type"] in ("job_running", "stage_started", "stage_completed",
+                             "job_finished", "job_failed", "job_cancelled"):
+            job = self.store.modify(job_id, apply)
+            if job is not None and event["type"] in ("job_finished", "job_failed", "job_cancelled"):
+                self.metrics.observe_job(job["status"], job.get("duration"), event.get("results"))
+                if job["status"] in ("completed", "partially_completed"):
+                    results = event.get("results") or {}
+                    self.tier_policy.observe(job.get("quality_tier"), job.get("duration"),
+                                             results.get("audio", {}).get("duration"))
+    
+    def get_prometheus_metrics(self) -> str:
+        """Stage and job metrics in the Prometheus text format"""
+        return self.metrics.render({
+            "pipeline_queue_depth": self.queue.depth() if self.queue is not None else 0,
+            "pipeline_jobs_running": self.store.list(status="running", limit=1)[1],
+            "pipeline_stream_subscribers": self.events.stats()["subscribers"]
+        })
+    
+    def subscribe_events(self, job_id: str, last_event_id: Optional[int] = None):
+        """Subscribe to a job's events (see event_stream.EventBroker.subscribe)"""
+        return self.events.subscribe(job_id, last_event_id)
+    
+    def cancel_job(self, job_id: str) -> Dict[str, Any]:
+        """Cancel a queued or running job"""
+        job = self.store.get(job_id)
+        if job is None:
+            return {"error": "Job not found"}
+        status = job["status"]
+        
+        if status not in ("queued", "running") or self.queue is None:
+            return {"job_id": job_id, "status": status, "error": "Job is not queued or running"}
+        if job.get("owner") != self._owner:
+            return {"job_id": job_id, "status": status, "error": "Job is running in another API process"}
+        
+        self.queue.cancel(job_id)
+        self.store.modify(job_id, lambda record: record.update(cancel_requested=True))
+        return {"job_id": job_id, "status": status, "cancel_requested": True}
+    
     def get_job_status(self, job_id: str) -> Dict[str, Any]:
         """Get the status of a specific job"""
-        if job_id not in self.jobs:
+        job = self.store.get(job_id)
+        if job is None:
+            return {"error": "Job not found"}
+        status = {
+            "job_id": job_id,
+            "status": job["status"],
+            "submit_time": job.get("submit_time"),
+            "start_time": job.get("start_time"),
+            "end_time": job.get("end_time"),
+            "duration": job.get("duration"),
+            "output_dir": job["output_dir"],
+            "quality_tier": job.get("quality_tier"),
+            "audio": job.get("audio")
+        }
+        if job["status"] == "running":
+            status["current_stage"] = job["current_stage"]
+            status["stages_running"] = list(job["stages_running"])
+        if job.get("cancel_requested"):
+            status["cancel_requested"] = True
+        if job.get("error"):
+            status["error"] = job["error"]
+        
+        if status["status"] == "queued" and self.queue is not None and job.get("owner") == self._owner:
+            status["queue_position"] = self.queue.position(job_id)
+        return status
+    
+    def search_speakers(self, job_id: Optional[str] = None, speaker: Optional[str] = None,
+                        k: int = 5) -> Dict[str, Any]:
+        """
+        Top-k matches in earlier calls for each indexed speaker of a job (or
+        just one speaker label), with the index's latency statistics. Without
+        a job_id only the statistics are returned.
+        """
+        if job_id is None:
+            index = get_speaker_index(self.config)
+            index.refresh()
+            return {"index": index.stats()}
+        
+        job = self.store.get(job_id)
+        if job is None:
             return {"error": "Job not found"}
+        job_config = job["config"]
+        if not job_config.get("speaker_index", {}).get("enabled", False):
+            return {"job_id": job_id, "error": "Speaker indexing was not enabled for this job"}
+        embeddings_path = job_config["intermediate_files"]["speaker_embeddings"]
+        if not os.path.exists(embeddings_path):
+            return {"job_id": job_id, "status": job["status"], "error": "Speaker embeddings not available yet"}
         
+        with np.load(embeddings_path) as saved:
+            embeddings = dict(zip(saved["labels"].tolist(), saved["embeddings"]))
+        if speaker is not None:
+            if speaker not in embeddings:
+                return {"job_id": job_id, "error": f"Speaker '{speaker}' is not indexed",
+                        "speakers": list(embeddings.keys())}
+            embeddings = {speaker: embeddings[speaker]}
+        
+        index = get_speaker_index(job_config)
+        index.refresh()
         return {
             "job_id": job_id,
-            "status": self.jobs[job_id]["status"],
-            "start_time": self.jobs[job_id].get("start_time"),
-            "end_time": self.jobs[job_id].get("end_time"),
-            "duration": self.jobs[job_id].get("duration"),
-            "output_dir": self.jobs[job_id]["config"]["output_dir"]
+            "k": k,
+            "speakers": {label: index.search(embedding, k=k, exclude_job=job_id)
+                         for label, embedding in embeddings.items()},
+            "index": index.stats()
         }
     
+    def search_transcripts(self, query: Optional[str] = None, **filters) -> Dict[str, Any]:
+        """
+        Search the aligned segments of all indexed jobs by text and by the
+        filters of TranscriptIndex.search (job_id, speaker, start, end,
+        min_score, max_score, sentiment, limit, offset)
+        """
+        if not self.config.get("search_index", {}).get("enabled", False):
+            return {"error": "The search index is not enabled"}
+        return get_transcript_index(self.config).search(query, **filters)
+    
+    def start_live_session(self, emit, **options) -> LiveSession:
+        """
+        Start a live call session that sends its partial, final and sentiment
+        messages to emit (see live_session); options are LiveSession's
+        input_format, sample_rate, language and sentiment.
+        Raises SessionLimitError when max_sessions are running.
+        """
+        if not self.config.get("live", {}).get("enabled", False):
+            raise RuntimeError("Live mode is not enabled")
+        return LiveSession(self.config, emit, **options)
+    
     def get_job_results(self, job_id: str) -> Dict[str, Any]:
         """Get the full results of a specific job"""
-        if job_id not in self.jobs:
+        artifact = self.get_job_results_artifact(job_id)
+        if "body" not in artifact:
+            return artifact
+        return json.loads(artifact["body"])
+    
+    def get_job_results_artifact(self, job_id: str) -> Dict[str, Any]:
+        """
+        The serialized results of a finished job with their ETag, as
+        {"job_id", "status", "etag", "body"}, or an error dict
+        """
+        with self._lock:
+            if job_id in self._results_cache:
+                self._results_cache.move_to_end(job_id)
+                return dict(self._results_cache[job_id])
+        
+        job = self.store.get(job_id)
+        if job is None:
             return {"error": "Job not found"}
         
-        if self.jobs[job_id]["status"] not in ["completed", "partially_completed"]:
+        if job["status"] not in ["completed", "partially_completed"]:
             return {
                 "job_id": job_id,
-                "status": self.jobs[job_id]["status"],
+                "status": job["status"],
                 "error": "Results not available yet or job failed"
             }
         
         try:
-            # Initialize pipeline to use its collect_results method
-            pipeline = AudioPipeline(self.jobs[job_id]["config"])
-            detailed_results = pipeline.collect_results()
+            combined_path = os.path.join(job["output_dir"], COMBINED_RESULTS_FILE)
+            if os.path.exists(combined_path):
+                with open(combined_path, 'r') as f:
+                    detailed_results = json.load(f)
+            else:
+                # Jobs finished before combined results existed: assemble them once
+                pipeline = AudioPipeline(job["config"])
+                if job["results"]:
+                    pipeline.results = job["results"]
+                pipeline.save_combined_results()
+                detailed_results = pipeline.collect_results()
             
-            return {
+            body = json.dumps({
                 "job_id": job_id,
-                "status": self.jobs[job_id]["status"],
+                "status": job["status"],
                 "results": detailed_results
-            }
+            }, separators=(',', ':')).encode("utf-8")
             
         except Exception as e:
             logger.error(f"Error collecting results for job {job_id}: {str(e)}")
@@ -163,20 +570,65 @@ class PipelineAPI:
                 "status": "error",
                 "error": f"Error collecting results: {str(e)}"
             }
+        
+        artifact = {
+            "job_id": job_id,
+            "status": job["status"],
+            "etag": hashlib.sha256(body).hexdigest()[:32],
+            "body": body
+        }
+        self._cache_results(job_id, artifact)
+        return dict(artifact)
     
-    def list_jobs(self) -> Dict[str, Any]:
-        """List all jobs and their statuses"""
+    def _cache_results(self, job_id: str, artifact: Dict[str, Any]):
+        """Keep serialized results, evicting the least recently used over budget"""
+        results_config = self.config.get("job_results", {})
+        max_entries = results_config.get("memory_entries", 64)
+        max_bytes = results_config.get("memory_mb", 256) * 1024 * 1024
+        if max_entries <= 0 or len(artifact["body"]) > max_bytes:
+            return
+        with self._lock:
+            self._drop_cached_results(job_id)
+            self._results_cache[job_id] = artifact
+            self._results_cache_bytes += len(artifact["body"])
+            while len(self._results_cache) > max_entries or self._results_cache_bytes > max_bytes:
+                _, evicted = self._results_cache.popitem(last=False)
+                self._results_cache_bytes -= len(evicted["body"])
+    
+    def _drop_cached_results(self, job_id: str):
+        """Forget a job's serialized results"""
+        with self._lock:
+            artifact = self._results_cache.pop(job_id, None)
+            if artifact is not None:
+                self._results_cache_bytes -= len(artifact["body"])
+    
+    def list_jobs(self,
+                  status: Optional[str] = None,
+                  limit: int = 50,
+                  offset: int = 0,
+                  submitted_after: Optional[float] = None) -> Dict[str, Any]:
+        """List jobs, newest first, a page at a time"""
+        records, total = self.store.list(status=status, limit=limit, offset=offset,
+                                         submitted_after=submitted_after)
         job_list = {}
-        for job_id, job_info in self.jobs.items():
-            job_list[job_id] = {
+        for job_info in records:
+            job_list[job_info["job_id"]] = {
                 "status": job_info["status"],
+                "submit_time": job_info.get("submit_time"),
                 "start_time": job_info.get("start_time"),
                 "end_time": job_info.get("end_time"),
                 "duration": job_info.get("duration"),
-                "output_dir": job_info["config"]["output_dir"]
+                "output_dir": job_info["output_dir"],
+                "quality_tier": job_info.get("quality_tier")
             }
         
-        return {"jobs": job_list}
+        return {
+            "jobs": job_list,
+            "total": total,
+            "limit": limit,
+            "offset": offset,
+            "queue_depth": self.queue.depth() if self.queue is not None else 0
+        }
 
 
 # Example of how to use with Flask
@@ -237,7 +689,7 @@ if __name__ == "__main__":
             status = api.get_job_status("test_job_1")
             print(f"Job status: {status['status']}")
             
-            if status['status'] in ["completed", "partially_completed", "failed"]:
+            if status['status'] in ["completed", "partially_completed", "failed", "cancelled"]:
                 break
                 
             time.sleep(5)
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Speaker attribution of transcript words.
+
+Whisper word timestamps are matched against the diarization turns in one
+sweep: words in start order and turns in start order, with a heap of the
+turns that have started, ordered by end, from which turns ending before the
+current word are dropped. Each word goes to the turn it overlaps most.
+"""
+import heapq
+import bisect
+from typing import Dict, Any, List, Tuple
+
+# Compact timing format: [start, end, text] triples, times rounded to 10 ms
+TIME_DECIMALS = 2
+
+
+def compact_whisper_result(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Keep Whisper's segment and word timestamps as compact triples"""
+    segments = []
+    words = []
+    for segment in result.get("segments", []):
+        segments.append([round(float(segment["start"]), TIME_DECIMALS),
+                         round(float(segment["end"]), TIME_DECIMALS),
+                         segment["text"].strip()])
+        for word in segment.get("words", []):
+            text = word["word"].strip()
+            if text:
+                words.append([round(float(word["start"]), TIME_DECIMALS),
+                              round(float(word["end"]), TIME_DECIMALS),
+                              text])
+    return {"segments": segments, "words": words}
+
+
+class TurnIndex:
+    def __init__(self, turns: List[Dict[str, Any]]):
+        """
+        Index diarization turns ({"start", "end", ...}) for a sweep of
+        overlap lookups in non-decreasing word start order.
+
+        Each turn enters and leaves the heap of started turns once, so the
+        whole sweep costs O((W + S) log S) plus, per word, the turns still
+        open at its start; that is the turns genuinely overlapping it (a few
+        at most with diarization output), not every earlier long turn.
+        """
+        self.order = sorted(range(len(turns)), key=lambda i: turns[i]["start"])
+        self.starts = [turns[i]["start"] for i in self.order]
+        self.ends = [turns[i]["end"] for i in self.order]
+        # max_end[k] is the latest end among the first k+1 turns by start,
+        # and max_end_position[k] the (last) turn with that end
+        self.max_end = []
+        self.max_end_position = []
+        latest, latest_position = float("-inf"), -1
+        for k, end in enumerate(self.ends):
+            if end >= latest:
+                latest, latest_position = end, k
+            self.max_end.append(latest)
+            self.max_end_position.append(latest_position)
+        # Sweep state: next turn to open, and open turns as (end, position)
+        self._next = 0
+        self._open = []
+        self._last_start = float("-inf")
+
+    def best_turn(self, start: float, end: float) -> int:
+        """
+        Index of the turn overlapping [start, end] most, or the nearest one.
+        Calls must come in non-decreasing start order.
+        """
+        if not self.order:
+            return -1
+        if start < self._last_start:
+            raise ValueError("best_turn must be called in non-decreasing start order")
+        self._last_start = start
+
+        while self._next < len(self.order) and self.starts[self._next] <= end:
+            heapq.heappush(self._open, (self.ends[self._next], self._next))
+            self._next += 1
+        # Later words start no earlier, so turns ending before this one are done
+        while self._open and self._open[0][0] < start:
+            heapq.heappop(self._open)
+
+        best, best_overlap = -1, -1.0
+        for turn_end, k in self._open:
+            overlap = min(end, turn_end) - max(start, self.starts[k])
+            # Ties go to the turn that started last
+            if overlap > best_overlap or (overlap == best_overlap and k > best):
+                best, best_overlap = k, overlap
+
+        if best < 0 or best_overlap < 0:
+            # No overlapping turn: take the closest one on either side
+            position = bisect.bisect_right(self.starts, end) - 1
+            candidates = []
+            if position >= 0:
+                candidates.append((start - self.max_end[position], self.max_end_position[position]))
+            if position + 1 < len(self.order):
+                candidates.append((self.starts[position + 1] - end, position + 1))
+            best = min(candidates)[1]
+        return self.order[best]
+
+
+def assign_words_to_turns(words: List[Tuple[float, float, str]],
+                          turns: List[Dict[str, Any]]) -> List[List[str]]:
+    """Return the words spoken in each turn, in time order"""
+    index = TurnIndex(turns)
+    turn_words = [[] for _ in turns]
+    for start, end, text in sorted(words, key=lambda word: word[0]):
+        turn = index.best_turn(start, end)
+        if turn >= 0:
+            turn_words[turn].append(text)
+    return turn_words
+
+
+def assign_words_by_rate(transcript_text: str, turns: List[Dict[str, Any]]) -> List[List[str]]:
+    """
+    Fallback for transcripts without word timestamps: hand out words to turns
+    in order at the call's average speaking rate.
+    """
+    words = transcript_text.split()
+    if not turns:
+        return []
+    total_duration = turns[-1]["end"]
+    words_per_second = len(words) / total_duration if total_duration > 0 else 0.0
+
+    turn_words = []
+    for turn in turns:
+        word_count = int((turn["end"] - turn["start"]) * words_per_second)
+        turn_words.append(words[:word_count])
+        words = words[word_count:]
+    return turn_words
@@ -7,11 +7,23 @@ Created on Sun Apr 13 11:46:27 2025
 """
 
 # app.py - Flask backend for audio pipeline
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, Response, request, jsonify, render_template, send_from_directory, stream_with_context
 from pipeline_api import PipelineAPI
+from segment_store import SegmentStore, segment_records, OUTPUT_COLUMNS
+from event_stream import format_sse, TERMINAL_EVENTS
+from audio_ingest import IngestError
+from live_session import SessionLimitError
 import os
+import json
+import shutil
 import uuid
 import logging
+import threading
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None
 
 # Configure logging
 logging.basicConfig(
@@ -37,6 +49,15 @@ os.makedirs(RESULTS_FOLDER, exist_ok=True)
 pipeline_api = PipelineAPI()
 pipeline_api.update_config({"output_dir": RESULTS_FOLDER})
 
+# Start the worker pool (workers load the models once at startup). Spawned
+# workers re-import this file as __mp_main__ and must not start their own,
+# and neither must the debug reloader's watcher process, which only runs
+# the serving child (WERKZEUG_RUN_MAIN set) and never handles a request.
+_reloader_watcher = __name__ == '__main__' and os.environ.get("WERKZEUG_RUN_MAIN") != "true"
+if (__name__ != '__mp_main__' and not _reloader_watcher
+        and os.environ.get("PIPELINE_START_WORKERS", "1") == "1"):
+    pipeline_api.start_workers()
+
 @app.route('/')
 def index():
     """Render the main page"""
@@ -44,45 +65,78 @@ def index():
 
 @app.route('/upload', methods=['POST'])
 def upload_file():
-    """Handle file upload and start processing"""
-    # Check if file is in request
-    if 'audioFile' not in request.files:
-        return jsonify({"error": "No file part"}), 400
-    
-    file = request.files['audioFile']
-    
-    # Check if file is empty
-    if file.filename == '':
-        return jsonify({"error": "No file selected"}), 400
+    """
+    Handle file upload and start processing. Takes a multipart form
+    (audioFile, quality_tier) or a raw audio body (Content-Type audio/* or
+    application/octet-stream, ?filename=&quality_tier=), which is read
+    straight from the request as it arrives.
+    """
+    if request.mimetype.startswith('audio/') or request.mimetype == 'application/octet-stream':
+        stream = request.stream
+        filename = request.args.get('filename') or 'upload'
+        quality_tier = request.args.get('quality_tier') or None
+    else:
+        # Check if file is in request
+        if 'audioFile' not in request.files:
+            return jsonify({"error": "No file part"}), 400
+        
+        file = request.files['audioFile']
+        
+        # Check if file is empty
+        if file.filename == '':
+            return jsonify({"error": "No file selected"}), 400
+        stream = file.stream
+        filename = file.filename
+        quality_tier = request.form.get('quality_tier') or None
     
-    # Check file extension
-    if not file.filename.lower().endswith('.mp3'):
-        return jsonify({"error": "Only MP3 files are allowed"}), 400
+    # Optional quality tier (fast, balanced, accurate or auto)
+    tiers = pipeline_api.config.get("quality_tiers", {}).get("tiers", {})
+    if quality_tier is not None and quality_tier != "auto" and quality_tier not in tiers:
+        return jsonify({"error": f"Unknown quality tier '{quality_tier}'",
+                        "tiers": list(tiers.keys()) + ["auto"]}), 400
     
     try:
         # Generate unique ID for this job
         job_id = str(uuid.uuid4())
+        output_dir = os.path.join(RESULTS_FOLDER, job_id)
         
-        # Save file to upload folder with job ID as prefix
-        filename = f"{job_id}_{file.filename}"
-        file_path = os.path.join(UPLOAD_FOLDER, filename)
-        file.save(file_path)
+        # Save file to upload folder with job ID as prefix; the format is
+        # sniffed from the content, not the extension
+        file_path = os.path.join(UPLOAD_FOLDER, f"{job_id}_{os.path.basename(filename)}")
+        try:
+            audio_info = pipeline_api.ingest_upload(stream, file_path, job_id, output_dir)
+        except IngestError as e:
+            status = {"too_large": 413, "unsupported_format": 415}.get(e.reason, 400)
+            return jsonify({"error": str(e), "reason": e.reason}), status
         
         logger.info(f"File saved to {file_path}")
         
-        # Start processing the audio file
+        # Queue the audio file for processing
         result = pipeline_api.process_audio(
             audio_path=file_path,
             job_id=job_id,
-            output_dir=os.path.join(RESULTS_FOLDER, job_id)
+            output_dir=output_dir,
+            quality_tier=quality_tier,
+            audio_info=audio_info
         )
         
+        if result["status"] == "rejected":
+            os.remove(file_path)
+            shutil.rmtree(output_dir, ignore_errors=True)
+            response = jsonify({"error": result["error"], "job_id": job_id})
+            response.headers["Retry-After"] = "30"
+            return response, 503
+        
         return jsonify({
             "success": True,
             "job_id": job_id,
-            "message": "File uploaded and processing started",
-            "status": result["status"]
-        })
+            "message": "File uploaded and queued for processing",
+            "status": result["status"],
+            "queue_position": result.get("queue_position"),
+            "quality_tier": result.get("quality_tier"),
+            "audio": {"format": audio_info["format"], "codec": audio_info["codec"],
+                      "duration": audio_info["duration"], "sha256": audio_info["sha256"]}
+        }), 202
         
     except Exception as e:
         logger.error(f"Error in upload: {str(e)}")
@@ -98,12 +152,81 @@ def get_status(job_id):
         logger.error(f"Error getting status: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/stream/<job_id>', methods=['GET'])
+def stream_job(job_id):
+    """
+    Server-sent events for a job: stage transitions, partial transcripts and
+    per-segment sentiment as they happen. Reconnecting clients send
+    Last-Event-ID and receive only what they missed.
+    """
+    last_event_id = request.headers.get('Last-Event-ID', type=int)
+    # Unknown jobs get no broker state, which would evict real jobs' history
+    status = pipeline_api.get_job_status(job_id)
+    if status.get("error") == "Job not found":
+        return jsonify(status), 404
+    # Subscribe before taking the snapshot so no event falls in between
+    subscription = pipeline_api.subscribe_events(job_id, last_event_id)
+    status = pipeline_api.get_job_status(job_id)
+    if status.get("error") == "Job not found":
+        # Deleted in the meantime
+        subscription.close()
+        return jsonify(status), 404
+    keepalive_s = pipeline_api.config.get("event_stream", {}).get("keepalive_s", 15)
+    
+    def generate():
+        try:
+            yield "retry: 3000\n\n"
+            if last_event_id is None:
+                yield format_sse({"type": "status"}, json.dumps(status))
+            if status["status"] not in ("queued", "running") and subscription.queue.empty():
+                # Finished before this stream opened (or in another API process)
+                yield format_sse({"type": "end"}, json.dumps({"status": status["status"]}))
+                return
+            while not subscription.dropped:
+                event = subscription.get(timeout=keepalive_s)
+                if event is None:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield format_sse(event, json.dumps(event))
+                if event["type"] in TERMINAL_EVENTS:
+                    yield format_sse({"type": "end"}, json.dumps({"status": event.get("status", event["type"])}))
+                    return
+        finally:
+            subscription.close()
+    
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.route('/cancel/<job_id>', methods=['POST'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    try:
+        result = pipeline_api.cancel_job(job_id)
+        if result.get("error") == "Job not found":
+            return jsonify(result), 404
+        if result.get("error"):
+            return jsonify(result), 409
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error cancelling job: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
 @app.route('/results/<job_id>', methods=['GET'])
 def get_results(job_id):
-    """Get the results of a processing job"""
+    """Get the results of a processing job (supports If-None-Match)"""
     try:
-        result = pipeline_api.get_job_results(job_id)
-        return jsonify(result)
+        artifact = pipeline_api.get_job_results_artifact(job_id)
+        if "body" not in artifact:
+            return jsonify(artifact)
+        
+        # Unchanged results cost the client a 304 and no body
+        if artifact["etag"] in request.if_none_match:
+            response = Response(status=304)
+        else:
+            response = Response(artifact["body"], mimetype='application/json')
+        response.set_etag(artifact["etag"])
+        response.headers["Cache-Control"] = "private, no-cache"
+        return response
     except Exception as e:
         logger.error(f"Error getting results: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -129,6 +252,13 @@ def download_file(job_id, file_type):
     filename = file_mapping[file_type]
     file_path = os.path.join(job_dir, filename)
     
+    # Columnar jobs keep segment outputs as columns; build the JSON on request
+    segments = SegmentStore(os.path.join(job_dir, "segments"))
+    if not os.path.exists(file_path) and file_type in OUTPUT_COLUMNS and segments.has(*OUTPUT_COLUMNS[file_type]):
+        body = json.dumps(segment_records(segments, file_type), indent=2)
+        return Response(body, mimetype='application/json',
+                        headers={"Content-Disposition": f"attachment; filename={filename}"})
+    
     if not os.path.exists(file_path):
         return jsonify({"error": "File not found"}), 404
     
@@ -136,13 +266,136 @@ def download_file(job_id, file_type):
 
 @app.route('/jobs', methods=['GET'])
 def list_jobs():
-    """List all processing jobs"""
+    """List processing jobs, newest first (?status=&limit=&offset=)"""
     try:
-        result = pipeline_api.list_jobs()
+        result = pipeline_api.list_jobs(
+            status=request.args.get('status'),
+            limit=min(request.args.get('limit', 50, type=int), 500),
+            offset=max(request.args.get('offset', 0, type=int), 0)
+        )
         return jsonify(result)
     except Exception as e:
         logger.error(f"Error listing jobs: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/models/stats', methods=['GET'])
+def model_stats():
+    """Get shared model registry and batching statistics"""
+    try:
+        return jsonify(pipeline_api.get_model_stats())
+    except Exception as e:
+        logger.error(f"Error getting model stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/search', methods=['GET'])
+def search_transcripts():
+    """
+    Search transcript segments of all jobs (?q=&job_id=&speaker=&start=&end=
+    &min_score=&max_score=&sentiment=&limit=&offset=); matched terms are
+    wrapped in <mark> in each hit's highlight
+    """
+    try:
+        result = pipeline_api.search_transcripts(
+            request.args.get('q'),
+            job_id=request.args.get('job_id'),
+            speaker=request.args.get('speaker'),
+            start=request.args.get('start', type=float),
+            end=request.args.get('end', type=float),
+            min_score=request.args.get('min_score', type=float),
+            max_score=request.args.get('max_score', type=float),
+            sentiment=request.args.get('sentiment'),
+            limit=min(max(request.args.get('limit', 20, type=int), 1), 500),
+            offset=max(request.args.get('offset', 0, type=int), 0)
+        )
+        if result.get("error"):
+            return jsonify(result), 409
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error searching transcripts: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/speakers', methods=['GET'])
+def search_speakers():
+    """Top-k earlier-call matches of a job's speakers (?job_id=&speaker=&k=) and index latency stats"""
+    try:
+        result = pipeline_api.search_speakers(
+            job_id=request.args.get('job_id'),
+            speaker=request.args.get('speaker'),
+            k=min(max(request.args.get('k', 5, type=int), 1), 100)
+        )
+        if result.get("error") == "Job not found":
+            return jsonify(result), 404
+        if result.get("error"):
+            return jsonify(result), 409
+        return jsonify(result)
+    except Exception as e:
+        logger.error(f"Error searching speakers: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Per-stage and job metrics in the Prometheus text format"""
+    try:
+        return Response(pipeline_api.get_prometheus_metrics(), mimetype='text/plain; version=0.0.4')
+    except Exception as e:
+        logger.error(f"Error rendering metrics: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/live/stats', methods=['GET'])
+def live_stats():
+    """Latency percentiles of live sessions in this process"""
+    try:
+        return jsonify(pipeline_api.get_live_stats())
+    except Exception as e:
+        logger.error(f"Error getting live stats: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def live_call(ws):
+    """
+    Live call over a WebSocket. The first message is a JSON text message of
+    session options ({"format": "pcm16"|"f32"|"webm", "sample_rate",
+    "language", "sentiment"}); audio follows as binary messages, and a
+    {"type": "stop"} text message (or closing the socket) ends the call.
+    Partial, final, sentiment and stats messages are sent back as JSON.
+    """
+    send_lock = threading.Lock()
+    
+    def send(message):
+        with send_lock:
+            ws.send(json.dumps(message))
+    
+    try:
+        options = json.loads(ws.receive() or "{}")
+        session = pipeline_api.start_live_session(
+            send,
+            input_format=options.get("format", "pcm16"),
+            sample_rate=int(options.get("sample_rate", 16000)),
+            language=options.get("language"),
+            sentiment=options.get("sentiment")
+        )
+    except (ValueError, RuntimeError, OSError, SessionLimitError) as e:
+        logger.warning(f"Live session refused: {str(e)}")
+        send({"type": "error", "error": str(e)})
+        return
+    
+    send({"type": "ready", "session_id": session.session_id})
+    try:
+        while True:
+            message = ws.receive()
+            if isinstance(message, (bytes, bytearray)):
+                session.feed(bytes(message))
+            elif message is not None and json.loads(message).get("type") == "stop":
+                break
+    except Exception as e:
+        # ConnectionClosed when the client hangs up
+        logger.info(f"Live session {session.session_id} ended: {type(e).__name__}")
+    finally:
+        session.close()
+
+if Sock is not None:
+    Sock(app).route('/live')(live_call)
+else:
+    logger.warning("flask-sock is not installed; the /live WebSocket is disabled")
+
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
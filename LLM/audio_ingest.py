@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Single-pass ingestion of uploaded audio.
+
+ingest_stream reads an upload in chunks and, in the same pass, writes it to
+disk, computes its SHA-256 (passed on as the job's audio_hash, so the
+result cache never reads the file again to key it), sniffs the container
+from its magic bytes and, with ingest.decode_on_upload, pipes it through
+ffmpeg to the job's decoded 16 kHz WAV so run_decode has nothing left to do.
+
+Supported containers are MP3 (ID3 tag or MPEG audio frame sync), WebM (EBML
+with a webm or matroska doc type, usually Opus from browser recorders) and
+WAV (RIFF/WAVE). The duration is read from the headers: the WAV data size
+and byte rate, the MP3 Xing/Info or VBRI frame count (or the bitrate of a
+constant-bitrate file), the WebM segment Duration. Recorders that leave
+the WebM duration out fall back to ffprobe, then to the decoded length.
+
+Uploads that are too large, not a supported container, undecodable, or
+outside the configured duration limits raise IngestError before anything
+is queued; nothing of them is left on disk.
+"""
+import os
+import time
+import struct
+import hashlib
+import logging
+from typing import Dict, Any, Optional, BinaryIO
+
+from audio_io import StreamDecoder, probe_duration, SAMPLE_RATE
+
+logger = logging.getLogger('audio_pipeline.ingest')
+
+FORMAT_EXTENSIONS = {"mp3": ".mp3", "webm": ".webm", "wav": ".wav"}
+
+# MPEG audio bitrates (kbps) by (MPEG-1, layer) and by layer for MPEG-2/2.5
+_MP3_BITRATES = {
+    (True, 1): [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+    (True, 2): [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+    (True, 3): [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    (False, 1): [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+    (False, 2): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    (False, 3): [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]
+}
+_MP3_SAMPLE_RATES = [44100, 48000, 32000]
+
+# EBML element IDs
+_EBML = 0x1A45DFA3
+_EBML_DOC_TYPE = 0x4282
+_SEGMENT = 0x18538067
+_INFO = 0x1549A966
+_TIMECODE_SCALE = 0x2AD7B1
+_DURATION = 0x4489
+_TRACKS = 0x1654AE6B
+_TRACK_ENTRY = 0xAE
+_CODEC_ID = 0x86
+_CLUSTER = 0x1F43B675
+
+
+class IngestError(ValueError):
+    def __init__(self, reason: str, message: str):
+        """A rejected upload; reason is one of empty, too_large, unsupported_format, undecodable, too_short, too_long"""
+        super().__init__(message)
+        self.reason = reason
+
+
+def _mp3_frame(data: bytes, offset: int) -> Optional[Dict[str, Any]]:
+    """The MPEG audio frame header at offset, or None if there is none"""
+    if offset + 4 > len(data):
+        return None
+    header = struct.unpack(">I", data[offset:offset + 4])[0]
+    if header >> 21 != 0x7FF:
+        return None
+    version_bits = (header >> 19) & 3
+    layer = 4 - ((header >> 17) & 3)
+    bitrate_index = (header >> 12) & 15
+    rate_index = (header >> 10) & 3
+    if version_bits == 1 or layer == 4 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    mpeg1 = version_bits == 3
+    sample_rate = _MP3_SAMPLE_RATES[rate_index] // {3: 1, 2: 2, 0: 4}[version_bits]
+    bitrate = _MP3_BITRATES[(mpeg1, layer)][bitrate_index] * 1000
+    padding = (header >> 9) & 1
+    if layer == 1:
+        samples, length = 384, (12 * bitrate // sample_rate + padding) * 4
+    else:
+        samples = 1152 if (mpeg1 or layer == 2) else 576
+        length = samples // 8 * bitrate // sample_rate + padding
+    return {"mpeg1": mpeg1, "layer": layer, "bitrate": bitrate, "sample_rate": sample_rate,
+            "samples": samples, "length": length, "mono": (header >> 6) & 3 == 3}
+
+
+def _id3_size(data: bytes) -> int:
+    """Bytes taken by a leading ID3v2 tag"""
+    if len(data) < 10 or data[:3] != b"ID3":
+        return 0
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    return 10 + size + (10 if data[5] & 0x10 else 0)
+
+
+def _ebml_vint(data: bytes, offset: int, keep_marker: bool) -> Optional[tuple]:
+    """(value, length) of the EBML variable-length integer at offset"""
+    if offset >= len(data) or data[offset] == 0:
+        return None
+    length = 8 - data[offset].bit_length() + 1
+    if offset + length > len(data):
+        return None
+    value = int.from_bytes(data[offset:offset + length], "big")
+    if not keep_marker:
+        value &= (1 << (7 * length)) - 1
+        if value == (1 << (7 * length)) - 1:
+            value = None  # unknown size
+    return value, length
+
+
+def _ebml_elements(data: bytes, start: int, end: int):
+    """(id, data offset, size) of the elements in data[start:end]; size None when unknown"""
+    offset = start
+    while offset < end:
+        element_id = _ebml_vint(data, offset, keep_marker=True)
+        if element_id is None:
+            return
+        size = _ebml_vint(data, offset + element_id[1], keep_marker=False)
+        if size is None:
+            return
+        data_offset = offset + element_id[1] + size[1]
+        yield element_id[0], data_offset, size[0]
+        if size[0] is None:
+            return
+        offset = data_offset + size[0]
+
+
+def _webm_info(head: bytes) -> Optional[Dict[str, Any]]:
+    """Doc type, codec and duration from the EBML header and segment metadata, or None if not EBML"""
+    info = {"doc_type": None, "codec": None, "duration": None}
+    elements = list(_ebml_elements(head, 0, len(head)))
+    if not elements or elements[0][0] != _EBML:
+        return None
+    for element_id, offset, size in _ebml_elements(head, elements[0][1], elements[0][1] + (elements[0][2] or 0)):
+        if element_id == _EBML_DOC_TYPE:
+            info["doc_type"] = head[offset:offset + size].rstrip(b"\0").decode("ascii", errors="replace")
+
+    segment = next((element for element in elements if element[0] == _SEGMENT), None)
+    if segment is None:
+        return info
+    segment_end = len(head) if segment[2] is None else min(len(head), segment[1] + segment[2])
+    timecode_scale, duration = 1000000, None
+    for element_id, offset, size in _ebml_elements(head, segment[1], segment_end):
+        if element_id == _CLUSTER or size is None:
+            break
+        if element_id == _INFO:
+            for child_id, child_offset, child_size in _ebml_elements(head, offset, min(len(head), offset + size)):
+                if child_id == _TIMECODE_SCALE and child_size:
+                    timecode_scale = int.from_bytes(head[child_offset:child_offset + child_size], "big")
+                elif child_id == _DURATION and child_size in (4, 8):
+                    duration = struct.unpack(">f" if child_size == 4 else ">d",
+                                             head[child_offset:child_offset + child_size])[0]
+        elif element_id == _TRACKS:
+            for entry_id, entry_offset, entry_size in _ebml_elements(head, offset, min(len(head), offset + size)):
+                if entry_id != _TRACK_ENTRY or entry_size is None:
+                    continue
+                for child_id, child_offset, child_size in _ebml_elements(
+                        head, entry_offset, min(len(head), entry_offset + entry_size)):
+                    if child_id == _CODEC_ID and info["codec"] is None:
+                        info["codec"] = head[child_offset:child_offset + child_size].decode("ascii", errors="replace")
+    if duration:
+        info["duration"] = duration * timecode_scale / 1e9
+    return info
+
+
+def _wav_info(head: bytes, total_size: int) -> Optional[Dict[str, Any]]:
+    """Codec and duration from the RIFF chunks, or None if not a WAV file"""
+    if len(head) < 12 or head[:4] != b"RIFF" or head[8:12] != b"WAVE":
+        return None
+    info = {"codec": None, "duration": None}
+    byte_rate = None
+    offset = 12
+    while offset + 8 <= len(head):
+        chunk_id, chunk_size = head[offset:offset + 4], struct.unpack("<I", head[offset + 4:offset + 8])[0]
+        if chunk_id == b"fmt " and offset + 24 <= len(head):
+            audio_format, _, _, byte_rate = struct.unpack("<HHII", head[offset + 8:offset + 20])
+            info["codec"] = {1: "pcm", 3: "float", 6: "alaw", 7: "mulaw", 0xFFFE: "extensible"}.get(
+                audio_format, f"format {audio_format}")
+        elif chunk_id == b"data":
+            # Streamed WAVs leave the size at 0 or 0xFFFFFFFF; the data runs to the end
+            available = total_size - (offset + 8)
+            data_size = chunk_size if 0 < chunk_size <= available else available
+            if byte_rate:
+                info["duration"] = data_size / byte_rate
+            break
+        offset += 8 + chunk_size + (chunk_size % 2)
+    return info
+
+
+def _mp3_info(head: bytes, total_size: int) -> Optional[Dict[str, Any]]:
+    """Codec and duration from the first frame (Xing/Info or VBRI frame count, else CBR), or None if not MP3"""
+    has_tag = head[:3] == b"ID3"
+    offset = _id3_size(head)
+    frame = _mp3_frame(head, offset)
+    if frame is None:
+        # A large tag (cover art) can fill the sniffed bytes; the decoder has the last word
+        return {"codec": "mp3", "duration": None} if has_tag else None
+    following = _mp3_frame(head, offset + frame["length"])
+    if following is None and offset + frame["length"] + 4 <= len(head) and not has_tag:
+        # A lone sync pattern in some other file
+        return None
+
+    info = {"codec": f"mp{frame['layer']}", "duration": None}
+    side_info = (17 if frame["mono"] else 32) if frame["mpeg1"] else (9 if frame["mono"] else 17)
+    xing = offset + 4 + side_info
+    vbri = offset + 4 + 32
+    frames = None
+    if head[xing:xing + 4] in (b"Xing", b"Info") and xing + 12 <= len(head):
+        flags = struct.unpack(">I", head[xing + 4:xing + 8])[0]
+        if flags & 1:
+            frames = struct.unpack(">I", head[xing + 8:xing + 12])[0]
+    elif head[vbri:vbri + 4] == b"VBRI" and vbri + 18 <= len(head):
+        frames = struct.unpack(">I", head[vbri + 14:vbri + 18])[0]
+    if frames:
+        info["duration"] = frames * frame["samples"] / frame["sample_rate"]
+    else:
+        info["duration"] = (total_size - offset) * 8 / frame["bitrate"]
+    return info
+
+
+def sniff_format(head: bytes, total_size: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    Container, codec and header duration of a file from its first bytes
+    (and total size), or None when it is not MP3, WebM or WAV
+    """
+    total_size = len(head) if total_size is None else total_size
+    info = _wav_info(head, total_size)
+    if info is not None:
+        return dict(info, format="wav")
+    info = _webm_info(head)
+    if info is not None:
+        if info["doc_type"] not in ("webm", "matroska"):
+            return None
+        return {"format": "webm", "codec": info["codec"], "duration": info["duration"]}
+    info = _mp3_info(head, total_size)
+    if info is not None:
+        return dict(info, format="mp3")
+    return None
+
+
+def ingest_stream(stream: BinaryIO, path: str, config: Dict[str, Any],
+                  decode_path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Write an upload stream to path in one pass, hashing and sniffing it (and
+    decoding it to decode_path, if given). Returns path, format, codec, size,
+    sha256, duration, duration_source and decoded (the WAV path or None);
+    raises IngestError for uploads that should not be queued.
+    """
+    ingest_config = config.get("ingest", {})
+    chunk_size = ingest_config.get("chunk_size", 1 << 20)
+    sniff_bytes = ingest_config.get("sniff_bytes", 65536)
+    max_bytes = ingest_config.get("max_upload_mb", 500) * 1024 * 1024
+    formats = ingest_config.get("formats", list(FORMAT_EXTENSIONS))
+    start_time = time.time()
+
+    temp_path = path + ".part"
+    digest = hashlib.sha256()
+    head = bytearray()
+    pending = []
+    size = 0
+    sniffed = None
+    decoder = None
+
+    def check_format():
+        nonlocal sniffed, decoder
+        sniffed = sniff_format(bytes(head), max(size, len(head)))
+        if sniffed is None or sniffed["format"] not in formats:
+            raise IngestError("unsupported_format",
+                              f"Unsupported audio format; expected one of {', '.join(formats)}")
+        if decode_path is not None:
+            try:
+                decoder = StreamDecoder(decode_path)
+            except OSError as e:
+                logger.error(f"Could not start ffmpeg to decode on upload ({str(e)}); run_decode will decode")
+        for data in pending:
+            feed(data)
+        pending.clear()
+
+    def feed(data: bytes):
+        if decoder is None:
+            return
+        try:
+            decoder.feed(data)
+        except RuntimeError as e:
+            raise IngestError("undecodable", str(e))
+
+    try:
+        with open(temp_path, 'wb') as f:
+            while True:
+                data = stream.read(chunk_size)
+                if not data:
+                    break
+                size += len(data)
+                if size > max_bytes:
+                    raise IngestError("too_large", f"Upload is larger than {max_bytes // (1024 * 1024)} MB")
+                f.write(data)
+                digest.update(data)
+                if sniffed is None:
+                    head.extend(data[:sniff_bytes - len(head)])
+                    pending.append(data)
+                    # Rejected as soon as the first bytes are in, not after the whole upload
+                    if len(head) >= sniff_bytes:
+                        check_format()
+                else:
+                    feed(data)
+        if size == 0:
+            raise IngestError("empty", "Upload is empty")
+        if sniffed is None:
+            check_format()
+
+        # Header durations that depend on the size (WAV, CBR MP3) need the final size
+        header_info = sniff_format(bytes(head), size)
+        duration, duration_source = header_info["duration"], "header"
+        if duration is None:
+            try:
+                duration, duration_source = probe_duration(temp_path), "ffprobe"
+            except Exception:
+                duration, duration_source = None, None
+
+        decoded = None
+        if decoder is not None:
+            try:
+                num_samples = decoder.close()
+            except RuntimeError as e:
+                raise IngestError("undecodable", str(e))
+            decoded = decode_path
+            if num_samples == 0:
+                raise IngestError("undecodable", "Upload contains no audio")
+            # The decoded length is exact
+            duration, duration_source = num_samples / SAMPLE_RATE, "decoded"
+            decoder = None
+
+        if duration is not None:
+            if duration < ingest_config.get("min_duration_s", 1.0):
+                raise IngestError("too_short", f"Audio is {duration:.1f}s long; the minimum is "
+                                               f"{ingest_config.get('min_duration_s', 1.0)}s")
+            if duration > ingest_config.get("max_duration_s", 14400):
+                raise IngestError("too_long", f"Audio is {duration:.0f}s long; the maximum is "
+                                              f"{ingest_config.get('max_duration_s', 14400)}s")
+        os.replace(temp_path, path)
+
+    except Exception:
+        if decoder is not None:
+            decoder.abort()
+        elif decode_path is not None and os.path.exists(decode_path):
+            os.remove(decode_path)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+    result = {
+        "path": path,
+        "format": header_info["format"],
+        "codec": header_info["codec"],
+        "size": size,
+        "sha256": digest.hexdigest(),
+        "duration": duration,
+        "duration_source": duration_source,
+        "decoded": decoded,
+        "ingest_time": time.time() - start_time
+    }
+    logger.info(f"Ingested {path}: {result['format']} ({result['codec']}), {size} bytes, "
+                f"{duration if duration is not None else 'unknown'}s ({duration_source}), "
+                f"{'decoded' if decoded else 'not decoded'} in {result['ingest_time']:.2f}s")
+    return result
@@ -0,0 +1,317 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Audio decoding helpers for the pipeline.
+
+Audio is decoded with ffmpeg (as Whisper itself does) to 16 kHz mono
+float32. iter_pcm_windows streams the decoded audio in fixed, overlapping
+windows so only one window is held in memory at a time.
+
+decode_to_wav decodes an upload once into a float32 WAV file; StreamDecoder
+does the same for audio fed in chunks, such as an upload as it arrives, and
+can hand the samples to a callback as they are decoded (live sessions).
+load_pcm memory-maps its samples, so every stage reads zero-copy views of
+the same pages, and the file itself can be handed to readers that want a
+path.
+"""
+import os
+import struct
+import subprocess
+import threading
+import logging
+from typing import Iterator, Tuple, Iterable, Optional, Callable, Sequence
+
+import numpy as np
+
+logger = logging.getLogger('audio_pipeline.audio')
+
+SAMPLE_RATE = 16000
+BYTES_PER_SAMPLE = 2
+
+
+def _ffmpeg_pcm_command(path: str, sample_rate: int = SAMPLE_RATE) -> list:
+    return [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", path,
+        "-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sample_rate),
+        "-loglevel", "error", "-"
+    ]
+
+
+def _drain_stderr(process: subprocess.Popen) -> Callable[[], str]:
+    """
+    Read ffmpeg's stderr on a thread while stdout is streamed, so warnings
+    never fill the pipe and stall the decode; returns a function that waits
+    for the process to close stderr and gives its text
+    """
+    chunks = []
+    reader = threading.Thread(target=lambda: chunks.append(process.stderr.read().decode(errors="replace")),
+                              daemon=True)
+    reader.start()
+
+    def text() -> str:
+        reader.join()
+        return "".join(chunks).strip()
+
+    return text
+
+
+def _pcm16_to_float32(data: bytes) -> np.ndarray:
+    usable = len(data) - (len(data) % BYTES_PER_SAMPLE)
+    return np.frombuffer(data[:usable], np.int16).astype(np.float32) / 32768.0
+
+
+def _float_wav_header(num_samples: int, sample_rate: int = SAMPLE_RATE) -> bytes:
+    """44-byte RIFF header for mono IEEE float32 samples"""
+    data_size = num_samples * 4
+    return (b"RIFF" + struct.pack("<I", 36 + data_size) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 3, 1, sample_rate, sample_rate * 4, 4, 32)
+            + b"data" + struct.pack("<I", data_size))
+
+
+def decode_to_wav(path: str, output_path: str, sample_rate: int = SAMPLE_RATE,
+                  read_size: int = 1 << 20) -> int:
+    """Decode audio once to a mono float32 WAV file; returns the sample count"""
+    command = [
+        "ffmpeg", "-nostdin", "-threads", "0", "-i", path,
+        "-f", "f32le", "-ac", "1", "-acodec", "pcm_f32le", "-ar", str(sample_rate),
+        "-loglevel", "error", "-"
+    ]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    error = _drain_stderr(process)
+    data_size = 0
+    with open(output_path, 'wb') as f:
+        # Sizes are patched in once decoding is finished
+        f.write(_float_wav_header(0, sample_rate))
+        while True:
+            data = process.stdout.read(read_size)
+            if not data:
+                break
+            f.write(data)
+            data_size += len(data)
+        num_samples = data_size // 4
+        f.truncate(44 + num_samples * 4)
+        f.seek(0)
+        f.write(_float_wav_header(num_samples, sample_rate))
+
+    if process.wait() != 0:
+        raise RuntimeError(f"Failed to decode audio: {error()}")
+    return num_samples
+
+
+class StreamDecoder:
+    def __init__(self, output_path: Optional[str], sample_rate: int = SAMPLE_RATE, read_size: int = 1 << 20,
+                 on_samples: Optional[Callable[[np.ndarray], None]] = None, input_options: Sequence[str] = ()):
+        """
+        Decode audio written with feed() to a mono float32 WAV file, as
+        decode_to_wav does, and/or to on_samples(float32 array) as samples
+        come out; ffmpeg reads the input from a pipe
+        """
+        command = [
+            "ffmpeg", "-nostdin", "-threads", "0", *input_options, "-i", "pipe:0",
+            "-f", "f32le", "-ac", "1", "-acodec", "pcm_f32le", "-ar", str(sample_rate),
+            "-loglevel", "error", "-"
+        ]
+        self.output_path = output_path
+        self.sample_rate = sample_rate
+        self.read_size = read_size
+        self.on_samples = on_samples
+        self.process = subprocess.Popen(command, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                        stderr=subprocess.PIPE)
+        self._file = None
+        if output_path is not None:
+            self._file = open(output_path, 'wb')
+            # Sizes are patched in once decoding is finished
+            self._file.write(_float_wav_header(0, sample_rate))
+        self._data_size = 0
+        self._partial = b""
+        self._errors = []
+        # Both outputs are drained as ffmpeg produces them so it never blocks on a full pipe
+        self._readers = [threading.Thread(target=self._read_output, daemon=True),
+                         threading.Thread(target=self._read_errors, daemon=True)]
+        for reader in self._readers:
+            reader.start()
+
+    def _read_output(self):
+        while True:
+            # Whatever is ready, so callbacks see samples as soon as they are decoded
+            data = self.process.stdout.read1(self.read_size)
+            if not data:
+                break
+            if self._file is not None:
+                self._file.write(data)
+            self._data_size += len(data)
+            if self.on_samples is not None:
+                data = self._partial + data
+                usable = len(data) - len(data) % 4
+                self._partial = data[usable:]
+                if usable:
+                    self.on_samples(np.frombuffer(data[:usable], dtype='<f4'))
+
+    def _read_errors(self):
+        self._errors.append(self.process.stderr.read().decode(errors="replace"))
+
+    def _error(self) -> str:
+        return "".join(self._errors).strip()
+
+    def feed(self, data: bytes):
+        try:
+            self.process.stdin.write(data)
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            # ffmpeg gave up on the input; its error explains why
+            self.process.wait()
+            for reader in self._readers:
+                reader.join()
+            raise RuntimeError(f"Failed to decode audio: {self._error()}")
+
+    def close(self) -> int:
+        """Finish decoding; returns the sample count"""
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self.process.wait()
+        for reader in self._readers:
+            reader.join()
+        num_samples = self._data_size // 4
+        if self._file is not None:
+            self._file.truncate(44 + num_samples * 4)
+            self._file.seek(0)
+            self._file.write(_float_wav_header(num_samples, self.sample_rate))
+            self._file.close()
+        if returncode != 0:
+            raise RuntimeError(f"Failed to decode audio: {self._error()}")
+        return num_samples
+
+    def abort(self):
+        """Stop decoding and remove the partial output"""
+        self.process.kill()
+        self.process.wait()
+        for reader in self._readers:
+            reader.join()
+        if self._file is not None:
+            self._file.close()
+            if os.path.exists(self.output_path):
+                os.remove(self.output_path)
+
+
+def probe_duration(path: str) -> float:
+    """Duration in seconds from the container headers (ffprobe), without decoding"""
+    output = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", path],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+    ).stdout.decode().strip()
+    return float(output)
+
+
+def write_float_wav(path: str, chunks: Iterable[np.ndarray], sample_rate: int = SAMPLE_RATE) -> int:
+    """Write float32 chunks as a mono float32 WAV file; returns the sample count"""
+    num_samples = 0
+    with open(path, 'wb') as f:
+        f.write(_float_wav_header(0, sample_rate))
+        for chunk in chunks:
+            f.write(np.ascontiguousarray(chunk, dtype='<f4').tobytes())
+            num_samples += len(chunk)
+        f.seek(0)
+        f.write(_float_wav_header(num_samples, sample_rate))
+    return num_samples
+
+
+def load_pcm(wav_path: str) -> np.ndarray:
+    """
+    Memory-map the samples of a float32 WAV written by decode_to_wav.
+
+    The map is copy-on-write: consumers get writable zero-copy views and the
+    file is never modified.
+    """
+    with open(wav_path, 'rb') as f:
+        header = f.read(12)
+        if header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise ValueError(f"{wav_path} is not a WAV file")
+        offset = 12
+        while True:
+            chunk_header = f.read(8)
+            if len(chunk_header) < 8:
+                raise ValueError(f"{wav_path} has no data chunk")
+            chunk_id, chunk_size = chunk_header[:4], struct.unpack("<I", chunk_header[4:])[0]
+            offset += 8
+            if chunk_id == b"fmt ":
+                fmt = struct.unpack("<HHIIHH", f.read(16))
+                if fmt[0] != 3 or fmt[1] != 1 or fmt[5] != 32:
+                    raise ValueError(f"{wav_path} is not mono float32")
+                f.seek(chunk_size - 16, 1)
+            elif chunk_id == b"data":
+                num_samples = chunk_size // 4
+                break
+            else:
+                f.seek(chunk_size, 1)
+            offset += chunk_size + (chunk_size % 2)
+
+    if num_samples == 0:
+        return np.zeros(0, dtype=np.float32)
+    return np.memmap(wav_path, dtype='<f4', mode='c', offset=offset, shape=(num_samples,))
+
+
+def iter_array_windows(samples: np.ndarray,
+                       window_s: float = 30.0,
+                       overlap_s: float = 0.0,
+                       sample_rate: int = SAMPLE_RATE) -> Iterator[Tuple[float, np.ndarray, bool]]:
+    """Same windows as iter_pcm_windows, as views of an in-memory or mapped array"""
+    window = int(window_s * sample_rate)
+    hop = window - int(overlap_s * sample_rate)
+    if hop <= 0:
+        raise ValueError("overlap_s must be shorter than window_s")
+
+    offset = 0
+    while offset < len(samples):
+        is_last = offset + window >= len(samples)
+        yield offset / sample_rate, samples[offset:offset + window], is_last
+        if is_last:
+            break
+        offset += hop
+
+
+def iter_pcm_windows(path: str,
+                     window_s: float = 30.0,
+                     overlap_s: float = 2.0,
+                     sample_rate: int = SAMPLE_RATE) -> Iterator[Tuple[float, np.ndarray, bool]]:
+    """
+    Yield (offset_seconds, samples, is_last) for consecutive windows of
+    window_s seconds, each starting window_s - overlap_s after the previous.
+    """
+    window = int(window_s * sample_rate)
+    hop = window - int(overlap_s * sample_rate)
+    if hop <= 0:
+        raise ValueError("overlap_s must be shorter than window_s")
+
+    process = subprocess.Popen(_ffmpeg_pcm_command(path, sample_rate),
+                               stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    error = _drain_stderr(process)
+    buffer = np.zeros(0, dtype=np.float32)
+    offset = 0
+    eof = False
+    try:
+        while True:
+            # One sample beyond the window tells us whether more audio follows
+            while not eof and len(buffer) < window + 1:
+                data = process.stdout.read((window + 1 - len(buffer)) * BYTES_PER_SAMPLE)
+                if not data:
+                    eof = True
+                    break
+                buffer = np.concatenate([buffer, _pcm16_to_float32(data)])
+
+            if len(buffer) == 0:
+                break
+            is_last = eof and len(buffer) <= window
+            yield offset / sample_rate, buffer[:window], is_last
+            if is_last:
+                break
+            buffer = buffer[hop:]
+            offset += hop
+    finally:
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+    if process.returncode not in (0, -9) and offset == 0 and len(buffer) == 0:
+        raise RuntimeError(f"Failed to decode audio: {error()}")
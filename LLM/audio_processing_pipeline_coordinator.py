@@ -7,13 +7,33 @@ Created on Sun Apr 13 07:17:20 2025
 """
 "audio processing pipeline coordinator code "
 import os
+import copy
 import time
 import json
+import bisect
 import torch
+import numpy as np
 import subprocess
 import logging
+import threading
 from datetime import datetime
-from typing import Dict, Any, Optional, List, Tuple
+from functools import partial
+from typing import Dict, Any, Optional, List, Tuple, Callable
+
+from model_registry import (get_whisper_model, get_diarization_model, get_indicbert, get_t5, get_speaker_encoder,
+                            DIARIZATION_SOURCE, DIARIZATION_SAVEDIR, T5_TOKENIZER)
+from stage_scheduler import StageScheduler
+from inference_server import get_batcher
+from alignment import compact_whisper_result, assign_words_to_turns, assign_words_by_rate
+from audio_io import (iter_pcm_windows, iter_array_windows, decode_to_wav, write_float_wav,
+                      load_pcm, SAMPLE_RATE)
+from vad import frame_levels_db, detect_speech_regions, TimelineMap, vad_report
+from result_cache import get_cache, hash_file, model_identity, make_key
+from segment_store import SegmentStore, segment_records, OUTPUT_COLUMNS
+from stage_metrics import StageProbe, stage_profiler
+from inference_backends import backend_for
+from speaker_index import get_speaker_index, speaker_turn_samples, normalize
+from search_index import get_transcript_index, segment_rows
 
 # Set up logging
 logging.basicConfig(
@@ -26,10 +46,223 @@ logging.basicConfig(
 )
 logger = logging.getLogger('audio_pipeline')
 
+# Pipeline stages in topological order. Stages whose dependencies have all
+# succeeded run concurrently; a failed required stage fails the pipeline.
+# "after" only orders stages; "enabled_by" names a config section whose
+# "enabled" flag turns the stage on.
+PIPELINE_STAGES = [
+    {"name": "run_decode", "depends_on": [], "required": True, "enabled_by": "decode"},
+    {"name": "run_vad", "depends_on": ["run_decode"], "required": False, "enabled_by": "vad"},
+    {"name": "run_diarization", "depends_on": ["run_decode"], "after": ["run_vad"], "required": True},
+    {"name": "run_whisper", "depends_on": ["run_decode"], "after": ["run_vad"], "required": True},
+    {"name": "run_alignment", "depends_on": ["run_diarization", "run_whisper"], "required": True},
+    {"name": "run_sentiment_analysis", "depends_on": ["run_alignment"], "required": False,
+     "enabled_by": "sentiment"},
+    {"name": "run_summarization", "depends_on": ["run_alignment"], "required": False},
+    {"name": "run_speaker_index", "depends_on": ["run_diarization"], "required": False,
+     "enabled_by": "speaker_index"},
+    {"name": "run_search_index", "depends_on": ["run_alignment"],
+     "after": ["run_sentiment_analysis", "run_speaker_index"], "required": False, "enabled_by": "search_index"}
+]
+
+
+# Stages whose outputs are kept in the result cache: the config sections
+# and models that determine their outputs, and the result entries to
+# restore on a hit. Cache keys also chain the keys of cached dependencies.
+CACHED_STAGES = {
+    "run_diarization": {"params": ["vad", "segment_storage"], "models": ["diarization"], "details": []},
+    "run_whisper": {"params": ["whisper", "vad"], "models": ["whisper"], "details": ["whisper_windows"]},
+    "run_alignment": {"params": ["segment_storage"], "models": [], "details": []},
+    "run_sentiment_analysis": {"params": ["sentiment", "segment_storage"], "models": ["indicbert"], "details": []},
+    "run_summarization": {"params": ["summarization"], "models": ["t5"], "details": ["summarization_levels"]}
+}
+
+
+# Columns (name, kind) each stage writes when segment_storage.format is
+# "columnar"; see segment_store for the layout
+SEGMENT_COLUMNS = {
+    "run_diarization": [("speaker", "category"), ("start", "numeric"), ("end", "numeric")],
+    "run_alignment": [("text", "text")],
+    "run_sentiment_analysis": [("sentiment", "category"), ("sentiment_score", "numeric")]
+}
+
+
+# Single-file copy of a finished job's pipeline info and outputs
+COMBINED_RESULTS_FILE = "job_results.json"
+
+
+# Keys every results dict has; anything else was added by a stage
+RESULT_BASE_KEYS = ("pipeline_status", "steps_completed", "errors", "output_files", "stage_metrics",
+                    "quality_tier")
+
+
+def _run_stage_in_process(config: Dict[str, Any], force_rerun: bool, func_name: str) -> Dict[str, Any]:
+    """Run a single stage in a worker process (used by the process executor)"""
+    pipeline = AudioPipeline(config, force_rerun=force_rerun)
+    return pipeline._execute_stage(func_name)
+
+
+def whisper_decode_options(whisper_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Temperature and beam settings to pass to transcribe(); unset ones keep Whisper's defaults"""
+    options = {}
+    temperature = whisper_config.get("temperature")
+    if temperature is not None:
+        options["temperature"] = tuple(temperature) if isinstance(temperature, list) else temperature
+    for key in ("beam_size", "best_of"):
+        if whisper_config.get(key) is not None:
+            options[key] = whisper_config[key]
+    return options
+
+
+def sentiment_label(sentiment_score: float) -> str:
+    """Map a positive-class probability to a sentiment label"""
+    if sentiment_score > 0.7:
+        return "positive"
+    elif sentiment_score < 0.3:
+        return "negative"
+    return "neutral"
+
+
+def score_sentiment_batched(tokenizer, model, texts: List[str],
+                            batch_size: int = 32, max_length: int = 512,
+                            stats: Optional[Dict[str, int]] = None) -> List[float]:
+    """
+    Score texts with a sequence classifier in padded batches.
+
+    Texts are tokenized once without padding and sorted by token length, so
+    each batch holds similar lengths and is only padded to its own longest
+    item. Scores are returned in input order. Token counts are added to
+    `stats` when given.
+    """
+    if not texts:
+        return []
+    
+    encodings = tokenizer(texts, truncation=True, max_length=max_length)
+    lengths = [len(ids) for ids in encodings["input_ids"]]
+    if stats is not None:
+        stats["input_tokens"] = stats.get("input_tokens", 0) + sum(lengths)
+    order = sorted(range(len(texts)), key=lambda i: lengths[i])
+    
+    scores = [0.0] * len(texts)
+    for batch_start in range(0, len(order), batch_size):
+        batch_indices = order[batch_start:batch_start + batch_size]
+        features = [{key: encodings[key][i] for key in encodings.keys()} for i in batch_indices]
+        inputs = tokenizer.pad(features, padding="longest", return_tensors="pt")
+        
+        with torch.no_grad():
+            outputs = model(**inputs)
+        
+        # Assuming binary classification, column 1 is the positive class
+        probabilities = torch.nn.functional.softmax(outputs.logits, dim=1)[:, 1]
+        for i, score in zip(batch_indices, probabilities.tolist()):
+            scores[i] = float(score)
+    
+    return scores
+
+
+def _score_with_registry_model(config: Dict[str, Any], texts: List[str], **kwargs) -> List[float]:
+    """
+    score_sentiment_batched with the registry's current IndicBERT; shared
+    batchers outlive a job, and must not keep an evicted model loaded
+    """
+    tokenizer, model = get_indicbert(config)
+    return score_sentiment_batched(tokenizer, model, texts, **kwargs)
+
+
+SENTENCE_END_CHARS = ".!?\u0964"
+
+
+def chunk_for_summarization(tokenizer, text: str, max_tokens: int = 512,
+                            prefix: str = "summarize: ", overlap_tokens: int = 0) -> List[str]:
+    """
+    Split text into prefixed chunks of at most max_tokens T5 tokens.
+
+    The text is tokenized once with a fast tokenizer; character offsets are
+    used to cut chunks at the last sentence end or line break (speaker turn)
+    that fits, falling back to a hard cut when a sentence is longer than half
+    a chunk. Consecutive chunks share up to overlap_tokens tokens.
+    """
+    if not text:
+        return []
+    
+    prefix_length = len(tokenizer(prefix, add_special_tokens=False)["input_ids"])
+    # Leave room for the prefix and the end-of-sequence token
+    budget = max(1, max_tokens - prefix_length - 1)
+    offsets = tokenizer(text, add_special_tokens=False, return_offsets_mapping=True)["offset_mapping"]
+    num_tokens = len(offsets)
+    if num_tokens == 0:
+        return []
+    
+    # Token indices after which a sentence or speaker turn ends
+    boundaries = []
+    for i, (_, end) in enumerate(offsets):
+        next_start = offsets[i + 1][0] if i + 1 < num_tokens else len(text)
+        gap = text[end:next_start]
+        if "\n" in gap or (end > 0 and text[end - 1] in SENTENCE_END_CHARS and (gap or i + 1 == num_tokens)):
+            boundaries.append(i + 1)
+    
+    overlap_tokens = min(overlap_tokens, budget // 2)
+    chunks = []
+    start = 0
+    while start < num_tokens:
+        limit = min(start + budget, num_tokens)
+        end = limit
+        if limit < num_tokens:
+            # Last boundary that fits, if it keeps the chunk at least half full
+            position = bisect.bisect_right(boundaries, limit) - 1
+            if position >= 0 and boundaries[position] - start >= budget // 2:
+                end = boundaries[position]
+        
+        chunks.append(prefix + text[offsets[start][0]:offsets[end - 1][1]].strip())
+        if end >= num_tokens:
+            break
+        start = max(start + 1, end - overlap_tokens)
+    
+    return chunks
+
+
+def generate_summaries(tokenizer, model, texts: List[str], max_input_length: int = 512,
+                       max_length: int = 150, num_beams: int = 4,
+                       stats: Optional[Dict[str, int]] = None) -> List[str]:
+    """
+    Summarize several texts with one padded call to model.generate.
+    Token counts are added to `stats` when given.
+    """
+    if not texts:
+        return []
+    
+    inputs = tokenizer(texts, return_tensors="pt", padding=True,
+                       max_length=max_input_length, truncation=True)
+    with torch.no_grad():
+        output = model.generate(
+            inputs.input_ids,
+            attention_mask=inputs.attention_mask,
+            max_length=max_length,
+            num_beams=num_beams,
+            early_stopping=True
+        )
+    if stats is not None:
+        stats["input_tokens"] = stats.get("input_tokens", 0) + int(inputs.attention_mask.sum())
+        stats["output_tokens"] = stats.get("output_tokens", 0) + int((output != tokenizer.pad_token_id).sum())
+    return tokenizer.batch_decode(output, skip_special_tokens=True)
+
+
+def _summarize_with_registry_model(config: Dict[str, Any], texts: List[str], **kwargs) -> List[str]:
+    """generate_summaries with the registry's current T5 (see _score_with_registry_model)"""
+    tokenizer, model = get_t5(config)
+    return generate_summaries(tokenizer, model, texts, **kwargs)
+
+
 class AudioPipeline:
-    def __init__(self, config: Dict[str, Any], force_rerun: bool = False):
+    def __init__(self,
+                 config: Dict[str, Any],
+                 force_rerun: bool = False,
+                 progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+                 cancel_check: Optional[Callable[[], bool]] = None):
         self.config = config
         self.force_rerun = force_rerun
+        self.progress_callback = progress_callback
+        self.cancel_check = cancel_check
         self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         
         # Create output directory if it doesn't exist
@@ -43,75 +276,487 @@ class AudioPipeline:
             "pipeline_status": "initialized",
             "steps_completed": [],
             "errors": [],
-            "output_files": {}
+            "output_files": {},
+            "stage_metrics": {}
         }
+        if self.config.get("job_id"):
+            self.results["job_id"] = self.config["job_id"]
+        if self.config.get("quality_tier"):
+            self.results["quality_tier"] = self.config["quality_tier"]
+        
+        # Metrics and results of the stage running in each thread
+        self._stage_local = threading.local()
+        
+        # Result cache keys, computed on first use
+        self._cache_lock = threading.Lock()
+        self._audio_hash = None
+        self._cache_keys = {}
 
     def _setup_paths(self):
         """Setup all file paths for inputs and outputs"""
-        # Ensure all intermediate file paths are absolute
+        # Place intermediate files in the output directory. Paths already
+        # there (from make_job_config, or a config this resolved before, as a
+        # process-mode stage receives) are kept, so relative ones are not
+        # joined twice.
+        output_dir = self.config["output_dir"]
         for key, file_name in self.config["intermediate_files"].items():
-            self.config["intermediate_files"][key] = os.path.join(
-                self.config["output_dir"], file_name
-            )
+            if os.path.isabs(file_name) or file_name.startswith(os.path.join(output_dir, "")):
+                continue
+            self.config["intermediate_files"][key] = os.path.join(output_dir, file_name)
     
     def _file_exists(self, file_path: str) -> bool:
         """Check if a file exists and is not empty"""
         return os.path.exists(file_path) and os.path.getsize(file_path) > 0
     
-    def run_with_progress(self, func_name: str, *args, **kwargs):
-        """Run a function with progress tracking"""
+    def _notify(self, event_type: str, **data):
+        """Send a progress event to the registered callback, if any"""
+        if self.progress_callback is None:
+            return
+        try:
+            self.progress_callback(dict(data, type=event_type, time=time.time()))
+        except Exception as e:
+            logger.warning(f"Progress callback failed for {event_type}: {str(e)}")
+    
+    def _execute_stage(self, func_name: str, *args, **kwargs) -> Dict[str, Any]:
+        """Run a stage and return its outcome without touching the step lists"""
         logger.info(f"Starting {func_name}...")
+        self._notify("stage_started", stage=func_name)
         start_time = time.time()
+        cached = False
+        metrics = {}
+        self._stage_local.metrics = metrics
+        self._stage_local.results = {"output_files": {}}
+        probe = StageProbe()
         
         try:
-            result = getattr(self, func_name)(*args, **kwargs)
+            with probe, stage_profiler(self.config, func_name, metrics):
+                cached = self._fetch_cached(func_name)
+                if cached:
+                    result = True
+                else:
+                    result = getattr(self, func_name)(*args, **kwargs)
+                    if result:
+                        self._store_cached(func_name)
             duration = time.time() - start_time
-            logger.info(f"Completed {func_name} in {duration:.2f} seconds")
-            self.results["steps_completed"].append(func_name)
-            return result
+            logger.info(f"Completed {func_name} in {duration:.2f} seconds" + (" (cached)" if cached else ""))
+            self._notify("stage_completed", stage=func_name, success=bool(result), duration=duration, cached=cached)
+            return {
+                "success": bool(result),
+                "result": result,
+                "error": None,
+                "duration": duration,
+                "cached": cached,
+                "metrics": self._finish_metrics(probe, metrics, cached),
+                "output_files": dict(self._stage_local.results["output_files"]),
+                "details": self._stage_details()
+            }
         except Exception as e:
             duration = time.time() - start_time
             error_msg = f"Error in {func_name} after {duration:.2f} seconds: {str(e)}"
             logger.error(error_msg)
-            self.results["errors"].append(error_msg)
+            self._notify("stage_completed", stage=func_name, success=False, duration=duration, error=error_msg)
+            return {
+                "success": False,
+                "result": False,
+                "error": error_msg,
+                "duration": duration,
+                "metrics": self._finish_metrics(probe, metrics, cached),
+                "output_files": dict(self._stage_local.results["output_files"]),
+                "details": self._stage_details()
+            }
+        finally:
+            self._stage_local.metrics = None
+            self._stage_local.results = None
+    
+    def _stage_results(self) -> Dict[str, Any]:
+        """
+        Where the stage running in this thread records its output files and
+        result entries; merged into self.results once the stage has finished,
+        so concurrent stages never write the shared dict
+        """
+        results = getattr(self._stage_local, "results", None)
+        return results if results is not None else self.results
+    
+    def _add_stage_metrics(self, **values):
+        """Record metrics of the stage running in this thread; numbers accumulate"""
+        metrics = getattr(self._stage_local, "metrics", None)
+        if metrics is None:
+            return
+        for key, value in values.items():
+            if isinstance(value, (int, float)) and isinstance(metrics.get(key), (int, float)):
+                metrics[key] += value
+            else:
+                metrics[key] = value
+    
+    def _audio_duration(self) -> Optional[float]:
+        """Duration of the recording, from run_decode or the decoded file"""
+        for results in (self._stage_results(), self.results):
+            if "audio" in results:
+                return results["audio"]["duration"]
+        pcm_path = self.config["intermediate_files"]["pcm"]
+        if self._file_exists(pcm_path):
+            return len(load_pcm(pcm_path)) / SAMPLE_RATE
+        return None
+    
+    def _finish_metrics(self, probe: StageProbe, metrics: Dict[str, Any], cached: bool) -> Dict[str, Any]:
+        """Combine measured and stage-reported metrics, adding the real-time factor"""
+        metrics = dict(probe.metrics, **metrics)
+        metrics["cached"] = cached
+        try:
+            audio_duration = metrics.get("audio_duration") or self._audio_duration()
+        except Exception:
+            audio_duration = None
+        if audio_duration and "wall_time" in metrics:
+            metrics["audio_duration"] = audio_duration
+            metrics["rtf"] = metrics["wall_time"] / audio_duration
+        return metrics
+    
+    def _result_cache(self):
+        """The shared result cache, or None when it is disabled"""
+        cache_config = self.config.get("result_cache", {})
+        if not cache_config.get("enabled", False):
+            return None
+        cache_dir = cache_config.get("dir") or os.path.join(self.config["output_dir"], ".result_cache")
+        return get_cache(cache_dir, cache_config.get("max_size_mb", 10240))
+    
+    def _stage_outputs(self, func_name: str) -> Dict[str, str]:
+        """Files a cached stage writes, by their name in the cache entry"""
+        if self._columnar() and func_name in SEGMENT_COLUMNS:
+            outputs = {}
+            for name, kind in SEGMENT_COLUMNS[func_name]:
+                for file_name in SegmentStore.column_files(name, kind):
+                    outputs[f"segments.{file_name}"] = os.path.join(self._segments().path, file_name)
+            if func_name == "run_alignment":
+                outputs["formatted"] = os.path.join(self.config["output_dir"], "formatted_transcript.txt")
+            return outputs
+        return self._stage_output_files(func_name)
+    
+    def _stage_output_files(self, func_name: str) -> Dict[str, str]:
+        """What a cached stage adds to output_files"""
+        files = self.config["intermediate_files"]
+        output_dir = self.config["output_dir"]
+        if self._columnar():
+            segments_path = self._segments().path
+            return {
+                "run_diarization": {"diarization": segments_path},
+                "run_whisper": {"transcript": files["transcript"], "transcript_timing": files["transcript_timing"]},
+                "run_alignment": {"aligned": segments_path,
+                                  "formatted": os.path.join(output_dir, "formatted_transcript.txt"),
+                                  "indicbert_input": segments_path},
+                "run_sentiment_analysis": {"sentiment": segments_path},
+                "run_summarization": {"summary": files["summary"]}
+            }[func_name]
+        return {
+            "run_diarization": {"diarization": files["diarization"]},
+            "run_whisper": {"transcript": files["transcript"], "transcript_timing": files["transcript_timing"]},
+            "run_alignment": {"aligned": files["aligned"],
+                              "formatted": os.path.join(output_dir, "formatted_transcript.txt"),
+                              "indicbert_input": files["indicbert_input"]},
+            "run_sentiment_analysis": {"sentiment": os.path.join(output_dir, "sentiment_results.json")},
+            "run_summarization": {"summary": files["summary"]}
+        }[func_name]
+    
+    def _columnar(self) -> bool:
+        """Whether segment outputs are stored as columns instead of JSON"""
+        return self.config.get("segment_storage", {}).get("format", "json") == "columnar"
+    
+    def _segments(self) -> SegmentStore:
+        return SegmentStore(self.config["intermediate_files"]["segments"])
+    
+    def _load_segments(self, output: str) -> List[Dict[str, Any]]:
+        """Records of a segment output (see OUTPUT_COLUMNS), from columns or JSON"""
+        if self._columnar():
+            return segment_records(self._segments(), output)
+        path = {
+            "diarization": self.config["intermediate_files"]["diarization"],
+            "aligned": self.config["intermediate_files"]["aligned"],
+            "indicbert_input": self.config["intermediate_files"]["indicbert_input"],
+            "sentiment": os.path.join(self.config["output_dir"], "sentiment_results.json")
+        }[output]
+        with open(path, 'r') as f:
+            return json.load(f)
+    
+    def _model_identity(self, name: str) -> str:
+        """Name plus on-disk fingerprint of a model, for cache keys"""
+        model_paths = self.config["model_paths"]
+        if name == "whisper":
+            model_name = self.config.get("whisper", {}).get("model", "base")
+            return model_identity(os.path.join(os.path.dirname(model_paths["whisper"]), f"{model_name}.pt"))
+        if name == "diarization":
+            return f"{DIARIZATION_SOURCE}|{model_identity(DIARIZATION_SAVEDIR)}"
+        # Quantized and ONNX backends give slightly different outputs, so they key separately
+        if name == "indicbert":
+            return (f"{model_identity(model_paths['indicbert_model'])}|"
+                    f"{model_identity(model_paths['indicbert_tokenizer'])}|{backend_for(self.config, name)}")
+        if name == "t5":
+            return f"{model_identity(model_paths['t5_model'])}|{T5_TOKENIZER}|{backend_for(self.config, name)}"
+        raise ValueError(f"Unknown model '{name}'")
+    
+    def _cache_key(self, func_name: str) -> str:
+        """Key of a stage's outputs: audio, stage, models, params and upstream keys"""
+        with self._cache_lock:
+            if func_name in self._cache_keys:
+                return self._cache_keys[func_name]
+            if self._audio_hash is None:
+                self._audio_hash = self.config.get("audio_hash") or hash_file(self.config["audio_path"])
+        
+        spec = CACHED_STAGES[func_name]
+        stage = next(stage for stage in PIPELINE_STAGES if stage["name"] == func_name)
+        # Disabled sections (e.g. VAD off) do not change the outputs
+        params = {}
+        for section in spec["params"]:
+            section_config = self.config.get(section, {})
+            if section_config.get("enabled", True):
+                params[section] = section_config
+        key = make_key(
+            audio=self._audio_hash,
+            stage=func_name,
+            models={name: self._model_identity(name) for name in spec["models"]},
+            params=params,
+            upstream=[self._cache_key(dep) for dep in stage.get("depends_on", []) if dep in CACHED_STAGES]
+        )
+        with self._cache_lock:
+            self._cache_keys[func_name] = key
+        return key
+    
+    def _fetch_cached(self, func_name: str) -> bool:
+        """Restore a stage's outputs from the result cache; True on a hit"""
+        cache = self._result_cache()
+        if cache is None or func_name not in CACHED_STAGES or self.force_rerun:
+            return False
+        outputs = self._stage_outputs(func_name)
+        # Outputs already in the job directory are reused by the stage itself
+        if all(self._file_exists(path) for path in outputs.values()):
+            return False
+        
+        details = cache.fetch(self._cache_key(func_name), outputs)
+        if details is None:
             return False
+        logger.info(f"Restored {func_name} outputs from the result cache")
+        results = self._stage_results()
+        results["output_files"].update(self._stage_output_files(func_name))
+        results.update(details)
+        return True
+    
+    def _store_cached(self, func_name: str):
+        """Add a finished stage's outputs to the result cache"""
+        cache = self._result_cache()
+        if cache is None or func_name not in CACHED_STAGES:
+            return
+        outputs = self._stage_outputs(func_name)
+        if not all(self._file_exists(path) for path in outputs.values()):
+            return
+        results = self._stage_results()
+        details = {key: results[key] for key in CACHED_STAGES[func_name]["details"] if key in results}
+        try:
+            cache.store(self._cache_key(func_name), outputs, details)
+        except Exception as e:
+            # A cache failure never fails the stage
+            logger.warning(f"Could not cache {func_name} outputs: {str(e)}")
+    
+    def _stage_details(self) -> Dict[str, Any]:
+        """Extra result entries the running stage added (e.g. summarization_levels)"""
+        return {key: value for key, value in self._stage_results().items() if key not in RESULT_BASE_KEYS}
+    
+    def _merge_stage_results(self, func_name: str, outcome: Dict[str, Any]):
+        """Add a finished stage's output files and result entries, for the stages after it"""
+        self.results["output_files"].update(outcome.get("output_files", {}))
+        self.results.update(outcome.get("details", {}))
+    
+    def _record_outcome(self, func_name: str, outcome: Dict[str, Any]):
+        """Add a stage outcome to the pipeline results"""
+        self._merge_stage_results(func_name, outcome)
+        if outcome.get("metrics"):
+            self.results["stage_metrics"][func_name] = outcome["metrics"]
+        if outcome.get("cached"):
+            self.results.setdefault("cached_stages", []).append(func_name)
+        if outcome.get("error"):
+            self.results["errors"].append(outcome["error"])
+        elif not outcome.get("skipped"):
+            self.results["steps_completed"].append(func_name)
+    
+    def run_with_progress(self, func_name: str, *args, **kwargs):
+        """Run a function with progress tracking"""
+        outcome = self._execute_stage(func_name, *args, **kwargs)
+        self._record_outcome(func_name, outcome)
+        return outcome["result"]
+    
+    def run_vad(self) -> bool:
+        """Detect speech regions so Whisper and diarization can skip silence and hold music"""
+        vad_config = self.config.get("vad", {})
+        output_path = self.config["intermediate_files"]["vad"]
+        speech_path = self.config["intermediate_files"]["speech_audio"]
+        
+        # Skip if files exist and force_rerun is False
+        if self._file_exists(output_path) and self._file_exists(speech_path) and not self.force_rerun:
+            logger.info(f"VAD output already exists at {output_path}")
+            return True
+        
+        try:
+            frame_samples = int(vad_config.get("frame_ms", 30) * SAMPLE_RATE / 1000)
+            frame_s = frame_samples / SAMPLE_RATE
+            # Whole frames per window so no frame straddles two windows
+            window_s = frame_s * 2000
+            
+            # First pass: frame levels only, one window in memory at a time
+            levels = []
+            total_samples = 0
+            for _, audio, _ in self._iter_audio_windows(self._decoded_source(), window_s, 0.0):
+                levels.append(frame_levels_db(audio, frame_samples))
+                total_samples += len(audio)
+            total_s = total_samples / SAMPLE_RATE
+            
+            regions = detect_speech_regions(
+                np.concatenate(levels) if levels else np.zeros(0),
+                frame_s,
+                margin_db=vad_config.get("margin_db", 12.0),
+                min_threshold_db=vad_config.get("min_threshold_db", -50.0),
+                min_speech_s=vad_config.get("min_speech_s", 0.25),
+                min_silence_s=vad_config.get("min_silence_s", 0.5),
+                pad_s=vad_config.get("pad_s", 0.2),
+                total_s=total_s
+            )
+            
+            # Second pass: write the speech regions back to back
+            write_float_wav(speech_path, self._iter_region_samples(regions, window_s))
+            
+            report = vad_report(regions, total_s)
+            logger.info(f"VAD kept {report['speech_duration']:.1f}s of {total_s:.1f}s "
+                        f"({report['skipped_ratio'] * 100:.0f}% skipped)")
+            with open(output_path, 'w') as f:
+                json.dump(dict(report, speech_regions=[[round(start, 3), round(end, 3)]
+                                                       for start, end in regions]), f, indent=2)
+            
+            self._stage_results()["vad"] = report
+            self._stage_results()["output_files"]["vad"] = output_path
+            return True
+            
+        except Exception as e:
+            logger.error(f"VAD failed: {str(e)}")
+            raise
+    
+    def _iter_region_samples(self, regions: List[Tuple[float, float]], window_s: float):
+        """Yield the samples of each speech region, decoding window by window"""
+        bounds = [(int(round(start * SAMPLE_RATE)), int(round(end * SAMPLE_RATE))) for start, end in regions]
+        index = 0
+        for offset, audio, _ in self._iter_audio_windows(self._decoded_source(), window_s, 0.0):
+            window_start = int(round(offset * SAMPLE_RATE))
+            window_end = window_start + len(audio)
+            while index < len(bounds) and bounds[index][0] < window_end:
+                start, end = bounds[index]
+                piece_start, piece_end = max(start, window_start), min(end, window_end)
+                if piece_end > piece_start:
+                    yield audio[piece_start - window_start:piece_end - window_start]
+                if end > window_end:
+                    break
+                index += 1
+    
+    def _speech_timeline(self) -> Optional[TimelineMap]:
+        """Timeline map of the VAD speech regions, or None when VAD is not in use"""
+        if not self.config.get("vad", {}).get("enabled", False):
+            return None
+        vad_path = self.config["intermediate_files"]["vad"]
+        if not (self._file_exists(vad_path) and self._file_exists(self.config["intermediate_files"]["speech_audio"])):
+            return None
+        with open(vad_path, 'r') as f:
+            regions = json.load(f)["speech_regions"]
+        if not regions:
+            logger.warning("VAD found no speech, using the full recording")
+            return None
+        return TimelineMap(regions)
+    
+    def _decoded_source(self) -> str:
+        """The decoded 16 kHz PCM file if run_decode produced it, else the upload"""
+        pcm_path = self.config["intermediate_files"]["pcm"]
+        if self.config.get("decode", {}).get("enabled", True) and self._file_exists(pcm_path):
+            return pcm_path
+        return self.config["audio_path"]
+    
+    def _audio_source(self, timeline: Optional[TimelineMap]) -> str:
+        """Audio the models should read: the speech-only file when VAD ran"""
+        if timeline is not None:
+            return self.config["intermediate_files"]["speech_audio"]
+        return self._decoded_source()
+    
+    def _is_pcm_file(self, path: str) -> bool:
+        """Whether path is one of the float32 WAV files this pipeline wrote"""
+        return path in (self.config["intermediate_files"]["pcm"],
+                        self.config["intermediate_files"]["speech_audio"])
+    
+    def _iter_audio_windows(self, source: str, window_s: float, overlap_s: float):
+        """Windows of mapped PCM when the audio is decoded, else streamed from ffmpeg"""
+        if self._is_pcm_file(source):
+            return iter_array_windows(load_pcm(source), window_s, overlap_s)
+        return iter_pcm_windows(source, window_s, overlap_s)
+    
+    def run_decode(self) -> bool:
+        """Decode the upload once to 16 kHz mono float32 for all audio stages"""
+        output_path = self.config["intermediate_files"]["pcm"]
+        
+        # Skip if file exists and force_rerun is False
+        if self._file_exists(output_path) and not self.force_rerun:
+            logger.info(f"Decoded audio already exists at {output_path}")
+            self._stage_results()["audio"] = {"duration": len(load_pcm(output_path)) / SAMPLE_RATE,
+                                     "sample_rate": SAMPLE_RATE}
+            return True
+        
+        try:
+            num_samples = decode_to_wav(self.config["audio_path"], output_path)
+            self._stage_results()["audio"] = {"duration": num_samples / SAMPLE_RATE, "sample_rate": SAMPLE_RATE}
+            self._stage_results()["output_files"]["pcm"] = output_path
+            return True
+            
+        except Exception as e:
+            logger.error(f"Decoding failed: {str(e)}")
+            raise
     
     def run_diarization(self) -> bool:
         """Run speech diarization using SpeechBrain"""
         output_path = self.config["intermediate_files"]["diarization"]
+        columnar = self._columnar()
         
-        # Skip if file exists and force_rerun is False
-        if self._file_exists(output_path) and not self.force_rerun:
-            logger.info(f"Diarization output already exists at {output_path}")
+        # Skip if output exists and force_rerun is False
+        done = self._segments().has("speaker", "start", "end") if columnar else self._file_exists(output_path)
+        if done and not self.force_rerun:
+            logger.info("Diarization output already exists")
             return True
         
         try:
-            # Import here to avoid loading models if not needed
-            from speechbrain.pretrained import SpeakerDiarization
-
-            # Initialize the speaker diarization model
-            diarization_model = SpeakerDiarization.from_hparams(
-                source="speechbrain/speaker-diarization-3x-ECAPA-TDNN",
-                savedir="pretrained_models/speaker-diarization-3x-ECAPA-TDNN"
-            )
+            # Get the shared speaker diarization model
+            diarization_model = get_diarization_model(self.config)
             
-            # Process the audio file
-            diarization = diarization_model.diarize_file(self.config["audio_path"])
+            # Process the audio file (speech regions only when VAD ran)
+            timeline = self._speech_timeline()
+            if timeline is not None:
+                self._add_stage_metrics(audio_duration=timeline.speech_duration)
+            diarization = diarization_model.diarize_file(self._audio_source(timeline))
             
-            # Format results
+            # Format results, mapping times back to the original recording
             result = []
             for segment, speaker in zip(diarization["segments"], diarization["labels"]):
-                result.append({
-                    "speaker": f"SPEAKER_{speaker}",
-                    "start": float(segment[0]),
-                    "end": float(segment[1])
-                })
+                if timeline is not None:
+                    pieces = timeline.map_interval(float(segment[0]), float(segment[1]))
+                else:
+                    pieces = [(float(segment[0]), float(segment[1]))]
+                for start, end in pieces:
+                    result.append({
+                        "speaker": f"SPEAKER_{speaker}",
+                        "start": start,
+                        "end": end
+                    })
             
             # Save the diarization results
-            with open(output_path, 'w') as f:
-                json.dump(result, f, indent=2)
+            if columnar:
+                segments = self._segments()
+                segments.write_category("speaker", [turn["speaker"] for turn in result])
+                segments.write_numeric("start", [turn["start"] for turn in result])
+                segments.write_numeric("end", [turn["end"] for turn in result])
+                output_path = segments.path
+            else:
+                with open(output_path, 'w') as f:
+                    json.dump(result, f, indent=2)
             
-            self.results["output_files"]["diarization"] = output_path
+            self._stage_results()["output_files"]["diarization"] = output_path
             return True
             
         except Exception as e:
@@ -128,79 +773,158 @@ class AudioPipeline:
             return True
         
         try:
-            # Import here to avoid loading models if not needed
-            import whisper
+            whisper_config = self.config.get("whisper", {})
             
-            # Load the Whisper model
-            model = whisper.load_model("base", download_root=os.path.dirname(self.config["model_paths"]["whisper"]))
+            # Get the shared Whisper model
+            model = get_whisper_model(self.config, whisper_config.get("model", "base"))
             
-            # Transcribe the audio
-            result = model.transcribe(self.config["audio_path"])
+            # Transcribe the audio (speech regions only when VAD ran),
+            # keeping word timestamps for alignment
+            timeline = self._speech_timeline()
+            audio_source = self._audio_source(timeline)
+            if timeline is not None:
+                self._add_stage_metrics(audio_duration=timeline.speech_duration)
+            if whisper_config.get("streaming", False):
+                result = self._transcribe_streaming(model, whisper_config, audio_source, timeline)
+            else:
+                result = model.transcribe(
+                    load_pcm(audio_source) if self._is_pcm_file(audio_source) else audio_source,
+                    word_timestamps=whisper_config.get("word_timestamps", True),
+                    **whisper_decode_options(whisper_config)
+                )
             
             # Save the transcript
             with open(output_path, 'w') as f:
                 f.write(result["text"])
             
-            self.results["output_files"]["transcript"] = output_path
+            # Save segment and word timestamps in compact form
+            timing_path = self.config["intermediate_files"]["transcript_timing"]
+            timing = compact_whisper_result(result)
+            if timeline is not None:
+                timing["segments"] = timeline.remap_triples(timing["segments"])
+                timing["words"] = timeline.remap_triples(timing["words"])
+            with open(timing_path, 'w') as f:
+                json.dump(timing, f, separators=(',', ':'))
+            
+            self._stage_results()["output_files"]["transcript"] = output_path
+            self._stage_results()["output_files"]["transcript_timing"] = timing_path
             return True
             
         except Exception as e:
             logger.error(f"Whisper transcription failed: {str(e)}")
             raise
     
+    def _transcribe_streaming(self, model, whisper_config: Dict[str, Any], audio_source: str,
+                              timeline: Optional[TimelineMap] = None) -> Dict[str, Any]:
+        """
+        Transcribe the audio window by window so memory stays constant
+        whatever the call length.
+        
+        Windows overlap by overlap_s seconds; each window keeps the words whose
+        midpoint falls in its half of the overlaps, so the stitched transcript
+        has no duplicated or dropped words at the seams. The tail of the text
+        so far is passed as the prompt for the next window.
+        """
+        window_s = whisper_config.get("window_s", 30.0)
+        overlap_s = whisper_config.get("overlap_s", 2.0)
+        segments = []
+        window_report = []
+        prompt = None
+        
+        for offset, audio, is_last in self._iter_audio_windows(audio_source, window_s, overlap_s):
+            start_time = time.time()
+            result = model.transcribe(audio, word_timestamps=True, initial_prompt=prompt,
+                                      **whisper_decode_options(whisper_config))
+            processing_time = time.time() - start_time
+            duration = len(audio) / float(SAMPLE_RATE)
+            
+            # The part of the timeline this window is responsible for
+            own_start = offset + overlap_s / 2 if offset > 0 else 0.0
+            own_end = float("inf") if is_last else offset + window_s - overlap_s / 2
+            
+            window_segments = []
+            for segment in result["segments"]:
+                words = [dict(word, start=word["start"] + offset, end=word["end"] + offset)
+                         for word in segment.get("words", [])]
+                words = [word for word in words
+                         if own_start <= (word["start"] + word["end"]) / 2 < own_end]
+                if not words:
+                    continue
+                window_segments.append({
+                    "start": words[0]["start"],
+                    "end": words[-1]["end"],
+                    "text": "".join(word["word"] for word in words).strip(),
+                    "words": words
+                })
+            segments.extend(window_segments)
+            
+            window_text = " ".join(segment["text"] for segment in window_segments)
+            if window_text:
+                prompt = (prompt + " " + window_text if prompt else window_text)[-200:]
+            window_report.append({
+                "offset": offset,
+                "duration": duration,
+                "processing_time": processing_time,
+                "rtf": processing_time / duration if duration > 0 else None
+            })
+            logger.info(f"Transcribed window at {offset:.1f}s ({duration:.1f}s) "
+                        f"with RTF {window_report[-1]['rtf'] or 0:.2f}")
+            to_original = timeline.to_original if timeline is not None else float
+            self._notify("partial_transcript", stage="run_whisper", start=to_original(own_start),
+                         end=to_original(offset + duration), text=window_text)
+        
+        self._stage_results()["whisper_windows"] = window_report
+        return {
+            "text": " ".join(segment["text"] for segment in segments),
+            "segments": segments
+        }
+    
     def run_alignment(self) -> bool:
         """Run alignment between diarization and transcript"""
-        diarization_path = self.config["intermediate_files"]["diarization"]
         transcript_path = self.config["intermediate_files"]["transcript"]
         aligned_output = self.config["intermediate_files"]["aligned"]
         formatted_output = os.path.join(self.config["output_dir"], "formatted_transcript.txt")
         indicbert_output = self.config["intermediate_files"]["indicbert_input"]
         
+        columnar = self._columnar()
+        
         # Skip if files exist and force_rerun is False
-        if (self._file_exists(aligned_output) and 
-            self._file_exists(formatted_output) and 
-            self._file_exists(indicbert_output) and 
-            not self.force_rerun):
+        if columnar:
+            done = self._segments().has("text") and self._file_exists(formatted_output)
+        else:
+            done = (self._file_exists(aligned_output) and
+                    self._file_exists(formatted_output) and
+                    self._file_exists(indicbert_output))
+        if done and not self.force_rerun:
             logger.info(f"Alignment outputs already exist")
             return True
         
         try:
             # Load diarization results
-            with open(diarization_path, 'r') as f:
-                diarization_data = json.load(f)
+            diarization_data = self._load_segments("diarization")
             
-            # Load transcript
-            with open(transcript_path, 'r') as f:
-                transcript_text = f.read().strip()
-            
-            # Simple alignment algorithm
-            # In a real implementation, you would need a more sophisticated 
-            # algorithm that aligns the transcript with the speaker segments
-            
-            # Placeholder for a proper alignment algorithm
-            # This is a simplified version - replace with your actual alignment logic
-            words = transcript_text.split()
-            total_duration = diarization_data[-1]["end"]
-            words_per_second = len(words) / total_duration
+            timing_path = self.config["intermediate_files"]["transcript_timing"]
+            if self._file_exists(timing_path):
+                # Give each word to the speaker turn it overlaps most
+                with open(timing_path, 'r') as f:
+                    timing = json.load(f)
+                turn_words = assign_words_to_turns(timing["words"], diarization_data)
+            else:
+                # Older transcripts have no word timestamps; spread words by speaking rate
+                logger.warning("No word timestamps found, aligning by average speaking rate")
+                with open(transcript_path, 'r') as f:
+                    transcript_text = f.read().strip()
+                turn_words = assign_words_by_rate(transcript_text, diarization_data)
             
             aligned_transcript = []
             formatted_lines = []
             indicbert_input = []
             
-            for segment in diarization_data:
+            for segment, segment_words in zip(diarization_data, turn_words):
                 speaker = segment["speaker"]
                 start = segment["start"]
                 end = segment["end"]
-                duration = end - start
-                
-                # Estimate words in this segment
-                word_count = int(duration * words_per_second)
-                if words:
-                    segment_words = words[:word_count]
-                    words = words[word_count:]  # Remove used words
-                    segment_text = " ".join(segment_words)
-                else:
-                    segment_text = ""
+                segment_text = " ".join(segment_words)
                 
                 aligned_transcript.append({
                     "speaker": speaker,
@@ -217,21 +941,26 @@ class AudioPipeline:
                     "text": segment_text
                 })
             
-            # Save aligned transcript
-            with open(aligned_output, 'w') as f:
-                json.dump(aligned_transcript, f, indent=2)
+            if columnar:
+                # Speakers and times are already stored; only the text is new
+                self._segments().write_text("text", [segment["text"] for segment in aligned_transcript])
+                aligned_output = indicbert_output = self._segments().path
+            else:
+                # Save aligned transcript
+                with open(aligned_output, 'w') as f:
+                    json.dump(aligned_transcript, f, indent=2)
+                
+                # Save IndicBERT input
+                with open(indicbert_output, 'w') as f:
+                    json.dump(indicbert_input, f, indent=2)
             
             # Save formatted transcript
             with open(formatted_output, 'w') as f:
                 f.write("\n".join(formatted_lines))
             
-            # Save IndicBERT input
-            with open(indicbert_output, 'w') as f:
-                json.dump(indicbert_input, f, indent=2)
-            
-            self.results["output_files"]["aligned"] = aligned_output
-            self.results["output_files"]["formatted"] = formatted_output
-            self.results["output_files"]["indicbert_input"] = indicbert_output
+            self._stage_results()["output_files"]["aligned"] = aligned_output
+            self._stage_results()["output_files"]["formatted"] = formatted_output
+            self._stage_results()["output_files"]["indicbert_input"] = indicbert_output
             return True
             
         except Exception as e:
@@ -240,84 +969,194 @@ class AudioPipeline:
     
     def run_sentiment_analysis(self) -> bool:
         """Run IndicBERT sentiment analysis"""
-        input_path = self.config["intermediate_files"]["indicbert_input"]
         output_path = os.path.join(self.config["output_dir"], "sentiment_results.json")
+        columnar = self._columnar()
         
-        # Skip if file exists and force_rerun is False
-        if self._file_exists(output_path) and not self.force_rerun:
-            logger.info(f"Sentiment analysis output already exists at {output_path}")
+        # Skip if output exists and force_rerun is False
+        done = self._segments().has("sentiment", "sentiment_score") if columnar else self._file_exists(output_path)
+        if done and not self.force_rerun:
+            logger.info("Sentiment analysis output already exists")
             return True
         
         try:
-            # Import here to avoid loading models if not needed
-            from transformers import AutoTokenizer, AutoModelForSequenceClassification
-            import torch
-            
-            # Load IndicBERT model and tokenizer
-            tokenizer = AutoTokenizer.from_pretrained(
-                self.config["model_paths"]["indicbert_tokenizer"]
-            )
-            model = AutoModelForSequenceClassification.from_pretrained(
-                self.config["model_paths"]["indicbert_model"]
-            )
+            # Get the shared IndicBERT model and tokenizer
+            tokenizer, model = get_indicbert(self.config)
             
             # Load input data
-            with open(input_path, 'r') as f:
-                input_data = json.load(f)
+            input_data = self._load_segments("indicbert_input")
+            
+            sentiment_config = self.config.get("sentiment", {})
+            max_length = sentiment_config.get("max_length", 512)
             
+            server_config = self.config.get("batching_server", {})
+            if server_config.get("enabled", False):
+                # Share batches with other jobs running in this process
+                batch_config = server_config.get("sentiment", {})
+                max_batch_size = batch_config.get("max_batch_size", 64)
+                batcher = get_batcher(
+                    ("sentiment", self.config["model_paths"]["indicbert_model"],
+                     backend_for(self.config, "indicbert"), max_length),
+                    lambda: partial(_score_with_registry_model, self.config,
+                                    batch_size=max_batch_size, max_length=max_length),
+                    max_batch_size=max_batch_size,
+                    max_wait_ms=batch_config.get("max_wait_ms", 20)
+                )
+                score_texts = batcher.infer
+            else:
+                # Token counts are only known when batches are not shared
+                token_stats = {}
+                score_texts = partial(score_sentiment_batched, tokenizer, model,
+                                      batch_size=sentiment_config.get("batch_size", 32),
+                                      max_length=max_length, stats=token_stats)
+            
+            # Segments are scored a group at a time so each group's results can
+            # be streamed as soon as they exist
+            group_size = sentiment_config.get("stream_group_size") or len(input_data) or 1
             sentiment_results = []
-            for item in input_data:
-                # Skip empty text
-                if not item["text"].strip():
+            for group_start in range(0, len(input_data), group_size):
+                group = input_data[group_start:group_start + group_size]
+                # Empty segments are neutral and never take a batch slot
+                texts = [item["text"] for item in group if item["text"].strip()]
+                scores = iter(score_texts(texts) if texts else [])
+                
+                for item in group:
+                    if not item["text"].strip():
+                        sentiment_score = 0.5
+                        sentiment = "neutral"
+                    else:
+                        sentiment_score = next(scores)
+                        sentiment = sentiment_label(sentiment_score)
+                    
                     sentiment_results.append({
                         "speaker": item["speaker"],
                         "timestamp": item["timestamp"],
                         "text": item["text"],
-                        "sentiment": "neutral",
-                        "sentiment_score": 0.5
+                        "sentiment": sentiment,
+                        "sentiment_score": sentiment_score
                     })
-                    continue
-                
-                # Tokenize and get sentiment
-                inputs = tokenizer(item["text"], return_tensors="pt", truncation=True, max_length=512)
-                with torch.no_grad():
-                    outputs = model(**inputs)
-                
-                # Process outputs
-                scores = torch.nn.functional.softmax(outputs.logits, dim=1)
-                sentiment_score = float(scores[0][1].item())  # Assuming binary classification
-                
-                # Map score to sentiment label
-                if sentiment_score > 0.7:
-                    sentiment = "positive"
-                elif sentiment_score < 0.3:
-                    sentiment = "negative"
-                else:
-                    sentiment = "neutral"
-                
-                sentiment_results.append({
-                    "speaker": item["speaker"],
-                    "timestamp": item["timestamp"],
-                    "text": item["text"],
-                    "sentiment": sentiment,
-                    "sentiment_score": sentiment_score
-                })
+                    self._notify("segment_sentiment", stage="run_sentiment_analysis",
+                                 index=len(sentiment_results) - 1, **sentiment_results[-1])
+            
+            if not server_config.get("enabled", False):
+                self._add_stage_metrics(**token_stats)
             
             # Save sentiment results
-            with open(output_path, 'w') as f:
-                json.dump(sentiment_results, f, indent=2)
+            if columnar:
+                segments = self._segments()
+                segments.write_category("sentiment", [item["sentiment"] for item in sentiment_results])
+                segments.write_numeric("sentiment_score", [item["sentiment_score"] for item in sentiment_results])
+                output_path = segments.path
+            else:
+                with open(output_path, 'w') as f:
+                    json.dump(sentiment_results, f, indent=2)
             
-            self.results["output_files"]["sentiment"] = output_path
+            self._stage_results()["output_files"]["sentiment"] = output_path
             return True
             
         except Exception as e:
             logger.error(f"Sentiment analysis failed: {str(e)}")
             raise
     
+    def _summarize_chunks(self, tokenizer, model, chunks: List[str], max_input_tokens: int,
+                          max_length: int, num_beams: int) -> List[str]:
+        """Summarize prefixed chunks, one summary per chunk"""
+        summary_config = self.config.get("summarization", {})
+        server_config = self.config.get("batching_server", {})
+        if server_config.get("enabled", False):
+            # Share generate() batches with other jobs running in this process
+            batch_config = server_config.get("summarization", {})
+            batcher = get_batcher(
+                ("summarization", self.config["model_paths"]["t5_model"], backend_for(self.config, "t5"),
+                 max_input_tokens, max_length, num_beams),
+                lambda: partial(_summarize_with_registry_model, self.config, max_input_length=max_input_tokens,
+                                max_length=max_length, num_beams=num_beams),
+                max_batch_size=batch_config.get("max_batch_size", 8),
+                max_wait_ms=batch_config.get("max_wait_ms", 50)
+            )
+            return batcher.infer(chunks)
+        
+        # All chunks go through generate() as padded batches
+        batch_size = summary_config.get("batch_size") or len(chunks) or 1
+        summary_parts = []
+        token_stats = {}
+        for batch_start in range(0, len(chunks), batch_size):
+            summary_parts.extend(generate_summaries(
+                tokenizer, model, chunks[batch_start:batch_start + batch_size],
+                max_input_length=max_input_tokens, max_length=max_length, num_beams=num_beams,
+                stats=token_stats
+            ))
+        self._add_stage_metrics(**token_stats)
+        return summary_parts
+    
+    def _summarize_hierarchical(self, tokenizer, model, transcript: str, summary_config: Dict[str, Any]) -> str:
+        """
+        Map-reduce summarization: summarize all chunks of the text, join the
+        summaries and repeat on the result until it fits target_tokens (or
+        max_levels is reached). Each level has its own beam and length budget.
+        """
+        max_input_tokens = summary_config.get("max_input_tokens", 512)
+        target_tokens = summary_config.get("target_tokens", 200)
+        max_levels = summary_config.get("max_levels", 4)
+        level_budgets = summary_config.get("levels") or [{}]
+        
+        def count_tokens(text):
+            return len(tokenizer(text, add_special_tokens=False)["input_ids"])
+        
+        text = transcript
+        input_tokens = count_tokens(text)
+        level_report = []
+        for level in range(max_levels):
+            budget = level_budgets[min(level, len(level_budgets) - 1)]
+            max_length = budget.get("max_length", summary_config.get("max_length", 150))
+            num_beams = budget.get("num_beams", summary_config.get("num_beams", 4))
+            
+            start_time = time.time()
+            chunks = chunk_for_summarization(
+                tokenizer, text,
+                max_tokens=max_input_tokens,
+                overlap_tokens=budget.get("overlap_tokens", summary_config.get("overlap_tokens", 32))
+            )
+            if not chunks:
+                break
+            # The last level only needs to fit the target length
+            if len(chunks) == 1:
+                max_length = min(max_length, target_tokens)
+            summaries = self._summarize_chunks(tokenizer, model, chunks, max_input_tokens, max_length, num_beams)
+            text = " ".join(summaries)
+            output_tokens = count_tokens(text)
+            
+            level_report.append({
+                "level": level,
+                "chunks": len(chunks),
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "num_beams": num_beams,
+                "max_length": max_length,
+                "duration": time.time() - start_time
+            })
+            logger.info(f"Summarization level {level}: {len(chunks)} chunks, "
+                        f"{input_tokens} -> {output_tokens} tokens")
+            
+            # Stop once it fits, or when another pass would not shrink it
+            if len(chunks) == 1 or output_tokens <= target_tokens or output_tokens >= input_tokens:
+                break
+            input_tokens = output_tokens
+        
+        self._stage_results()["summarization_levels"] = level_report
+        return text
+    
     def run_summarization(self) -> bool:
         """Run T5 summarization"""
-        input_path = self.config["intermediate_files"]["transcript"]
+        summary_config = self.config.get("summarization", {})
+        if summary_config.get("input") == "formatted":
+            # Speaker-labelled lines give the chunker speaker-turn boundaries
+            input_path = os.path.join(self.config["output_dir"], "formatted_transcript.txt")
+        else:
+            input_path = self.config["intermediate_files"]["transcript"]
         output_path = self.config["intermediate_files"]["summary"]
+        max_input_tokens = summary_config.get("max_input_tokens", 512)
+        max_length = summary_config.get("max_length", 150)
+        num_beams = summary_config.get("num_beams", 4)
         
         # Skip if file exists and force_rerun is False
         if self._file_exists(output_path) and not self.force_rerun:
@@ -325,103 +1164,201 @@ class AudioPipeline:
             return True
         
         try:
-            # Import here to avoid loading models if not needed
-            from transformers import T5ForConditionalGeneration, T5Tokenizer
-            
-            # Load T5 model and tokenizer
-            model = T5ForConditionalGeneration.from_pretrained(self.config["model_paths"]["t5_model"])
-            tokenizer = T5Tokenizer.from_pretrained("t5-base")
+            # Get the shared T5 model and tokenizer
+            tokenizer, model = get_t5(self.config)
             
             # Load transcript
             with open(input_path, 'r') as f:
                 transcript = f.read().strip()
             
-            # Prepare input
-            # T5 requires a specific prefix for summarization
-            input_text = "summarize: " + transcript
-            
-            # Handle long transcripts by chunking
-            max_token_length = 512
-            chunks = []
-            current_chunk = []
-            current_length = 0
-            
-            for word in input_text.split():
-                tokens = tokenizer.tokenize(word)
-                if current_length + len(tokens) > max_token_length:
-                    chunks.append(' '.join(current_chunk))
-                    current_chunk = [word]
-                    current_length = len(tokens)
-                else:
-                    current_chunk.append(word)
-                    current_length += len(tokens)
-            
-            if current_chunk:
-                chunks.append(' '.join(current_chunk))
-            
-            # Process each chunk
-            summary_parts = []
-            
-            for chunk in chunks:
-                inputs = tokenizer(chunk, return_tensors="pt", max_length=max_token_length, truncation=True)
-                
-                # Generate summary for this chunk
-                with torch.no_grad():
-                    output = model.generate(
-                        inputs.input_ids,
-                        max_length=150,
-                        num_beams=4,
-                        early_stopping=True
-                    )
+            if summary_config.get("mode", "concat") == "hierarchical":
+                final_summary = self._summarize_hierarchical(tokenizer, model, transcript, summary_config)
+            else:
+                # Split into chunks that fit T5's input, each with the task prefix
+                chunks = chunk_for_summarization(
+                    tokenizer, transcript,
+                    max_tokens=max_input_tokens,
+                    overlap_tokens=summary_config.get("overlap_tokens", 32)
+                )
+                summary_parts = self._summarize_chunks(tokenizer, model, chunks, max_input_tokens,
+                                                       max_length, num_beams)
                 
-                # Decode summary
-                summary = tokenizer.decode(output[0], skip_special_tokens=True)
-                summary_parts.append(summary)
-            
-            # Combine summaries
-            final_summary = " ".join(summary_parts)
+                # Combine summaries
+                final_summary = " ".join(summary_parts)
             
             # Save summary
             with open(output_path, 'w') as f:
                 f.write(final_summary)
             
-            self.results["output_files"]["summary"] = output_path
+            self._stage_results()["output_files"]["summary"] = output_path
             return True
             
         except Exception as e:
             logger.error(f"Summarization failed: {str(e)}")
             raise
     
+    def _job_id(self) -> str:
+        """The job ID set by make_job_config, else the output directory's name"""
+        return self.config.get("job_id") or os.path.basename(os.path.normpath(self.config["output_dir"]))
+    
+    def _speaker_embedding(self, encoder, pieces: List[np.ndarray]) -> np.ndarray:
+        """Duration-weighted mean of the ECAPA embeddings of one speaker's turns"""
+        lengths = [len(piece) for piece in pieces]
+        batch = np.zeros((len(pieces), max(lengths)), dtype=np.float32)
+        for row, piece in enumerate(pieces):
+            batch[row, :len(piece)] = piece
+        with torch.no_grad():
+            embeddings = encoder.encode_batch(torch.from_numpy(batch),
+                                              torch.tensor(lengths, dtype=torch.float32) / max(lengths))
+        embeddings = normalize(embeddings.reshape(len(pieces), -1).cpu().numpy())
+        return normalize(np.average(embeddings, axis=0, weights=lengths))
+    
+    def run_speaker_index(self) -> bool:
+        """Embed each diarized speaker and match it against the speakers of earlier calls"""
+        index_config = self.config.get("speaker_index", {})
+        embeddings_path = self.config["intermediate_files"]["speaker_embeddings"]
+        output_path = os.path.join(self.config["output_dir"], "speaker_matches.json")
+        
+        # Skip if output exists and force_rerun is False
+        if self._file_exists(output_path) and not self.force_rerun:
+            logger.info(f"Speaker matches already exist at {output_path}")
+            with open(output_path, 'r') as f:
+                self._stage_results()["speakers"] = json.load(f)
+            return True
+        
+        try:
+            # The diarizer does not expose its embeddings, so the ECAPA encoder
+            # embeds each speaker's longest turns
+            encoder = get_speaker_encoder(self.config)
+            turns = self._load_segments("diarization")
+            audio_source = self._decoded_source()
+            audio = load_pcm(audio_source) if self._is_pcm_file(audio_source) else None
+            if audio is None:
+                audio = np.concatenate([window for _, window, _ in iter_pcm_windows(audio_source, 600.0, 0.0)])
+            samples = speaker_turn_samples(audio, turns, SAMPLE_RATE,
+                                           min_turn_s=index_config.get("min_turn_s", 1.0),
+                                           max_turn_s=index_config.get("max_turn_s", 10.0),
+                                           max_speech_s=index_config.get("max_speech_s", 60.0))
+            
+            labels, embeddings, speakers = [], [], {}
+            min_speech_s = index_config.get("min_speech_s", 3.0)
+            for label, pieces in sorted(samples.items()):
+                speech_s = sum(len(piece) for piece in pieces) / SAMPLE_RATE
+                if speech_s < min_speech_s:
+                    # Too little speech for a reliable voiceprint
+                    logger.info(f"Not indexing {label}: {speech_s:.1f}s of speech")
+                    continue
+                labels.append(label)
+                embeddings.append(self._speaker_embedding(encoder, pieces))
+                speakers[label] = (embeddings[-1], speech_s)
+            self._add_stage_metrics(speakers=len(speakers))
+            
+            # Keep the centroids with the job (not part of the JSON results)
+            np.savez(embeddings_path, labels=np.array(labels),
+                     embeddings=np.stack(embeddings) if embeddings else np.zeros((0, 0), dtype=np.float32))
+            
+            matches = get_speaker_index(self.config).register(self._job_id(), speakers)
+            with open(output_path, 'w') as f:
+                json.dump(matches, f, indent=2)
+            
+            self._stage_results()["speakers"] = matches
+            self._stage_results()["output_files"]["speakers"] = output_path
+            return True
+            
+        except Exception as e:
+            logger.error(f"Speaker indexing failed: {str(e)}")
+            raise
+    
+    def run_search_index(self) -> bool:
+        """Index the aligned segments, with sentiment and speaker identities when available, for search"""
+        sentiment_path = os.path.join(self.config["output_dir"], "sentiment_results.json")
+        speakers_path = os.path.join(self.config["output_dir"], "speaker_matches.json")
+        
+        try:
+            aligned = self._load_segments("aligned")
+            if self._columnar():
+                has_sentiment = self._segments().has("sentiment", "sentiment_score")
+            else:
+                has_sentiment = self._file_exists(sentiment_path)
+            sentiments = self._load_segments("sentiment") if has_sentiment else None
+            speakers = None
+            if self._file_exists(speakers_path):
+                with open(speakers_path, 'r') as f:
+                    speakers = json.load(f)
+            
+            # Replaces the segments indexed by an earlier run of this job
+            job_id = self._job_id()
+            count = get_transcript_index(self.config).add_job(
+                job_id, segment_rows(job_id, aligned, sentiments, speakers),
+                audio_path=self.config["audio_path"],
+                quality_tier=(self.config.get("quality_tier") or {}).get("name")
+            )
+            self._stage_results()["search_index"] = {"segments": count, "sentiment": sentiments is not None}
+            return True
+            
+        except Exception as e:
+            logger.error(f"Search indexing failed: {str(e)}")
+            raise
+    
+    def _active_stages(self) -> List[Dict[str, Any]]:
+        """Stages turned on by the config, with references to disabled stages removed"""
+        stages = [stage for stage in PIPELINE_STAGES
+                  if not stage.get("enabled_by")
+                  or self.config.get(stage["enabled_by"], {}).get("enabled", False)]
+        names = {stage["name"] for stage in stages}
+        return [dict(stage,
+                     depends_on=[dep for dep in stage.get("depends_on", []) if dep in names],
+                     after=[dep for dep in stage.get("after", []) if dep in names])
+                for stage in stages]
+    
+    def _make_scheduler(self, stages: List[Dict[str, Any]]) -> StageScheduler:
+        """Build the stage scheduler from the parallelism config"""
+        parallel_config = self.config.get("parallelism", {})
+        enabled = parallel_config.get("enabled", True)
+        return StageScheduler(
+            stages,
+            max_workers=parallel_config.get("max_workers", 2) if enabled else 1,
+            executor=parallel_config.get("executor", "thread"),
+            torch_threads=parallel_config.get("torch_threads")
+        )
+    
     def run_pipeline(self) -> Dict[str, Any]:
         """Run the complete pipeline"""
         try:
-            # Step 1: Run independent processes (can be parallelized in the future)
-            diarization_success = self.run_with_progress("run_diarization")
-            transcription_success = self.run_with_progress("run_whisper")
-            
-            # Check if both succeeded before alignment
-            if not (diarization_success and transcription_success):
-                logger.error("Error: Diarization or transcription failed")
-                self.results["pipeline_status"] = "failed"
-                return self.results
+            stages = self._active_stages()
+            scheduler = self._make_scheduler(stages)
+            if scheduler.executor == "process":
+                run_stage = partial(_run_stage_in_process, self.config, self.force_rerun)
+            else:
+                run_stage = self._execute_stage
             
-            # Step 2: Alignment (depends on step 1)
-            alignment_success = self.run_with_progress("run_alignment")
-            if not alignment_success:
-                logger.error("Error: Alignment failed")
-                self.results["pipeline_status"] = "failed"
-                return self.results
+            outcomes = scheduler.run(run_stage, should_stop=self.cancel_check,
+                                     on_complete=self._merge_stage_results)
             
-            # Step 3: Run parallel processes (sentiment and summarization)
-            sentiment_success = self.run_with_progress("run_sentiment_analysis")
-            summary_success = self.run_with_progress("run_summarization")
+            # Record outcomes in stage order, whatever order they finished in
+            for stage in stages:
+                self._record_outcome(stage["name"], outcomes[stage["name"]])
             
             # Final status
-            if sentiment_success and summary_success:
-                self.results["pipeline_status"] = "completed"
-            else:
+            required_failed = [stage["name"] for stage in stages
+                               if stage["required"] and not outcomes[stage["name"]]["success"]]
+            optional_failed = [stage["name"] for stage in stages
+                               if not stage["required"] and not outcomes[stage["name"]]["success"]]
+            
+            if any(outcome.get("cancelled") for outcome in outcomes.values()):
+                logger.info("Pipeline cancelled")
+                self.results["pipeline_status"] = "cancelled"
+            elif required_failed:
+                logger.error(f"Error: {', '.join(required_failed)} failed")
+                self.results["pipeline_status"] = "failed"
+            elif optional_failed:
                 self.results["pipeline_status"] = "partially_completed"
+            else:
+                self.results["pipeline_status"] = "completed"
             
+            self.save_results()
+            if self.results["pipeline_status"] in ("completed", "partially_completed"):
+                self.save_combined_results()
             return self.results
             
         except Exception as e:
@@ -430,6 +1367,27 @@ class AudioPipeline:
             self.results["errors"].append(str(e))
             return self.results
     
+    def save_results(self) -> str:
+        """Write the pipeline results to pipeline_results.json in the output dir"""
+        output_path = os.path.join(self.config["output_dir"], "pipeline_results.json")
+        with open(output_path, 'w') as f:
+            json.dump(self.results, f, indent=2)
+        return output_path
+    
+    def save_combined_results(self) -> str:
+        """
+        Write the pipeline info and every output as one compact JSON file
+        (job_results.json), so the results are never reassembled from the
+        individual outputs again
+        """
+        output_path = os.path.join(self.config["output_dir"], COMBINED_RESULTS_FILE)
+        temp_path = output_path + ".tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.collect_results(), f, separators=(',', ':'))
+        # Readers never see a half-written file
+        os.replace(temp_path, output_path)
+        return output_path
+    
     def collect_results(self) -> Dict[str, Any]:
         """Collect and load all result files"""
         results = {
@@ -439,6 +1397,17 @@ class AudioPipeline:
         
         # Try to load each output file
         for key, path in self.results.get("output_files", {}).items():
+            # Decoded audio is only an intermediate for the other stages
+            if path.endswith(".wav"):
+                continue
+            if os.path.isdir(path) and key in OUTPUT_COLUMNS:
+                # Columnar segments: rebuild the JSON shape of this output
+                try:
+                    results["outputs"][key] = segment_records(SegmentStore(path), key)
+                except Exception as e:
+                    logger.error(f"Could not load {key} from {path}: {str(e)}")
+                    results["outputs"][key] = f"Error loading file: {str(e)}"
+                continue
             if self._file_exists(path):
                 try:
                     if path.endswith(".json"):
@@ -463,18 +1432,269 @@ def get_default_config():
             "whisper": "/home/amit/.cache/whisper/base.pt",
             "indicbert_model": "/home/amit/indicbert_model",
             "indicbert_tokenizer": "/home/amit/indicbert_tokenizer", 
-            "t5_model": "./T5-fine-tuned-modelC"
+            "t5_model": "./T5-fine-tuned-modelC",
+            # torch, torch_int8, onnx or onnx_int8 (see inference_backends)
+            "indicbert_backend": "torch",
+            "t5_backend": "torch"
+        },
+        "inference_backend": {
+            "cache_dir": None,
+            "onnx_threads": None,
+            "onnx_quantization": "avx2",
+            "parity_tolerance": 0.05,
+            "parity_min_similarity": 0.9,
+            "fallback_on_mismatch": True
+        },
+        "model_registry": {
+            "memory_budget_mb": 4096,
+            "warm_up": ["whisper", "diarization", "indicbert", "t5"]
+        },
+        "job_queue": {
+            "enabled": True,
+            "num_workers": 2,
+            "max_queue_depth": 50,
+            "start_method": "spawn",
+            "preload_models": True,
+            "jobs_per_worker": 1
+        },
+        "segment_storage": {
+            "format": "json"
+        },
+        "event_stream": {
+            "history_size": 1000,
+            "max_jobs": 256,
+            "max_pending": 1000,
+            "keepalive_s": 15
+        },
+        "job_results": {
+            "memory_entries": 64,
+            "memory_mb": 256
+        },
+        "job_store": {
+            "backend": "sqlite",
+            "path": None,
+            "busy_timeout_ms": 10000,
+            "ttl_hours": 168,
+            "cleanup_interval_s": 3600
+        },
+        "ingest": {
+            "formats": ["mp3", "webm", "wav"],
+            "max_upload_mb": 500,
+            "min_duration_s": 1.0,
+            "max_duration_s": 14400,
+            "chunk_size": 1048576,
+            "sniff_bytes": 65536,
+            # Decode while the upload arrives, so run_decode finds audio_16k.wav ready
+            "decode_on_upload": True
+        },
+        "decode": {
+            "enabled": True
+        },
+        "vad": {
+            "enabled": False,
+            "frame_ms": 30,
+            "margin_db": 12.0,
+            "min_threshold_db": -50.0,
+            "min_speech_s": 0.25,
+            "min_silence_s": 0.5,
+            "pad_s": 0.2
+        },
+        "whisper": {
+            "model": "base",
+            "word_timestamps": True,
+            # None keeps Whisper's defaults (temperature fallback, greedy decoding)
+            "temperature": None,
+            "beam_size": None,
+            "best_of": None,
+            "streaming": False,
+            "window_s": 30.0,
+            "overlap_s": 2.0
+        },
+        "sentiment": {
+            "enabled": True,
+            "batch_size": 32,
+            "max_length": 512,
+            "stream_group_size": 256
+        },
+        "batching_server": {
+            "enabled": False,
+            "sentiment": {
+                "max_batch_size": 64,
+                "max_wait_ms": 20
+            },
+            "summarization": {
+                "max_batch_size": 8,
+                "max_wait_ms": 50
+            }
+        },
+        "summarization": {
+            "input": "transcript",
+            "max_input_tokens": 512,
+            "overlap_tokens": 32,
+            "max_length": 150,
+            "num_beams": 4,
+            "batch_size": None,
+            "mode": "concat",
+            "target_tokens": 200,
+            "max_levels": 4,
+            "levels": [
+                {"num_beams": 4, "max_length": 150},
+                {"num_beams": 2, "max_length": 200}
+            ]
+        },
+        "quality_tiers": {
+            # None keeps the job config as set, a tier name applies that tier's
+            # overrides to every job, "auto" picks one per job from the queue depth
+            "default": None,
+            "order": ["fast", "balanced", "accurate"],
+            "tiers": {
+                "fast": {
+                    "whisper": {"model": "tiny", "temperature": 0.0, "beam_size": None, "best_of": None},
+                    "summarization": {"num_beams": 1, "max_length": 100,
+                                      "levels": [{"num_beams": 1, "max_length": 100}]},
+                    "sentiment": {"enabled": False}
+                },
+                "balanced": {
+                    "whisper": {"model": "base", "temperature": None, "beam_size": None, "best_of": None},
+                    "summarization": {"num_beams": 4, "max_length": 150,
+                                      "levels": [{"num_beams": 4, "max_length": 150},
+                                                 {"num_beams": 2, "max_length": 200}]},
+                    "sentiment": {"enabled": True}
+                },
+                "accurate": {
+                    "whisper": {"model": "small", "temperature": None, "beam_size": 5, "best_of": 5},
+                    "summarization": {"num_beams": 4, "max_length": 200,
+                                      "levels": [{"num_beams": 4, "max_length": 200}]},
+                    "sentiment": {"enabled": True}
+                }
+            },
+            "auto": {
+                "target_turnaround_s": 600,
+                "ewma_alpha": 0.2,
+                "expected_job_s": {"fast": 30, "balanced": 90, "accurate": 240}
+            }
+        },
+        "speaker_index": {
+            "enabled": False,
+            "path": None,
+            # Cosine similarity at which a speaker is taken to be a known one
+            "match_threshold": 0.7,
+            "min_speech_s": 3.0,
+            "max_speech_s": 60.0,
+            "min_turn_s": 1.0,
+            "max_turn_s": 10.0,
+            # Exact search below this many speakers, IVF above
+            "ivf_min_size": 5000,
+            "nprobe": 8,
+            "busy_timeout_ms": 10000
+        },
+        "search_index": {
+            "enabled": True,
+            "path": None,
+            # Text matches ranked per query, newest first (see search_index)
+            "max_candidates": 5000,
+            "busy_timeout_ms": 10000
+        },
+        "live": {
+            "enabled": True,
+            "whisper_model": "base",
+            "language": None,
+            "temperature": 0.0,
+            "beam_size": None,
+            "best_of": None,
+            # Streaming VAD (see live_session)
+            "frame_ms": 30,
+            "margin_db": 12.0,
+            "min_threshold_db": -50.0,
+            "noise_window_s": 10.0,
+            "min_speech_s": 0.25,
+            "end_silence_s": 0.5,
+            "max_utterance_s": 15.0,
+            "pre_roll_s": 0.3,
+            "pad_s": 0.2,
+            "partial_interval_s": 1.0,
+            "sentiment": True,
+            # Speech end to final transcript
+            "latency_target_s": 2.0,
+            "latency_window": 1000,
+            "max_sessions": 4
+        },
+        "result_cache": {
+            "enabled": True,
+            "dir": None,
+            "max_size_mb": 10240
+        },
+        "profiling": {
+            "enabled": False,
+            "stages": [],
+            "tool": "cprofile",
+            "dir": None
+        },
+        "parallelism": {
+            "enabled": True,
+            "executor": "thread",
+            "max_workers": 2,
+            "torch_threads": {
+                "run_diarization": 2,
+                "run_whisper": 2,
+                "run_sentiment_analysis": 2,
+                "run_summarization": 2
+            }
         },
         "intermediate_files": {
             "diarization": "diarization_result.json",
             "transcript": "speech_brain/whisper_transcript.txt",
+            "transcript_timing": "whisper_segments.json",
+            "vad": "vad_regions.json",
+            "speech_audio": "speech_only.wav",
+            "pcm": "audio_16k.wav",
             "aligned": "aligned_transcript.json",
             "indicbert_input": "indicbert_input.json",
-            "summary": "summary_output.txt"
+            "segments": "segments",
+            "summary": "summary_output.txt",
+            "speaker_embeddings": "speaker_embeddings.npz"
         }
     }
 
 
+def make_job_config(base_config: Dict[str, Any], audio_path: str, job_output_dir: str,
+                    shared_dir: Optional[str] = None, job_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Config for one job: its own output directory and intermediate files,
+    with the result cache shared under shared_dir (default: the base
+    config's output_dir). job_id defaults to the output directory's name.
+    """
+    job_config = copy.deepcopy(base_config)
+    job_config["audio_path"] = audio_path
+    job_config["output_dir"] = job_output_dir
+    job_config["job_id"] = job_id or os.path.basename(os.path.normpath(job_output_dir))
+    
+    # All jobs share one result cache under the base output directory
+    cache_config = job_config.setdefault("result_cache", {})
+    if not cache_config.get("dir"):
+        cache_config["dir"] = os.path.join(shared_dir or base_config["output_dir"], ".result_cache")
+    
+    # Converted models are exported once for all jobs
+    backend_config = job_config.setdefault("inference_backend", {})
+    if not backend_config.get("cache_dir"):
+        backend_config["cache_dir"] = os.path.join(shared_dir or base_config["output_dir"], ".model_cache")
+    
+    # Speakers are matched across all jobs
+    index_config = job_config.setdefault("speaker_index", {})
+    if not index_config.get("path"):
+        index_config["path"] = os.path.join(shared_dir or base_config["output_dir"], "speakers.db")
+    
+    # One search index covers every job
+    search_config = job_config.setdefault("search_index", {})
+    if not search_config.get("path"):
+        search_config["path"] = os.path.join(shared_dir or base_config["output_dir"], "search_index.db")
+    
+    # Update intermediate file paths to live in the job directory
+    for key, value in job_config["intermediate_files"].items():
+        job_config["intermediate_files"][key] = os.path.join(job_output_dir, os.path.basename(value))
+    return job_config
+
+
 def main():
     # Get configuration (can be loaded from a file in production)
     config = get_default_config()
@@ -491,14 +1711,8 @@ def main():
     if results["pipeline_status"] == "completed":
         logger.info("Pipeline completed successfully!")
         
-        # Collect detailed results
-        detailed_results = pipeline.collect_results()
-        
-        # Save final results to a file
+        # Pipeline info is saved by run_pipeline
         output_path = os.path.join(config["output_dir"], "pipeline_results.json")
-        with open(output_path, 'w') as f:
-            json.dump(detailed_results["pipeline_info"], f, indent=2)
-        
         logger.info(f"Results saved to {output_path}")
     else:
         logger.error("Pipeline did not complete successfully")
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Batch ingestion of a corpus of calls through the pipeline worker pool.
+
+    python batch_ingest.py ../Backend/uploads/calls --output-dir /data/reprocessed --workers 4
+    python batch_ingest.py "archive/2025-*/*.mp3" manifest.txt --output-dir out
+
+Inputs are directories (searched recursively), glob patterns, or manifest
+files (.txt/.lst with one path per line, .jsonl with an "audio_path" per
+line). Jobs are sorted longest first, so short calls fill the gaps at the
+end, and are run by JobQueue workers that keep their models loaded.
+
+Every finished job is appended to a state file. A rerun skips the calls
+that already succeeded, so an interrupted batch resumes where it stopped.
+Failures are recorded and the batch carries on. A throughput report
+(audio-hours per wall-hour) is written at the end.
+"""
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+from pipeline_coordinator import get_default_config, make_job_config
+from audio_io import probe_duration
+from job_queue import JobQueue
+
+logger = logging.getLogger('audio_pipeline.batch')
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".m4a", ".flac", ".ogg", ".webm")
+SUCCESS_STATUSES = ("completed", "partially_completed")
+# Rough size of a second of 128 kbps MP3, for files ffprobe cannot read
+FALLBACK_BYTES_PER_SECOND = 16000
+
+
+def _read_manifest(path: str) -> List[str]:
+    """Audio paths listed in a manifest, relative to the manifest's directory"""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    paths = []
+    with open(path, 'r') as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if path.endswith(".jsonl"):
+                line = json.loads(line)["audio_path"]
+            paths.append(os.path.join(base_dir, line))
+    return paths
+
+
+def collect_inputs(inputs: List[str], extensions=AUDIO_EXTENSIONS) -> List[str]:
+    """Expand directories, globs and manifests into unique absolute audio paths"""
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                paths.extend(os.path.join(root, name) for name in files
+                             if name.lower().endswith(extensions))
+        elif os.path.isfile(item) and item.endswith((".txt", ".lst", ".jsonl")):
+            paths.extend(_read_manifest(item))
+        elif os.path.isfile(item):
+            paths.append(item)
+        else:
+            matches = glob.glob(item, recursive=True)
+            if not matches:
+                logger.warning(f"No files match {item}")
+            paths.extend(match for match in matches if os.path.isfile(match))
+
+    unique = []
+    seen = set()
+    for path in paths:
+        path = os.path.abspath(path)
+        if path not in seen:
+            seen.add(path)
+            unique.append(path)
+    return unique
+
+
+def job_id_for(path: str) -> str:
+    """Stable job ID, so a resumed batch reuses the same output directories"""
+    stem = os.path.splitext(os.path.basename(path))[0]
+    return f"{stem[:48]}_{hashlib.sha1(path.encode('utf-8')).hexdigest()[:10]}"
+
+
+def estimate_duration(path: str) -> float:
+    """Duration from the file headers, or estimated from the file size"""
+    try:
+        return probe_duration(path)
+    except Exception:
+        return os.path.getsize(path) / FALLBACK_BYTES_PER_SECOND
+
+
+def load_state(state_path: str) -> Dict[str, Dict[str, Any]]:
+    """Latest state entry for each audio path (the file is append-only JSON lines)"""
+    state = {}
+    if not os.path.exists(state_path):
+        return state
+    with open(state_path, 'r') as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # A line cut short by a crash
+                continue
+            state[entry["audio_path"]] = entry
+    return state
+
+
+class BatchRun:
+    def __init__(self, jobs: List[Dict[str, Any]], base_config: Dict[str, Any], state_path: str,
+                 num_workers: int, jobs_per_worker: int, force_rerun: bool = False):
+        """jobs: {"audio_path", "job_id", "duration"} dicts in submission order"""
+        self.jobs = {job["job_id"]: job for job in jobs}
+        self.base_config = base_config
+        self.state_path = state_path
+        self.force_rerun = force_rerun
+        self.queue = JobQueue(
+            base_config=base_config,
+            on_event=self._on_event,
+            num_workers=num_workers,
+            max_queue_depth=None,
+            start_method=base_config.get("job_queue", {}).get("start_method", "spawn"),
+            preload_models=True,
+            jobs_per_worker=jobs_per_worker
+        )
+        self.entries = []
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        self._remaining = len(jobs)
+
+    def _on_event(self, event: Dict[str, Any]):
+        job = self.jobs.get(event.get("job_id"))
+        if job is None:
+            return
+        if event["type"] == "job_running":
+            job["start_time"] = event["time"]
+            return
+        if event["type"] not in ("job_finished", "job_failed", "job_cancelled"):
+            return
+
+        results = event.get("results") or {}
+        entry = {
+            "audio_path": job["audio_path"],
+            "job_id": job["job_id"],
+            "status": results.get("pipeline_status", "failed" if event["type"] == "job_failed" else "cancelled"),
+            # Decoded duration when the pipeline measured it, else the probe
+            "audio_duration": results.get("audio", {}).get("duration", job["duration"]),
+            "wall_time": event["time"] - job.get("start_time", event["time"]),
+            "errors": results.get("errors") or ([event["error"]] if event.get("error") else []),
+            "finished_at": event["time"]
+        }
+        with self._lock:
+            self.entries.append(entry)
+            with open(self.state_path, 'a') as f:
+                f.write(json.dumps(entry) + "\n")
+            self._remaining -= 1
+            done = len(self.entries)
+            remaining = self._remaining
+        level = logging.INFO if entry["status"] in SUCCESS_STATUSES else logging.ERROR
+        logger.log(level, f"[{done}/{done + remaining}] {entry['status']}: {job['audio_path']} "
+                          f"({entry['audio_duration']:.0f}s audio in {entry['wall_time']:.0f}s)")
+        if remaining == 0:
+            self._done.set()
+
+    def run(self, output_dir: str) -> List[Dict[str, Any]]:
+        """Submit every job and wait for all of them to finish"""
+        if not self.jobs:
+            return []
+        self.queue.start()
+        try:
+            for job in self.jobs.values():
+                job_config = make_job_config(self.base_config, job["audio_path"],
+                                             os.path.join(output_dir, job["job_id"]), shared_dir=output_dir,
+                                             job_id=job["job_id"])
+                os.makedirs(job_config["output_dir"], exist_ok=True)
+                self.queue.submit(job["job_id"], job_config, force_rerun=self.force_rerun)
+            while not self._done.wait(timeout=1.0):
+                pass
+        finally:
+            self.queue.stop()
+        return self.entries
+
+
+def throughput_report(entries: List[Dict[str, Any]], wall_time: float, num_workers: int,
+                      skipped: int) -> Dict[str, Any]:
+    """Audio-hours per wall-hour and per-status counts for a batch"""
+    audio_seconds = sum(entry["audio_duration"] for entry in entries if entry["status"] in SUCCESS_STATUSES)
+    statuses = {}
+    for entry in entries:
+        statuses[entry["status"]] = statuses.get(entry["status"], 0) + 1
+    return {
+        "jobs": len(entries),
+        "skipped": skipped,
+        "statuses": statuses,
+        "workers": num_workers,
+        "audio_hours": audio_seconds / 3600,
+        "wall_hours": wall_time / 3600,
+        "audio_hours_per_wall_hour": (audio_seconds / wall_time) if wall_time > 0 else None,
+        "failures": [{"audio_path": entry["audio_path"], "status": entry["status"], "errors": entry["errors"]}
+                     for entry in entries if entry["status"] not in SUCCESS_STATUSES]
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Run the audio pipeline over a corpus of calls")
+    parser.add_argument("inputs", nargs="+", help="directories, glob patterns or manifest files")
+    parser.add_argument("--output-dir", required=True, help="one subdirectory per call is created here")
+    parser.add_argument("--config", help="JSON file of config sections overriding the defaults")
+    parser.add_argument("--workers", type=int, help="worker processes (default: job_queue.num_workers)")
+    parser.add_argument("--jobs-per-worker", type=int, help="concurrent jobs per worker")
+    parser.add_argument("--state", help="state file for resuming (default: <output-dir>/batch_state.jsonl)")
+    parser.add_argument("--report", help="report file (default: <output-dir>/batch_report.json)")
+    parser.add_argument("--retry-failed", action="store_true", help="rerun calls that failed before")
+    parser.add_argument("--force", action="store_true", help="rerun every call and stage")
+    parser.add_argument("--probe-threads", type=int, default=8, help="threads probing durations")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    base_config = get_default_config()
+    if args.config:
+        with open(args.config, 'r') as f:
+            for key, value in json.load(f).items():
+                if isinstance(base_config.get(key), dict) and isinstance(value, dict):
+                    base_config[key].update(value)
+                else:
+                    base_config[key] = value
+    output_dir = os.path.abspath(args.output_dir)
+    base_config["output_dir"] = output_dir
+    os.makedirs(output_dir, exist_ok=True)
+    queue_config = base_config.get("job_queue", {})
+    num_workers = args.workers or queue_config.get("num_workers", 2)
+    jobs_per_worker = args.jobs_per_worker or queue_config.get("jobs_per_worker", 1)
+    state_path = args.state or os.path.join(output_dir, "batch_state.jsonl")
+    report_path = args.report or os.path.join(output_dir, "batch_report.json")
+
+    paths = collect_inputs(args.inputs)
+    state = {} if args.force else load_state(state_path)
+    done_statuses = SUCCESS_STATUSES if args.retry_failed else SUCCESS_STATUSES + ("failed",)
+    pending = [path for path in paths if state.get(path, {}).get("status") not in done_statuses]
+    skipped = len(paths) - len(pending)
+    logger.info(f"Found {len(paths)} calls, {skipped} already done, {len(pending)} to process")
+
+    with ThreadPoolExecutor(max_workers=max(1, args.probe_threads)) as executor:
+        durations = list(executor.map(estimate_duration, pending))
+    # Longest first: the short calls at the end even out the workers' finishing times
+    jobs = sorted(({"audio_path": path, "job_id": job_id_for(path), "duration": duration}
+                   for path, duration in zip(pending, durations)),
+                  key=lambda job: job["duration"], reverse=True)
+
+    start_time = time.time()
+    try:
+        entries = BatchRun(jobs, base_config, state_path, num_workers, jobs_per_worker,
+                           force_rerun=args.force).run(output_dir)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; rerun the same command to resume")
+        return 130
+    wall_time = time.time() - start_time
+
+    report = throughput_report(entries, wall_time, num_workers, skipped)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    rate = report["audio_hours_per_wall_hour"]
+    logger.info(f"Processed {report['audio_hours']:.2f} audio hours in {report['wall_hours']:.2f} wall hours"
+                + (f" ({rate:.1f} audio-hours per wall-hour)" if rate is not None else ""))
+    logger.info(f"Statuses: {report['statuses']}; report written to {report_path}")
+    return 0 if not report["failures"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Reproducible benchmarks of the audio pipeline.
+
+    python benchmarks/run_benchmarks.py --durations 60 300 900 --concurrency 1 2 4
+    python benchmarks/run_benchmarks.py --real-models whisper --output after.json --compare before.json
+
+Synthetic calls of each length (see synthetic_audio) are run through
+AudioPipeline `concurrency` at a time in one process, the way a worker with
+jobs_per_worker > 1 runs them. The four models are replaced by stand-ins
+(see stub_models) unless listed in --real-models, in which case the model
+paths of the config are used. Models are loaded before timing starts and
+the result cache is off, so every run does the full work.
+
+For each audio length and concurrency level the output JSON has per-stage
+and end-to-end latency, throughput in audio seconds per wall second and
+peak memory, along with the git commit and environment, so results of two
+commits can be compared with --compare.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import hashlib
+import platform
+import argparse
+import logging
+import subprocess
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import numpy as np
+
+from pipeline_coordinator import AudioPipeline, get_default_config, make_job_config
+from model_registry import warm_up, get_registry
+from inference_backends import backend_for
+from stage_metrics import StageProbe
+from synthetic_audio import generate_call
+import stub_models
+
+logger = logging.getLogger('audio_pipeline.benchmark')
+
+SCHEMA_VERSION = 1
+STAGE_FIELDS = ("wall_time", "cpu_time", "rtf", "peak_rss_mb", "input_tokens", "output_tokens")
+
+
+def _percentiles(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"mean": None, "p50": None, "p95": None, "max": None}
+    array = np.asarray(values, dtype=np.float64)
+    return {
+        "mean": float(array.mean()),
+        "p50": float(np.percentile(array, 50)),
+        "p95": float(np.percentile(array, 95)),
+        "max": float(array.max())
+    }
+
+
+def _git_info(path: str) -> Dict[str, Any]:
+    def git(*args):
+        return subprocess.run(["git", "-C", path] + list(args), capture_output=True,
+                              text=True, check=True).stdout.strip()
+    try:
+        return {"commit": git("rev-parse", "HEAD"), "branch": git("rev-parse", "--abbrev-ref", "HEAD"),
+                "dirty": bool(git("status", "--porcelain", "--untracked-files=no"))}
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "branch": None, "dirty": None}
+
+
+def environment_info() -> Dict[str, Any]:
+    """What the numbers depend on besides the code"""
+    import torch
+    return {
+        "host": socket.gethostname(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+        "torch": torch.__version__,
+        "torch_threads": torch.get_num_threads(),
+        "cuda": torch.cuda.is_available()
+    }
+
+
+def prepare_audio(work_dir: str, duration_s: float, num_speakers: int, seed: int) -> Dict[str, Any]:
+    """Synthetic call of the given length, reused across runs with the same parameters"""
+    path = os.path.join(work_dir, "audio", f"call_{int(duration_s)}s_{num_speakers}spk_seed{seed}.wav")
+    reference_path = path + ".turns.json"
+    if os.path.exists(path) and os.path.exists(reference_path):
+        with open(reference_path, 'r') as f:
+            return json.load(f)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    logger.info(f"Generating {duration_s:.0f}s of synthetic audio with {num_speakers} speakers")
+    return generate_call(path, duration_s, num_speakers, seed)
+
+
+def run_job(base_config: Dict[str, Any], audio: Dict[str, Any], job_dir: str, decode: bool) -> Dict[str, Any]:
+    """One pipeline run from a clean job directory"""
+    shutil.rmtree(job_dir, ignore_errors=True)
+    job_config = make_job_config(base_config, audio["audio_path"], job_dir)
+    os.makedirs(job_dir, exist_ok=True)
+    if not decode:
+        # The synthetic file is already decoded audio; run_decode finds it in place
+        shutil.copyfile(audio["audio_path"], job_config["intermediate_files"]["pcm"])
+
+    start_time = time.time()
+    results = AudioPipeline(job_config, force_rerun=False).run_pipeline()
+    wall_time = time.time() - start_time
+    return {
+        "status": results["pipeline_status"],
+        "errors": results["errors"],
+        "wall_time": wall_time,
+        "stages": {stage: {field: metrics.get(field) for field in STAGE_FIELDS if metrics.get(field) is not None}
+                   for stage, metrics in results.get("stage_metrics", {}).items()}
+    }
+
+
+def run_level(base_config: Dict[str, Any], audio: Dict[str, Any], concurrency: int, repeat: int,
+              work_dir: str, decode: bool) -> Dict[str, Any]:
+    """`repeat` rounds of `concurrency` simultaneous jobs on the same audio"""
+    jobs = []
+    rounds = []
+    for round_index in range(repeat):
+        job_dirs = [os.path.join(work_dir, "jobs", f"{int(audio['duration'])}s_c{concurrency}_r{round_index}_{i}")
+                    for i in range(concurrency)]
+        with StageProbe() as probe:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                round_jobs = list(executor.map(lambda job_dir: run_job(base_config, audio, job_dir, decode),
+                                               job_dirs))
+        jobs.extend(round_jobs)
+        rounds.append({
+            "wall_time": probe.metrics["wall_time"],
+            "process_cpu_time": probe.metrics["process_cpu_time"],
+            "peak_rss_mb": probe.metrics["peak_rss_mb"]
+        })
+        for job_dir in job_dirs:
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+    stages = {}
+    for job in jobs:
+        for stage, metrics in job["stages"].items():
+            for field, value in metrics.items():
+                stages.setdefault(stage, {}).setdefault(field, []).append(value)
+
+    round_wall = sum(item["wall_time"] for item in rounds)
+    audio_seconds = audio["duration"] * concurrency * repeat
+    failed = [job for job in jobs if job["status"] not in ("completed", "partially_completed")]
+    return {
+        "audio_duration": audio["duration"],
+        "speech_duration": audio["speech_duration"],
+        "concurrency": concurrency,
+        "repeat": repeat,
+        "jobs": len(jobs),
+        "failed_jobs": len(failed),
+        "errors": sorted({error for job in failed for error in job["errors"]}),
+        "end_to_end": _percentiles([job["wall_time"] for job in jobs]),
+        "end_to_end_rtf": _percentiles([job["wall_time"] / audio["duration"] for job in jobs]),
+        "throughput_audio_s_per_s": audio_seconds / round_wall if round_wall > 0 else None,
+        "jobs_per_minute": 60 * len(jobs) / round_wall if round_wall > 0 else None,
+        "process_cpu_time": sum(item["process_cpu_time"] for item in rounds),
+        "peak_rss_mb": max(item["peak_rss_mb"] for item in rounds),
+        "stages": {stage: {field: (_percentiles(values) if field in ("wall_time", "cpu_time", "rtf")
+                                   else max(values) if field == "peak_rss_mb" else sum(values) / len(values))
+                           for field, values in fields.items()}
+                   for stage, fields in stages.items()}
+    }
+
+
+def compare_results(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[Dict[str, Any]]:
+    """
+    Ratios current/baseline of the median latencies per level and stage, and
+    of throughput; entries beyond threshold are marked as regressions
+    """
+    baseline_levels = {(level["audio_duration"], level["concurrency"]): level for level in baseline["results"]}
+    rows = []
+    for level in current["results"]:
+        before = baseline_levels.get((level["audio_duration"], level["concurrency"]))
+        if before is None:
+            continue
+        pairs = [("end_to_end.p50", before["end_to_end"]["p50"], level["end_to_end"]["p50"], False),
+                 ("throughput", before["throughput_audio_s_per_s"], level["throughput_audio_s_per_s"], True),
+                 ("peak_rss_mb", before["peak_rss_mb"], level["peak_rss_mb"], False)]
+        for stage, metrics in level["stages"].items():
+            before_stage = before["stages"].get(stage, {}).get("wall_time", {})
+            pairs.append((f"{stage}.p50", before_stage.get("p50"), metrics["wall_time"]["p50"], False))
+        for metric, old, new, higher_is_better in pairs:
+            if not old or new is None:
+                continue
+            ratio = new / old
+            change = (1 - ratio) if higher_is_better else (ratio - 1)
+            rows.append({"audio_duration": level["audio_duration"], "concurrency": level["concurrency"],
+                         "metric": metric, "baseline": old, "current": new, "ratio": ratio,
+                         "regression": change > threshold})
+    return rows
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the audio pipeline on synthetic calls")
+    parser.add_argument("--durations", type=float, nargs="+", default=[60, 300, 900],
+                        help="audio lengths in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4],
+                        help="numbers of jobs run at the same time")
+    parser.add_argument("--repeat", type=int, default=1, help="rounds per audio length and concurrency")
+    parser.add_argument("--speakers", type=int, default=3, help="speakers in the synthetic calls")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic audio")
+    parser.add_argument("--real-models", nargs="*", default=[], choices=stub_models.STUB_MODELS,
+                        help="models to load from the config's model_paths instead of stand-ins")
+    parser.add_argument("--simulated-rtf", type=float, default=0.0,
+                        help="stand-in audio models sleep this fraction of the audio length")
+    parser.add_argument("--simulated-ms-per-token", type=float, default=0.0,
+                        help="stand-in text models sleep this long per token")
+    parser.add_argument("--decode", action="store_true", help="include the ffmpeg decode stage")
+    parser.add_argument("--config", help="JSON file of config sections overriding the defaults")
+    parser.add_argument("--work-dir", default=os.path.join(BENCHMARK_DIR, ".work"),
+                        help="synthetic audio and job directories")
+    parser.add_argument("--output", help="results file (default: <work-dir>/benchmark_<commit>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="relative slowdown reported as a regression")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    base_config = get_default_config()
+    if args.config:
+        with open(args.config, 'r') as f:
+            for key, value in json.load(f).items():
+                if isinstance(base_config.get(key), dict) and isinstance(value, dict):
+                    base_config[key].update(value)
+                else:
+                    base_config[key] = value
+    work_dir = os.path.abspath(args.work_dir)
+    base_config["output_dir"] = work_dir
+    # Every run must do the full work
+    base_config["result_cache"] = dict(base_config.get("result_cache", {}), enabled=False)
+
+    stubbed = [name for name in stub_models.STUB_MODELS if name not in args.real_models]
+    stub_models.install(stubbed, simulated_rtf=args.simulated_rtf,
+                        simulated_ms_per_token=args.simulated_ms_per_token)
+    load_start = time.time()
+    warm_up(base_config, stub_models.STUB_MODELS)
+    model_load_time = time.time() - load_start
+
+    git = _git_info(os.path.dirname(BENCHMARK_DIR))
+    report = {
+        "schema_version": SCHEMA_VERSION,
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "git": git,
+        "environment": environment_info(),
+        "settings": {
+            "durations": args.durations,
+            "concurrency": args.concurrency,
+            "repeat": args.repeat,
+            "speakers": args.speakers,
+            "seed": args.seed,
+            "decode": args.decode,
+            "models": {name: ("stub" if name in stubbed else "real") for name in stub_models.STUB_MODELS},
+            "backends": {name: backend_for(base_config, name) for name in ("indicbert", "t5")},
+            "simulated_rtf": args.simulated_rtf,
+            "simulated_ms_per_token": args.simulated_ms_per_token,
+            # Digest of the effective config, so runs with different settings are not compared by mistake
+            "config_sha1": hashlib.sha1(json.dumps(
+                {key: value for key, value in base_config.items() if key not in ("audio_path", "output_dir")},
+                sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        },
+        "model_load_time": model_load_time,
+        "models": get_registry(base_config).stats()["models"],
+        "results": []
+    }
+
+    for duration in args.durations:
+        audio = prepare_audio(work_dir, duration, args.speakers, args.seed)
+        for concurrency in args.concurrency:
+            logger.info(f"Running {duration:.0f}s audio x {concurrency} concurrent job(s), {args.repeat} round(s)")
+            level = run_level(base_config, audio, concurrency, args.repeat, work_dir, args.decode)
+            report["results"].append(level)
+            logger.info(f"  end-to-end p50 {level['end_to_end']['p50']:.2f}s, "
+                        f"{level['throughput_audio_s_per_s']:.1f} audio s/s, peak RSS {level['peak_rss_mb']:.0f} MB"
+                        + (f", {level['failed_jobs']} failed" if level["failed_jobs"] else ""))
+
+    output_path = args.output or os.path.join(work_dir, f"benchmark_{(git['commit'] or 'unknown')[:10]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Results written to {output_path}")
+
+    failed = sum(level["failed_jobs"] for level in report["results"])
+    if args.compare:
+        with open(args.compare, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get("settings", {}).get("config_sha1") != report["settings"]["config_sha1"]:
+            logger.warning("The baseline was run with a different config")
+        rows = compare_results(baseline, report, args.threshold)
+        for row in rows:
+            logger.info(f"{row['audio_duration']:.0f}s x{row['concurrency']} {row['metric']}: "
+                        f"{row['baseline']:.3f} -> {row['current']:.3f} ({row['ratio']:.2f}x)"
+                        + ("  REGRESSION" if row["regression"] else ""))
+        if any(row["regression"] for row in rows):
+            return 1
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
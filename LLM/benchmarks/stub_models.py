@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Lightweight stand-ins for Whisper, the SpeechBrain diarizer, IndicBERT and
+T5, for benchmarking the pipeline without the real models.
+
+Each stand-in has the interface the pipeline calls and does real work that
+grows with its input: the transcriber and the diarizer analyse the audio
+frame by frame, and the sentiment and summarization models are small torch
+networks run over the tokens. install() makes the model registry load them
+instead of the real models; the real ones can be kept per model.
+
+Optionally each stand-in sleeps for a fixed fraction of its audio or token
+count (`simulated_rtf`, `simulated_ms_per_token`) to mimic the cost of the
+real model without its memory.
+"""
+import re
+import time
+import zlib
+import threading
+from types import SimpleNamespace
+from typing import Dict, Any, List, Optional, Union
+
+import numpy as np
+import torch
+
+from audio_io import load_pcm, SAMPLE_RATE
+from vad import frame_levels_db
+from model_registry import override_loader
+
+STUB_MODELS = ["whisper", "diarization", "indicbert", "t5"]
+
+VOCABULARY = (
+    "hello thanks for calling how can i help you today my order has not arrived yet "
+    "let me check that for you the payment went through last week but i never got a "
+    "confirmation email sorry about the delay i can see the shipment is on its way "
+    "great that is really helpful terrible service i want a refund please hold on "
+    "one moment is there anything else no that is all have a nice day"
+).split()
+WORDS_PER_SENTENCE = 12
+
+
+class StubWhisper:
+    def __init__(self, simulated_rtf: float = 0.0, frame_ms: int = 20):
+        """Transcribes every syllable-like burst of energy as one word"""
+        self.simulated_rtf = simulated_rtf
+        self.frame_samples = int(frame_ms * SAMPLE_RATE / 1000)
+
+    def transcribe(self, audio: Union[str, np.ndarray], word_timestamps: bool = True,
+                   initial_prompt: Optional[str] = None, **kwargs) -> Dict[str, Any]:
+        if isinstance(audio, str):
+            audio = load_pcm(audio)
+        frame_s = self.frame_samples / SAMPLE_RATE
+        levels = frame_levels_db(np.asarray(audio, dtype=np.float32), self.frame_samples)
+        voiced = levels > max(-45.0, (levels.max() if len(levels) else 0.0) - 30.0)
+
+        # Runs of voiced frames are words; a pause of 0.5 s ends a segment
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], voiced.astype(np.int8), [0]))))
+        runs = edges.reshape(-1, 2) * frame_s
+        segments = []
+        words = []
+        for index, (start, end) in enumerate(runs):
+            if words and start - words[-1]["end"] >= 0.5:
+                segments.append(words)
+                words = []
+            # The word depends on its position only, so windows agree at the seams
+            text = VOCABULARY[zlib.crc32(f"{start:.2f}".encode()) % len(VOCABULARY)]
+            if (index + 1) % WORDS_PER_SENTENCE == 0:
+                text += "."
+            words.append({"word": " " + text, "start": float(start), "end": float(end), "probability": 0.9})
+        if words:
+            segments.append(words)
+
+        if self.simulated_rtf:
+            time.sleep(self.simulated_rtf * len(audio) / SAMPLE_RATE)
+        result_segments = [{
+            "id": index,
+            "start": segment[0]["start"],
+            "end": segment[-1]["end"],
+            "text": "".join(word["word"] for word in segment),
+            "words": segment if word_timestamps else []
+        } for index, segment in enumerate(segments)]
+        return {"text": "".join(segment["text"] for segment in result_segments).strip(),
+                "segments": result_segments, "language": "en"}
+
+
+class StubDiarizer:
+    def __init__(self, simulated_rtf: float = 0.0, frame_s: float = 0.5, tolerance: float = 0.08,
+                 min_frames: int = 4):
+        """Labels voiced frames by their dominant pitch, clustered greedily"""
+        self.simulated_rtf = simulated_rtf
+        self.frame_samples = int(frame_s * SAMPLE_RATE)
+        self.tolerance = tolerance
+        self.min_frames = min_frames
+
+    def _pitch(self, frame: np.ndarray) -> float:
+        spectrum = np.abs(np.fft.rfft(frame * np.hanning(len(frame))))
+        frequencies = np.fft.rfftfreq(len(frame), 1.0 / SAMPLE_RATE)
+        band = (frequencies >= 70) & (frequencies <= 500)
+        return float(frequencies[band][np.argmax(spectrum[band])])
+
+    def diarize_file(self, path: str) -> Dict[str, List]:
+        audio = load_pcm(path)
+        frame_s = self.frame_samples / SAMPLE_RATE
+        levels = frame_levels_db(audio, self.frame_samples)
+        threshold = max(-45.0, (levels.max() if len(levels) else 0.0) - 30.0)
+        voiced = np.flatnonzero(levels > threshold)
+        pitches = [self._pitch(np.asarray(audio[index * self.frame_samples:(index + 1) * self.frame_samples],
+                                          dtype=np.float32))
+                   for index in voiced]
+
+        # Greedy clustering, then frames of rare pitches (turn edges) go to the nearest common one
+        centroids = []
+        members = []
+        for pitch in pitches:
+            label = next((i for i, centroid in enumerate(centroids)
+                          if abs(pitch - centroid) <= self.tolerance * centroid), None)
+            if label is None:
+                centroids.append(pitch)
+                members.append(0)
+                label = len(centroids) - 1
+            members[label] += 1
+        common = [i for i, count in enumerate(members) if count >= self.min_frames] or list(range(len(centroids)))
+        speaker_of = {}
+        for pitch in pitches:
+            nearest = min(common, key=lambda i: abs(pitch - centroids[i]))
+            speaker_of.setdefault(nearest, len(speaker_of))
+
+        segments = []
+        labels = []
+        for index, pitch in zip(voiced, pitches):
+            label = speaker_of[min(common, key=lambda i: abs(pitch - centroids[i]))]
+            start, end = float(index * frame_s), float((index + 1) * frame_s)
+            if labels and labels[-1] == label and abs(segments[-1][1] - start) < 1e-6:
+                segments[-1][1] = end
+            else:
+                segments.append([start, end])
+                labels.append(label)
+
+        if self.simulated_rtf:
+            time.sleep(self.simulated_rtf * len(audio) / SAMPLE_RATE)
+        return {"segments": segments, "labels": labels}
+
+
+class Encoding(dict):
+    """Tokenizer output with attribute access, like transformers' BatchEncoding"""
+
+    def __getattr__(self, name):
+        try:
+            return self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+
+class WordTokenizer:
+    pad_token_id = 0
+    eos_token_id = 1
+
+    def __init__(self, vocab_size: int = 32000):
+        """Whitespace tokenizer with hashed token IDs; IDs decode back to words"""
+        self.vocab_size = vocab_size
+        self._words = {}
+        self._lock = threading.Lock()
+
+    def _encode(self, text: str, add_special_tokens: bool, max_length: Optional[int]):
+        matches = list(re.finditer(r"\S+", text))
+        ids = []
+        with self._lock:
+            for match in matches:
+                token_id = 2 + zlib.crc32(match.group().encode("utf-8")) % (self.vocab_size - 2)
+                self._words.setdefault(token_id, match.group())
+                ids.append(token_id)
+        offsets = [match.span() for match in matches]
+        if max_length is not None:
+            keep = max_length - 1 if add_special_tokens else max_length
+            ids, offsets = ids[:keep], offsets[:keep]
+        if add_special_tokens:
+            ids.append(self.eos_token_id)
+            offsets.append((0, 0))
+        return ids, offsets
+
+    def __call__(self, text: Union[str, List[str]], add_special_tokens: bool = True, truncation: bool = False,
+                 max_length: Optional[int] = None, padding: Union[bool, str] = False,
+                 return_tensors: Optional[str] = None, return_offsets_mapping: bool = False) -> Encoding:
+        texts = [text] if isinstance(text, str) else text
+        encoded = [self._encode(item, add_special_tokens, max_length if truncation else None) for item in texts]
+        encoding = Encoding(input_ids=[ids for ids, _ in encoded],
+                            attention_mask=[[1] * len(ids) for ids, _ in encoded])
+        if return_offsets_mapping:
+            encoding["offset_mapping"] = [offsets for _, offsets in encoded]
+        if padding or return_tensors:
+            encoding = self.pad([{"input_ids": ids} for ids in encoding["input_ids"]], return_tensors=return_tensors)
+        elif isinstance(text, str):
+            encoding = Encoding((key, value[0]) for key, value in encoding.items())
+        return encoding
+
+    def pad(self, features: List[Dict[str, List[int]]], padding: Union[bool, str] = "longest",
+            return_tensors: Optional[str] = None) -> Encoding:
+        length = max((len(feature["input_ids"]) for feature in features), default=0)
+        input_ids = [list(feature["input_ids"]) + [self.pad_token_id] * (length - len(feature["input_ids"]))
+                     for feature in features]
+        attention_mask = [[1] * len(feature["input_ids"]) + [0] * (length - len(feature["input_ids"]))
+                          for feature in features]
+        if return_tensors == "pt":
+            return Encoding(input_ids=torch.tensor(input_ids, dtype=torch.long),
+                            attention_mask=torch.tensor(attention_mask, dtype=torch.long))
+        return Encoding(input_ids=input_ids, attention_mask=attention_mask)
+
+    def batch_decode(self, sequences, skip_special_tokens: bool = True) -> List[str]:
+        texts = []
+        for sequence in sequences:
+            ids = sequence.tolist() if hasattr(sequence, "tolist") else sequence
+            texts.append(" ".join(self._words.get(token_id, "") for token_id in ids
+                                  if token_id > self.eos_token_id or not skip_special_tokens).strip())
+        return texts
+
+
+class StubClassifier(torch.nn.Module):
+    def __init__(self, vocab_size: int = 32000, hidden_size: int = 128, num_labels: int = 2,
+                 simulated_ms_per_token: float = 0.0):
+        """Mean of token embeddings through a linear head"""
+        super().__init__()
+        generator = torch.Generator().manual_seed(0)
+        self.embeddings = torch.nn.Embedding(vocab_size, hidden_size, padding_idx=0)
+        self.hidden = torch.nn.Linear(hidden_size, hidden_size)
+        self.head = torch.nn.Linear(hidden_size, num_labels)
+        with torch.no_grad():
+            for parameter in self.parameters():
+                parameter.copy_(torch.randn(parameter.shape, generator=generator) * 0.1)
+        self.simulated_ms_per_token = simulated_ms_per_token
+
+    def forward(self, input_ids: torch.Tensor, attention_mask: Optional[torch.Tensor] = None, **kwargs):
+        if attention_mask is None:
+            attention_mask = (input_ids != 0).long()
+        mask = attention_mask.unsqueeze(-1).float()
+        hidden = torch.tanh(self.hidden(self.embeddings(input_ids)))
+        pooled = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1.0)
+        if self.simulated_ms_per_token:
+            time.sleep(self.simulated_ms_per_token * float(attention_mask.sum()) / 1000)
+        return SimpleNamespace(logits=self.head(pooled))
+
+
+class StubSummarizer(torch.nn.Module):
+    def __init__(self, vocab_size: int = 32000, hidden_size: int = 128, simulated_ms_per_token: float = 0.0):
+        """Extractive stand-in for T5: keeps the highest-scoring input tokens in order"""
+        super().__init__()
+        generator = torch.Generator().manual_seed(1)
+        self.embeddings = torch.nn.Embedding(vocab_size, hidden_size, padding_idx=0)
+        self.score = torch.nn.Linear(hidden_size, 1)
+        with torch.no_grad():
+            for parameter in self.parameters():
+                parameter.copy_(torch.randn(parameter.shape, generator=generator) * 0.1)
+        self.simulated_ms_per_token = simulated_ms_per_token
+
+    def generate(self, input_ids: torch.Tensor, attention_mask: Optional[torch.Tensor] = None,
+                 max_length: int = 150, num_beams: int = 1, **kwargs) -> torch.Tensor:
+        if attention_mask is None:
+            attention_mask = (input_ids != 0).long()
+        # Each beam rescores the input, so the cost grows with num_beams like beam search
+        scores = None
+        for beam in range(max(1, num_beams)):
+            beam_scores = self.score(torch.tanh(self.embeddings(input_ids) * (1.0 + 0.01 * beam))).squeeze(-1)
+            scores = beam_scores if scores is None else torch.maximum(scores, beam_scores)
+        special = (attention_mask == 0) | (input_ids <= 1)
+        scores = scores.masked_fill(special, float("-inf"))
+
+        outputs = []
+        for row in range(input_ids.shape[0]):
+            available = int((~special[row]).sum())
+            keep = min(max_length - 1, available)
+            positions = torch.topk(scores[row], keep).indices.sort().values if keep > 0 else []
+            outputs.append(input_ids[row][positions].tolist() + [1])
+        length = max(len(output) for output in outputs)
+        if self.simulated_ms_per_token:
+            time.sleep(self.simulated_ms_per_token * sum(len(output) for output in outputs) * num_beams / 1000)
+        return torch.tensor([output + [0] * (length - len(output)) for output in outputs], dtype=torch.long)
+
+
+def install(models: Optional[List[str]] = None, simulated_rtf: float = 0.0,
+            simulated_ms_per_token: float = 0.0):
+    """
+    Make the model registry load stand-ins for `models` (default: all four).
+    Call before the models are first loaded.
+    """
+    loaders = {
+        "whisper": lambda config, **kwargs: StubWhisper(simulated_rtf),
+        "diarization": lambda config, **kwargs: StubDiarizer(simulated_rtf),
+        "indicbert": lambda config, **kwargs: (WordTokenizer(), StubClassifier(
+            simulated_ms_per_token=simulated_ms_per_token).eval()),
+        "t5": lambda config, **kwargs: (WordTokenizer(), StubSummarizer(
+            simulated_ms_per_token=simulated_ms_per_token).eval())
+    }
+    for name in (STUB_MODELS if models is None else models):
+        override_loader(name, loaders[name])
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Synthetic multi-speaker calls for benchmarking.
+
+Each speaker is a voiced source with its own pitch: a few decaying
+harmonics, slow vibrato and a syllable-rate envelope, so the audio has the
+energy structure VAD, diarization and word segmentation react to. Turns of
+random length alternate between speakers with short pauses and an
+occasional long silence (hold). The same seed always gives the same file.
+
+The audio is written turn by turn as a 16 kHz float32 WAV (the format of
+the pipeline's decoded audio), so hour-long calls never sit in memory.
+"""
+import json
+from typing import Dict, Any, Iterator, List, Tuple
+
+import numpy as np
+
+from audio_io import write_float_wav, SAMPLE_RATE
+
+# Fundamental frequencies far enough apart for the stand-in diarizer
+SPEAKER_PITCHES_HZ = [110.0, 165.0, 220.0, 290.0, 370.0, 460.0]
+NOISE_LEVEL = 0.002
+
+
+def _voice(rng: np.random.Generator, pitch_hz: float, num_samples: int) -> np.ndarray:
+    """One turn of a speaker: harmonics under syllable and phrase envelopes"""
+    t = np.arange(num_samples, dtype=np.float64) / SAMPLE_RATE
+    vibrato = 1.0 + 0.01 * np.sin(2 * np.pi * rng.uniform(4.0, 6.0) * t)
+    phase = 2 * np.pi * pitch_hz * np.cumsum(vibrato) / SAMPLE_RATE
+    signal = np.zeros(num_samples, dtype=np.float64)
+    for harmonic in range(1, 6):
+        signal += np.sin(harmonic * phase) / harmonic ** 1.5
+
+    # Syllables at 3-5 Hz; the envelope reaches zero between them
+    syllable_rate = rng.uniform(3.0, 5.0)
+    envelope = np.clip(np.sin(2 * np.pi * syllable_rate * t + rng.uniform(0, np.pi)), 0.0, None) ** 0.7
+    # Slight loudness drift across the turn
+    envelope *= 0.6 + 0.4 * np.abs(np.sin(np.pi * t / max(t[-1], 1e-3) + rng.uniform(0, np.pi)))
+    return (0.25 * envelope * signal).astype(np.float32)
+
+
+def plan_turns(duration_s: float, num_speakers: int = 2, seed: int = 0,
+               hold_every_s: float = 300.0) -> List[Tuple[int, float, float]]:
+    """(speaker, start, end) turns covering up to duration_s"""
+    rng = np.random.default_rng(seed)
+    turns = []
+    time_s = rng.uniform(0.3, 1.0)
+    speaker = 0
+    next_hold = hold_every_s
+    while time_s < duration_s - 0.5:
+        length = min(rng.gamma(2.0, 2.0) + 0.6, duration_s - time_s)
+        turns.append((speaker, time_s, time_s + length))
+        time_s += length
+        if time_s >= next_hold:
+            # A caller put on hold: a long stretch of near-silence
+            time_s += rng.uniform(8.0, 20.0)
+            next_hold += hold_every_s
+        else:
+            time_s += rng.uniform(0.15, 1.2)
+        if num_speakers > 1:
+            speaker = (speaker + int(rng.integers(1, num_speakers))) % num_speakers
+    return turns
+
+
+def _render(turns: List[Tuple[int, float, float]], duration_s: float, seed: int) -> Iterator[np.ndarray]:
+    """Samples of the call, one turn (and the gap before it) at a time"""
+    rng = np.random.default_rng(seed + 1)
+    total_samples = int(round(duration_s * SAMPLE_RATE))
+    position = 0
+    for speaker, start, end in turns:
+        start_sample = int(round(start * SAMPLE_RATE))
+        end_sample = min(int(round(end * SAMPLE_RATE)), total_samples)
+        if end_sample <= start_sample:
+            continue
+        if start_sample > position:
+            yield (NOISE_LEVEL * rng.standard_normal(start_sample - position)).astype(np.float32)
+        turn = _voice(rng, SPEAKER_PITCHES_HZ[speaker % len(SPEAKER_PITCHES_HZ)], end_sample - start_sample)
+        turn += (NOISE_LEVEL * rng.standard_normal(len(turn))).astype(np.float32)
+        yield turn
+        position = end_sample
+    if total_samples > position:
+        yield (NOISE_LEVEL * rng.standard_normal(total_samples - position)).astype(np.float32)
+
+
+def generate_call(path: str, duration_s: float, num_speakers: int = 2, seed: int = 0) -> Dict[str, Any]:
+    """
+    Write a synthetic call to `path` and its reference turns to
+    `path`.turns.json; returns the reference
+    """
+    turns = plan_turns(duration_s, num_speakers, seed)
+    num_samples = write_float_wav(path, _render(turns, duration_s, seed))
+    reference = {
+        "audio_path": path,
+        "duration": num_samples / SAMPLE_RATE,
+        "num_speakers": num_speakers,
+        "seed": seed,
+        "speech_duration": sum(end - start for _, start, end in turns),
+        "turns": [{"speaker": f"SPEAKER_{speaker}", "start": round(start, 3), "end": round(end, 3)}
+                  for speaker, start, end in turns]
+    }
+    with open(path + ".turns.json", 'w') as f:
+        json.dump(reference, f, indent=2)
+    return reference
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-job publish/subscribe of pipeline events for streaming clients.
+
+PipelineAPI publishes every job event it receives (stage transitions,
+partial transcripts, per-segment sentiment, job completion). Each event
+gets a per-job sequence number and is kept in a bounded history, so a
+client that connects late, or reconnects with Last-Event-ID, first
+receives what it missed. Slow subscribers never block publishers: a full
+subscriber queue drops the subscriber, and the client reconnects.
+"""
+import queue
+import threading
+import logging
+from collections import OrderedDict, deque
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger('audio_pipeline.events')
+
+TERMINAL_EVENTS = ("job_finished", "job_failed", "job_cancelled")
+
+
+class Subscription:
+    def __init__(self, broker: "EventBroker", job_id: str, max_pending: int):
+        self.broker = broker
+        self.job_id = job_id
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.dropped = False
+
+    def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        """Next event, or None if nothing arrived within timeout"""
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker._unsubscribe(self)
+
+
+class EventBroker:
+    def __init__(self, history_size: int = 1000, max_jobs: int = 256, max_pending: int = 1000):
+        """
+        history_size: events kept per job for replay
+        max_jobs: jobs whose history is kept (least recently published dropped first)
+        max_pending: events a subscriber may fall behind before it is dropped
+        """
+        self.history_size = history_size
+        self.max_jobs = max_jobs
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def _job(self, job_id: str) -> Dict[str, Any]:
+        """Per-job state (lock held)"""
+        if job_id not in self._jobs:
+            self._jobs[job_id] = {"sequence": 0, "history": deque(maxlen=self.history_size),
+                                  "subscribers": [], "closed": False}
+            # Evict the least recently published jobs nobody is streaming; the
+            # map only exceeds max_jobs while that many jobs have subscribers
+            excess = len(self._jobs) - self.max_jobs
+            if excess > 0:
+                idle = [key for key, state in self._jobs.items()
+                        if not state["subscribers"] and key != job_id][:excess]
+                for key in idle:
+                    del self._jobs[key]
+        return self._jobs[job_id]
+
+    def publish(self, job_id: str, event: Dict[str, Any]):
+        """Send an event to the job's subscribers and keep it for replay"""
+        with self._lock:
+            job = self._job(job_id)
+            self._jobs.move_to_end(job_id)
+            if event.get("type") == "job_running":
+                # A rerun under the same job ID starts a new stream
+                job["closed"] = False
+            job["sequence"] += 1
+            event = dict(event, id=job["sequence"])
+            job["history"].append(event)
+            if event.get("type") in TERMINAL_EVENTS:
+                job["closed"] = True
+            subscribers = list(job["subscribers"])
+
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(event)
+            except queue.Full:
+                logger.warning(f"Dropping slow event subscriber for job {job_id}")
+                subscription.dropped = True
+                self._unsubscribe(subscription)
+
+    def subscribe(self, job_id: str, last_event_id: Optional[int] = None) -> Subscription:
+        """
+        Subscribe to a job's events. Events after last_event_id (all kept
+        events when None) are queued first.
+        """
+        subscription = Subscription(self, job_id, self.max_pending)
+        with self._lock:
+            job = self._job(job_id)
+            missed = [event for event in job["history"]
+                      if last_event_id is None or event["id"] > last_event_id]
+            for event in missed[-self.max_pending:]:
+                subscription.queue.put_nowait(event)
+            job["subscribers"].append(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            job = self._jobs.get(subscription.job_id)
+            if job is not None and subscription in job["subscribers"]:
+                job["subscribers"].remove(subscription)
+
+    def is_closed(self, job_id: str) -> bool:
+        """Whether the job's last published event was terminal"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return job is not None and job["closed"]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "jobs": len(self._jobs),
+                "subscribers": sum(len(job["subscribers"]) for job in self._jobs.values())
+            }
+
+
+def public_event(event: Dict[str, Any]) -> Dict[str, Any]:
+    """The part of an event streamed to clients (full results are fetched from /results)"""
+    public = {key: value for key, value in event.items() if key not in ("worker_id", "results")}
+    if event.get("type") == "job_finished":
+        public["status"] = event["results"]["pipeline_status"]
+    return public
+
+
+def format_sse(event: Dict[str, Any], data: str) -> str:
+    """One server-sent event frame"""
+    lines = []
+    if "id" in event:
+        lines.append(f"id: {event['id']}")
+    lines.append(f"event: {event.get('type', 'message')}")
+    lines.extend(f"data: {line}" for line in data.splitlines() or [""])
+    return "\n".join(lines) + "\n\n"
+
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+CPU inference backends for the IndicBERT and T5 models.
+
+The backend of each model is chosen under model_paths
+("indicbert_backend", "t5_backend"):
+
+    torch        eager PyTorch fp32 (the default)
+    torch_int8   PyTorch dynamic quantization of the Linear layers to int8
+    onnx         exported to ONNX and run by ONNX Runtime with all graph
+                 optimizations enabled
+    onnx_int8    the ONNX export with dynamically quantized int8 weights
+
+Converted models keep the interface the pipeline calls (model(**inputs)
+.logits, model.generate(...)). They are written once to a cache directory
+keyed by the model files, the backend and the library versions. Before a
+converted model is first used its outputs are compared with the fp32
+model's on a fixed set of texts; the report is cached next to the model,
+and a model that fails the check is replaced by the fp32 one unless
+inference_backend.fallback_on_mismatch is off.
+
+The ONNX backends need optimum[onnxruntime]; without it the fp32 model is
+used and an error is logged.
+"""
+import os
+import copy
+import json
+import time
+import shutil
+import difflib
+import logging
+import threading
+from typing import Dict, Any, Callable
+
+import torch
+
+from result_cache import model_identity, make_key
+
+logger = logging.getLogger('audio_pipeline.backends')
+
+BACKENDS = ("torch", "torch_int8", "onnx", "onnx_int8")
+TASKS = ("sequence-classification", "seq2seq")
+
+# Parity inputs: short call-centre style texts in the languages we serve
+PARITY_TEXTS = [
+    "Thank you for calling, how can I help you today?",
+    "My order has not arrived yet and nobody answers my emails.",
+    "The payment went through last week but I never got a confirmation.",
+    "That is really helpful, thank you so much for sorting this out.",
+    "This is the third time I am calling about the same problem.",
+    "मेरा ऑर्डर अभी तक नहीं आया है, कृपया जल्दी जांच करें।",
+    "आपकी मदद के लिए बहुत धन्यवाद, समस्या हल हो गई।",
+    "Please hold on for a moment while I check the shipment status."
+]
+
+_reports = {}
+_reports_lock = threading.Lock()
+
+
+def backend_for(config: Dict[str, Any], name: str) -> str:
+    """The configured backend of model `name` ("indicbert" or "t5")"""
+    backend = config.get("model_paths", {}).get(f"{name}_backend") or "torch"
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}' for {name}; expected one of {BACKENDS}")
+    return backend
+
+
+def backend_reports() -> Dict[str, Any]:
+    """Backend and parity report of each model converted in this process"""
+    with _reports_lock:
+        return copy.deepcopy(_reports)
+
+
+def _library_versions(backend: str) -> Dict[str, str]:
+    versions = {"torch": torch.__version__}
+    if backend.startswith("onnx"):
+        import onnxruntime
+        import optimum.version
+        versions.update(onnxruntime=onnxruntime.__version__, optimum=optimum.version.__version__)
+    return versions
+
+
+def _cache_dir(config: Dict[str, Any], name: str, model_path: str, backend: str) -> str:
+    backend_config = config.get("inference_backend", {})
+    root = backend_config.get("cache_dir") or os.path.join(config["output_dir"], ".model_cache")
+    key = make_key(model=model_identity(model_path), backend=backend, versions=_library_versions(backend),
+                   quantization=backend_config.get("onnx_quantization", "avx2") if backend == "onnx_int8" else None)
+    return os.path.join(root, f"{name}-{backend}-{key[:16]}")
+
+
+def _session_options(config: Dict[str, Any]):
+    import onnxruntime
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    threads = config.get("inference_backend", {}).get("onnx_threads")
+    if threads:
+        options.intra_op_num_threads = threads
+    return options
+
+
+def _ort_class(task: str):
+    from optimum.onnxruntime import ORTModelForSequenceClassification, ORTModelForSeq2SeqLM
+    return ORTModelForSequenceClassification if task == "sequence-classification" else ORTModelForSeq2SeqLM
+
+
+def _temp_path(path: str) -> str:
+    """A sibling of path unique to this process and thread"""
+    return f"{path}.tmp{os.getpid()}-{threading.get_ident()}"
+
+
+def _export_onnx(config: Dict[str, Any], model_path: str, task: str, quantize: bool, output_dir: str):
+    """
+    Export (and optionally quantize) into output_dir, which appears only when
+    complete. Concurrent exporters each use their own temporary directory;
+    the first to finish wins and the others discard theirs.
+    """
+    temp_dir = _temp_path(output_dir)
+    shutil.rmtree(temp_dir, ignore_errors=True)
+    _ort_class(task).from_pretrained(model_path, export=True).save_pretrained(temp_dir)
+
+    if quantize:
+        from optimum.onnxruntime import ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        arch = config.get("inference_backend", {}).get("onnx_quantization", "avx2")
+        quantization_config = getattr(AutoQuantizationConfig, arch)(is_static=False, per_channel=False)
+        # Seq2seq exports have several graphs (encoder, decoder, decoder with past)
+        for file_name in sorted(os.listdir(temp_dir)):
+            if not file_name.endswith(".onnx"):
+                continue
+            quantizer = ORTQuantizer.from_pretrained(temp_dir, file_name=file_name)
+            quantizer.quantize(save_dir=temp_dir, quantization_config=quantization_config)
+            # Keep the original file names so the model loads without file name arguments
+            quantized_name = file_name[:-len(".onnx")] + "_quantized.onnx"
+            os.replace(os.path.join(temp_dir, quantized_name), os.path.join(temp_dir, file_name))
+
+    if os.path.isdir(output_dir) and not os.path.exists(os.path.join(output_dir, "config.json")):
+        # Left incomplete by an older version; completed exports always have config.json
+        shutil.rmtree(output_dir, ignore_errors=True)
+    try:
+        # Fails (the directory is not empty) if another exporter finished first
+        os.rename(temp_dir, output_dir)
+    except OSError:
+        if not os.path.exists(os.path.join(output_dir, "config.json")):
+            raise
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def _classifier_parity(tokenizer, reference, candidate, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Largest difference of positive-class probabilities and label agreement"""
+    inputs = tokenizer(PARITY_TEXTS, padding=True, truncation=True, max_length=128, return_tensors="pt")
+    with torch.no_grad():
+        expected = torch.nn.functional.softmax(reference(**inputs).logits, dim=1)
+        actual = torch.nn.functional.softmax(candidate(**inputs).logits, dim=1)
+    max_diff = float((expected - actual).abs().max())
+    agreement = float((expected.argmax(dim=1) == actual.argmax(dim=1)).float().mean())
+    tolerance = config.get("inference_backend", {}).get("parity_tolerance", 0.05)
+    return {"max_probability_diff": max_diff, "label_agreement": agreement, "tolerance": tolerance,
+            "passed": max_diff <= tolerance}
+
+
+def _seq2seq_parity(tokenizer, reference, candidate, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Token-sequence similarity of greedy summaries"""
+    inputs = tokenizer(["summarize: " + text for text in PARITY_TEXTS], padding=True, truncation=True,
+                       max_length=128, return_tensors="pt")
+    with torch.no_grad():
+        expected = reference.generate(inputs.input_ids, attention_mask=inputs.attention_mask,
+                                      max_length=48, num_beams=1)
+        actual = candidate.generate(inputs.input_ids, attention_mask=inputs.attention_mask,
+                                    max_length=48, num_beams=1)
+    similarities = []
+    for expected_ids, actual_ids in zip(expected.tolist(), actual.tolist()):
+        expected_ids = [token for token in expected_ids if token != tokenizer.pad_token_id]
+        actual_ids = [token for token in actual_ids if token != tokenizer.pad_token_id]
+        similarities.append(difflib.SequenceMatcher(None, expected_ids, actual_ids).ratio())
+    similarity = sum(similarities) / len(similarities)
+    minimum = config.get("inference_backend", {}).get("parity_min_similarity", 0.9)
+    return {"mean_token_similarity": similarity, "min_token_similarity": min(similarities),
+            "minimum": minimum, "passed": similarity >= minimum}
+
+
+def _check_parity(tokenizer, reference, candidate, task: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    start_time = time.time()
+    if task == "sequence-classification":
+        report = _classifier_parity(tokenizer, reference, candidate, config)
+    else:
+        report = _seq2seq_parity(tokenizer, reference, candidate, config)
+    report["check_time"] = time.time() - start_time
+    return report
+
+
+def load_model(config: Dict[str, Any], name: str, model_path: str, tokenizer,
+               load_fp32: Callable[[], Any], task: str):
+    """
+    The model of `name` on its configured backend. load_fp32 loads the eager
+    fp32 model (in eval mode); it is also the reference of the parity check.
+    """
+    backend = backend_for(config, name)
+    if backend == "torch":
+        return load_fp32()
+    if task not in TASKS:
+        raise ValueError(f"Unknown task '{task}'")
+
+    backend_config = config.get("inference_backend", {})
+    try:
+        cache_dir = _cache_dir(config, name, model_path, backend)
+    except ImportError as e:
+        logger.error(f"{backend} backend for {name} needs optimum[onnxruntime] ({str(e)}); using torch fp32")
+        return load_fp32()
+    report_path = os.path.join(cache_dir, "parity.json")
+    report = None
+    if os.path.exists(report_path):
+        with open(report_path, 'r') as f:
+            report = json.load(f)
+    fallback = backend_config.get("fallback_on_mismatch", True)
+    if report is not None and report.get("backend") == backend and not report["passed"] and fallback:
+        # Known to fail: do not load the converted model at all
+        with _reports_lock:
+            _reports[name] = dict(report, cache_dir=cache_dir, active=False)
+        logger.warning(f"{backend} {name} failed its cached parity check; using torch fp32")
+        return load_fp32()
+
+    reference = None
+    if backend == "torch_int8":
+        model_file = os.path.join(cache_dir, "model.pt")
+        if os.path.exists(model_file) and report is not None:
+            model = torch.load(model_file, weights_only=False)
+        else:
+            reference = load_fp32()
+            start_time = time.time()
+            model = torch.quantization.quantize_dynamic(reference, {torch.nn.Linear}, dtype=torch.qint8)
+            logger.info(f"Quantized {name} to int8 in {time.time() - start_time:.1f}s")
+            os.makedirs(cache_dir, exist_ok=True)
+            temp_file = _temp_path(model_file)
+            torch.save(model, temp_file)
+            os.replace(temp_file, model_file)
+        model.eval()
+    else:
+        if not os.path.exists(os.path.join(cache_dir, "config.json")):
+            start_time = time.time()
+            _export_onnx(config, model_path, task, backend == "onnx_int8", cache_dir)
+            logger.info(f"Exported {name} to ONNX ({backend}) in {time.time() - start_time:.1f}s")
+        model = _ort_class(task).from_pretrained(cache_dir, session_options=_session_options(config))
+
+    if report is None or report.get("backend") != backend:
+        reference = reference or load_fp32()
+        report = dict(_check_parity(tokenizer, reference, model, task, config), backend=backend,
+                      checked_at=time.time())
+        temp_file = _temp_path(report_path)
+        with open(temp_file, 'w') as f:
+            json.dump(report, f, indent=2)
+        os.replace(temp_file, report_path)
+        level = logging.INFO if report["passed"] else logging.WARNING
+        logger.log(level, f"Parity of {name} on {backend} against fp32: "
+                          f"{json.dumps({key: value for key, value in report.items() if key != 'checked_at'})}")
+
+    with _reports_lock:
+        _reports[name] = dict(report, cache_dir=cache_dir, active=report["passed"] or not fallback)
+    if not report["passed"] and fallback:
+        logger.warning(f"{backend} {name} failed the parity check; using torch fp32")
+        return reference or load_fp32()
+    return model
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+In-process micro-batching for model inference.
+
+Pipelines running concurrently in one process submit individual items
+(segments to score, chunks to summarize). A background thread collects them
+into batches of at most `max_batch_size`, waiting no longer than
+`max_wait_ms` after the first item arrives, and runs one forward pass per
+batch.
+"""
+import time
+import queue
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Any, List, Callable, Hashable
+
+logger = logging.getLogger('audio_pipeline.batching')
+
+# Number of recent batches kept for the fill and latency metrics
+METRICS_WINDOW = 1000
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class MicroBatcher:
+    def __init__(self,
+                 name: str,
+                 batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 64,
+                 max_wait_ms: float = 20.0):
+        """
+        batch_fn: takes a list of items and returns one result per item
+        max_wait_ms: latency bound between the first item of a batch and its start
+        """
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = deque(maxlen=METRICS_WINDOW)
+        self._totals = {"batches": 0, "items": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._loop, name=f"batcher-{name}", daemon=True)
+        self._thread.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queue one item and return a future for its result"""
+        future = Future()
+        self._queue.put((item, future, time.time()))
+        return future
+
+    def infer(self, items: List[Any]) -> List[Any]:
+        """Queue several items and wait for all their results, in order"""
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def _collect(self) -> List[tuple]:
+        """Block for the first item, then gather more until full or timed out"""
+        batch = [self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                # Take whatever is already waiting without blocking
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            started = time.time()
+            items = [item for item, _, _ in batch]
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(f"{self.name} returned {len(results)} results for {len(items)} items")
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+                failed = False
+            except Exception as e:
+                logger.error(f"Batch of {len(items)} failed in {self.name}: {str(e)}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                failed = True
+
+            finished = time.time()
+            with self._stats_lock:
+                self._totals["batches"] += 1
+                self._totals["items"] += len(items)
+                self._totals["errors"] += int(failed)
+                self._batches.append({
+                    "size": len(items),
+                    "fill": len(items) / self.max_batch_size,
+                    "queue_latency": [started - enqueued for _, _, enqueued in batch],
+                    "compute_time": finished - started
+                })
+
+    def metrics(self) -> Dict[str, Any]:
+        """Per-batch fill and queue-latency metrics over the recent window"""
+        with self._stats_lock:
+            batches = list(self._batches)
+            totals = dict(self._totals)
+
+        fills = [batch["fill"] for batch in batches]
+        latencies = [latency for batch in batches for latency in batch["queue_latency"]]
+        compute = [batch["compute_time"] for batch in batches]
+        return dict(
+            totals,
+            name=self.name,
+            max_batch_size=self.max_batch_size,
+            max_wait_ms=self.max_wait * 1000.0,
+            queued=self._queue.qsize(),
+            window_batches=len(batches),
+            mean_batch_size=(sum(batch["size"] for batch in batches) / len(batches)) if batches else 0.0,
+            mean_fill=(sum(fills) / len(fills)) if fills else 0.0,
+            queue_latency_ms={
+                "p50": _percentile(latencies, 50) * 1000.0,
+                "p95": _percentile(latencies, 95) * 1000.0,
+                "max": max(latencies) * 1000.0 if latencies else 0.0
+            },
+            compute_time_ms={
+                "p50": _percentile(compute, 50) * 1000.0,
+                "p95": _percentile(compute, 95) * 1000.0
+            }
+        )
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(key: Hashable,
+                make_batch_fn: Callable[[], Callable[[List[Any]], List[Any]]],
+                max_batch_size: int = 64,
+                max_wait_ms: float = 20.0) -> MicroBatcher:
+    """Return the process-wide batcher for `key`, creating it on first use"""
+    with _batchers_lock:
+        if key not in _batchers:
+            name = "|".join(str(part) for part in key) if isinstance(key, tuple) else str(key)
+            _batchers[key] = MicroBatcher(name, make_batch_fn(), max_batch_size, max_wait_ms)
+        return _batchers[key]
+
+
+def batching_stats() -> Dict[str, Any]:
+    """Metrics for every batcher in this process"""
+    with _batchers_lock:
+        batchers = list(_batchers.values())
+    return {batcher.name: batcher.metrics() for batcher in batchers}
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Asynchronous job queue for the audio pipeline.
+
+Jobs are queued by the API process and drained by a pool of worker
+processes. Each worker loads the models once at startup and reports job
+and stage transitions back through an event queue.
+"""
+import time
+import queue
+import logging
+import threading
+import multiprocessing
+from typing import Dict, Any, Optional, Callable
+
+logger = logging.getLogger('audio_pipeline.queue')
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while the queue is at its depth limit"""
+
+
+def _send_worker_stats(event_queue, worker_id: int, base_config: Dict[str, Any]):
+    """Report model registry and batching metrics to the API process"""
+    from model_registry import get_registry
+    from inference_server import batching_stats
+    from inference_backends import backend_reports
+
+    event_queue.put({"type": "worker_stats", "worker_id": worker_id, "time": time.time(),
+                     "models": get_registry(base_config).stats(), "batching": batching_stats(),
+                     "backends": backend_reports()})
+
+
+def _worker_loop(worker_id: int, task_queue, event_queue, cancelled, base_config: Dict[str, Any]):
+    """Run jobs from the task queue until a stop sentinel arrives"""
+    from pipeline_coordinator import AudioPipeline
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+
+        job_id = task["job_id"]
+        if cancelled.get(job_id):
+            event_queue.put({"type": "job_cancelled", "job_id": job_id, "worker_id": worker_id,
+                             "time": time.time()})
+            continue
+
+        event_queue.put({"type": "job_running", "job_id": job_id, "worker_id": worker_id,
+                         "time": time.time()})
+
+        def report(event, job_id=job_id):
+            event_queue.put(dict(event, job_id=job_id, worker_id=worker_id))
+
+        try:
+            pipeline = AudioPipeline(
+                task["config"],
+                force_rerun=task.get("force_rerun", False),
+                progress_callback=report,
+                cancel_check=lambda job_id=job_id: bool(cancelled.get(job_id))
+            )
+            results = pipeline.run_pipeline()
+            event_queue.put({"type": "job_finished", "job_id": job_id, "worker_id": worker_id,
+                             "results": results, "time": time.time()})
+        except Exception as e:
+            logger.error(f"Worker {worker_id} failed job {job_id}: {str(e)}")
+            event_queue.put({"type": "job_failed", "job_id": job_id, "worker_id": worker_id,
+                             "error": str(e), "time": time.time()})
+        _send_worker_stats(event_queue, worker_id, base_config)
+
+
+def _worker_main(worker_id: int,
+                 task_queue,
+                 event_queue,
+                 cancelled,
+                 base_config: Dict[str, Any],
+                 preload_models: bool,
+                 jobs_per_worker: int = 1):
+    """
+    Worker process: preload models, then run jobs until told to stop.
+
+    With jobs_per_worker > 1 several jobs share the process (and its models),
+    so the micro-batchers can combine their sentiment and summarization work.
+    """
+    from model_registry import warm_up
+
+    if preload_models:
+        warm_up(base_config)
+    event_queue.put({"type": "worker_ready", "worker_id": worker_id, "time": time.time()})
+    _send_worker_stats(event_queue, worker_id, base_config)
+
+    threads = [
+        threading.Thread(target=_worker_loop, name=f"job-runner-{i}",
+                         args=(worker_id, task_queue, event_queue, cancelled, base_config))
+        for i in range(max(1, jobs_per_worker))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+class JobQueue:
+    def __init__(self,
+                 base_config: Dict[str, Any],
+                 on_event: Callable[[Dict[str, Any]], None],
+                 num_workers: int = 2,
+                 max_queue_depth: int = 50,
+                 start_method: str = "spawn",
+                 preload_models: bool = True,
+                 jobs_per_worker: int = 1):
+        """
+        base_config: pipeline config the workers warm their models up with
+        on_event: called in the API process for every worker event
+        max_queue_depth: jobs waiting for a worker beyond which submit() fails
+        jobs_per_worker: jobs each worker process runs concurrently
+        """
+        self.base_config = base_config
+        self.on_event = on_event
+        self.num_workers = max(1, int(num_workers))
+        self.max_queue_depth = max_queue_depth
+        self.preload_models = preload_models
+        self.jobs_per_worker = max(1, int(jobs_per_worker))
+
+        self._ctx = multiprocessing.get_context(start_method)
+        self._task_queue = None
+        self._event_queue = None
+        self._manager = None
+        self._cancelled = None
+        self._workers = {}
+        self._worker_jobs = {}
+        self._worker_stats = {}
+        self._queued = []
+        self._lock = threading.Lock()
+        self._listener = None
+        self._running = False
+
+    def start(self):
+        """Start the worker processes and the event listener"""
+        with self._lock:
+            if self._running:
+                return
+            self._task_queue = self._ctx.Queue()
+            self._event_queue = self._ctx.Queue()
+            self._manager = self._ctx.Manager()
+            self._cancelled = self._manager.dict()
+            for worker_id in range(self.num_workers):
+                self._start_worker(worker_id)
+            self._running = True
+
+        self._listener = threading.Thread(target=self._listen, name="job-queue-events", daemon=True)
+        self._listener.start()
+        logger.info(f"Started {self.num_workers} pipeline workers")
+
+    def _start_worker(self, worker_id: int):
+        process = self._ctx.Process(
+            target=_worker_main,
+            args=(worker_id, self._task_queue, self._event_queue, self._cancelled,
+                  self.base_config, self.preload_models, self.jobs_per_worker),
+            name=f"pipeline-worker-{worker_id}",
+            daemon=True
+        )
+        process.start()
+        self._workers[worker_id] = process
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the workers after their current job"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            for _ in range(len(self._workers) * self.jobs_per_worker):
+                self._task_queue.put(None)
+        for process in self._workers.values():
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+        self._workers.clear()
+        self._manager.shutdown()
+
+    @property
+    def is_running(self) -> bool:
+        return self._running
+
+    def worker_stats(self) -> Dict[int, Any]:
+        """Latest model and batching metrics reported by each worker"""
+        with self._lock:
+            return dict(self._worker_stats)
+
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker"""
+        with self._lock:
+            return len(self._queued)
+
+    def position(self, job_id: str) -> Optional[int]:
+        """1-based position of a queued job, or None if it is not waiting"""
+        with self._lock:
+            if job_id in self._queued:
+                return self._queued.index(job_id) + 1
+            return None
+
+    def submit(self, job_id: str, job_config: Dict[str, Any], force_rerun: bool = False) -> int:
+        """Queue a job; returns its queue position or raises QueueFullError"""
+        if not self._running:
+            self.start()
+        with self._lock:
+            if self.max_queue_depth is not None and len(self._queued) >= self.max_queue_depth:
+                raise QueueFullError(f"Job queue is full ({len(self._queued)} jobs waiting)")
+            self._queued.append(job_id)
+            position = len(self._queued)
+            self._task_queue.put({"job_id": job_id, "config": job_config, "force_rerun": force_rerun})
+        return position
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Cancel a job. A queued job is dropped when a worker picks it up; a
+        running job stops before its next stage.
+        """
+        if not self._running:
+            return False
+        self._cancelled[job_id] = True
+        return True
+
+    def _listen(self):
+        """Forward worker events to on_event and replace workers that died"""
+        while self._running:
+            try:
+                event = self._event_queue.get(timeout=1.0)
+            except queue.Empty:
+                self._check_workers()
+                continue
+            except (EOFError, OSError):
+                break
+
+            if event["type"] == "worker_stats":
+                with self._lock:
+                    self._worker_stats[event["worker_id"]] = {
+                        "time": event["time"],
+                        "models": event["models"],
+                        "batching": event["batching"],
+                        "backends": event.get("backends", {})
+                    }
+                continue
+
+            job_id = event.get("job_id")
+            with self._lock:
+                if event["type"] in ("job_running", "job_cancelled") and job_id in self._queued:
+                    self._queued.remove(job_id)
+                running = self._worker_jobs.setdefault(event["worker_id"], set())
+                if event["type"] == "job_running":
+                    running.add(job_id)
+                elif event["type"] in ("job_finished", "job_failed", "job_cancelled"):
+                    running.discard(job_id)
+                    if self._cancelled is not None:
+                        self._cancelled.pop(job_id, None)
+
+            try:
+                self.on_event(event)
+            except Exception as e:
+                logger.error(f"Error handling {event['type']} event: {str(e)}")
+
+    def _check_workers(self):
+        """Restart dead workers and fail the jobs they were running"""
+        for worker_id, process in list(self._workers.items()):
+            if process.is_alive() or not self._running:
+                continue
+            logger.error(f"Worker {worker_id} exited with code {process.exitcode}, restarting")
+            with self._lock:
+                job_ids = self._worker_jobs.pop(worker_id, set())
+                self._start_worker(worker_id)
+            for job_id in job_ids:
+                self.on_event({"type": "job_failed", "job_id": job_id, "worker_id": worker_id,
+                               "error": f"Worker exited with code {process.exitcode}",
+                               "time": time.time()})
@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Persistent job records for PipelineAPI.
+
+Job status survives restarts and is shared by every process pointing at
+the same store (e.g. several gunicorn workers on one host). SQLiteJobStore
+is the default: WAL mode lets readers run alongside a writer, and each
+update is a read-modify-write inside an immediate transaction, so
+concurrent event handlers never lose each other's changes. MemoryJobStore
+keeps the old in-process behaviour. Other backends (e.g. for several
+nodes) implement the JobStore interface and are selected in make_job_store.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Optional, List, Callable, Tuple
+
+logger = logging.getLogger('audio_pipeline.jobs')
+
+FINISHED_STATUSES = ("completed", "partially_completed", "failed", "cancelled")
+ACTIVE_STATUSES = ("queued", "running")
+
+# Record fields with their own column; everything else is kept as JSON
+INDEXED_FIELDS = ("status", "submit_time", "start_time", "end_time", "output_dir", "owner")
+
+
+def _process_start(pid: int) -> Optional[str]:
+    """Start time of a process in clock ticks since boot, or None where /proc is not available"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            # Fields after the command name; starttime is field 22 of stat
+            return f.read().rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+# Tells this process apart from an earlier one with the same PID (e.g. PID 1
+# of a restarted container); the start time when it can be read back, else
+# random
+_BOOT_NONCE = _process_start(os.getpid()) or uuid.uuid4().hex
+
+
+def process_owner() -> str:
+    """Identifies this process in job records, for orphan recovery"""
+    return f"{socket.gethostname()}:{os.getpid()}:{_BOOT_NONCE}"
+
+
+def _owner_is_dead(owner: Optional[str]) -> bool:
+    """Whether a job's owning process is known to be gone (same host only)"""
+    if not owner or ":" not in owner:
+        return False
+    if owner == process_owner():
+        return False
+    host, pid, nonce = (owner.split(":", 2) + [None])[:3]
+    if host != socket.gethostname():
+        return False
+    try:
+        pid = int(pid)
+    except ValueError:
+        return False
+    if pid == os.getpid():
+        # Our PID, but an earlier process (or a record from before nonces)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return True
+    except PermissionError:
+        pass
+    # The PID is in use; by the owner only if it started at the same time
+    start = _process_start(pid)
+    return nonce is not None and start is not None and start != nonce
+
+
+class JobStore(ABC):
+    """Interface of a job store. Records are plain dicts keyed by job_id."""
+
+    @abstractmethod
+    def create(self, job_id: str, record: Dict[str, Any]):
+        pass
+
+    @abstractmethod
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def modify(self, job_id: str, mutate: Callable[[Dict[str, Any]], None]) -> Optional[Dict[str, Any]]:
+        """Apply mutate to the record atomically; returns the new record or None"""
+
+    @abstractmethod
+    def delete(self, job_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def list(self, status: Optional[str] = None, limit: int = 50, offset: int = 0,
+             submitted_after: Optional[float] = None) -> Tuple[List[Dict[str, Any]], int]:
+        """A page of records, newest first, and the total matching count"""
+
+    @abstractmethod
+    def expired(self, ttl_s: float) -> List[Dict[str, Any]]:
+        """Finished records whose end_time is older than ttl_s"""
+
+    @abstractmethod
+    def active(self) -> List[Dict[str, Any]]:
+        """Queued and running records"""
+
+
+class MemoryJobStore(JobStore):
+    def __init__(self):
+        """Jobs kept in this process only"""
+        self._jobs = {}
+        self._lock = threading.RLock()
+
+    def create(self, job_id: str, record: Dict[str, Any]):
+        with self._lock:
+            self._jobs[job_id] = json.loads(json.dumps(dict(record, job_id=job_id)))
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            record = self._jobs.get(job_id)
+            return json.loads(json.dumps(record)) if record is not None else None
+
+    def modify(self, job_id: str, mutate: Callable[[Dict[str, Any]], None]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if job_id not in self._jobs:
+                return None
+            mutate(self._jobs[job_id])
+            return json.loads(json.dumps(self._jobs[job_id]))
+
+    def delete(self, job_id: str) -> bool:
+        with self._lock:
+            return self._jobs.pop(job_id, None) is not None
+
+    def list(self, status: Optional[str] = None, limit: int = 50, offset: int = 0,
+             submitted_after: Optional[float] = None) -> Tuple[List[Dict[str, Any]], int]:
+        with self._lock:
+            records = [record for record in self._jobs.values()
+                       if (status is None or record.get("status") == status)
+                       and (submitted_after is None or (record.get("submit_time") or 0) > submitted_after)]
+            records.sort(key=lambda record: record.get("submit_time") or 0, reverse=True)
+            return json.loads(json.dumps(records[offset:offset + limit])), len(records)
+
+    def expired(self, ttl_s: float) -> List[Dict[str, Any]]:
+        cutoff = time.time() - ttl_s
+        with self._lock:
+            return [dict(record) for record in self._jobs.values()
+                    if record.get("status") in FINISHED_STATUSES and (record.get("end_time") or 0) < cutoff]
+
+    def active(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(record) for record in self._jobs.values() if record.get("status") in ACTIVE_STATUSES]
+
+
+class SQLiteJobStore(JobStore):
+    def __init__(self, path: str, busy_timeout_ms: int = 10000):
+        """Jobs in a SQLite database shared by every process on this host"""
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                job_id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                submit_time REAL,
+                start_time REAL,
+                end_time REAL,
+                output_dir TEXT,
+                owner TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS jobs_status_submit ON jobs (status, submit_time);
+            CREATE INDEX IF NOT EXISTS jobs_submit ON jobs (submit_time);
+            CREATE INDEX IF NOT EXISTS jobs_end ON jobs (end_time);
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread; transactions are managed explicitly"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0,
+                                         isolation_level=None)
+            connection.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _row_values(job_id: str, record: Dict[str, Any]) -> tuple:
+        data = {key: value for key, value in record.items() if key not in INDEXED_FIELDS and key != "job_id"}
+        return (job_id,) + tuple(record.get(field) for field in INDEXED_FIELDS) + (json.dumps(data),)
+
+    @staticmethod
+    def _record(row: tuple) -> Dict[str, Any]:
+        record = json.loads(row[-1])
+        record["job_id"] = row[0]
+        record.update(zip(INDEXED_FIELDS, row[1:-1]))
+        return record
+
+    def create(self, job_id: str, record: Dict[str, Any]):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO jobs (job_id, status, submit_time, start_time, end_time, output_dir, owner, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            self._row_values(job_id, record)
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._connection().execute(
+            "SELECT job_id, status, submit_time, start_time, end_time, output_dir, owner, data "
+            "FROM jobs WHERE job_id = ?", (job_id,)
+        ).fetchone()
+        return self._record(row) if row is not None else None
+
+    def modify(self, job_id: str, mutate: Callable[[Dict[str, Any]], None]) -> Optional[Dict[str, Any]]:
+        connection = self._connection()
+        # IMMEDIATE takes the write lock up front, so the read below cannot go stale
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT job_id, status, submit_time, start_time, end_time, output_dir, owner, data "
+                "FROM jobs WHERE job_id = ?", (job_id,)
+            ).fetchone()
+            if row is None:
+                connection.execute("ROLLBACK")
+                return None
+            record = self._record(row)
+            mutate(record)
+            values = self._row_values(job_id, record)
+            connection.execute(
+                "UPDATE jobs SET status = ?, submit_time = ?, start_time = ?, end_time = ?, output_dir = ?, "
+                "owner = ?, data = ? WHERE job_id = ?",
+                values[1:] + (job_id,)
+            )
+            connection.execute("COMMIT")
+            return record
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def delete(self, job_id: str) -> bool:
+        cursor = self._connection().execute("DELETE FROM jobs WHERE job_id = ?", (job_id,))
+        return cursor.rowcount > 0
+
+    def list(self, status: Optional[str] = None, limit: int = 50, offset: int = 0,
+             submitted_after: Optional[float] = None) -> Tuple[List[Dict[str, Any]], int]:
+        conditions, params = [], []
+        if status is not None:
+            conditions.append("status = ?")
+            params.append(status)
+        if submitted_after is not None:
+            conditions.append("submit_time > ?")
+            params.append(submitted_after)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        connection = self._connection()
+        total = connection.execute(f"SELECT COUNT(*) FROM jobs {where}", params).fetchone()[0]
+        rows = connection.execute(
+            "SELECT job_id, status, submit_time, start_time, end_time, output_dir, owner, data "
+            f"FROM jobs {where} ORDER BY submit_time DESC LIMIT ? OFFSET ?",
+            params + [limit, offset]
+        ).fetchall()
+        return [self._record(row) for row in rows], total
+
+    def expired(self, ttl_s: float) -> List[Dict[str, Any]]:
+        placeholders = ", ".join("?" for _ in FINISHED_STATUSES)
+        rows = self._connection().execute(
+            "SELECT job_id, status, submit_time, start_time, end_time, output_dir, owner, data "
+            f"FROM jobs WHERE status IN ({placeholders}) AND end_time < ?",
+            FINISHED_STATUSES + (time.time() - ttl_s,)
+        ).fetchall()
+        return [self._record(row) for row in rows]
+
+    def active(self) -> List[Dict[str, Any]]:
+        placeholders = ", ".join("?" for _ in ACTIVE_STATUSES)
+        rows = self._connection().execute(
+            "SELECT job_id, status, submit_time, start_time, end_time, output_dir, owner, data "
+            f"FROM jobs WHERE status IN ({placeholders})",
+            ACTIVE_STATUSES
+        ).fetchall()
+        return [self._record(row) for row in rows]
+
+
+def make_job_store(config: Dict[str, Any]) -> JobStore:
+    """Build the job store selected by the job_store config section"""
+    store_config = config.get("job_store", {})
+    backend = store_config.get("backend", "sqlite")
+    if backend == "memory":
+        return MemoryJobStore()
+    if backend == "sqlite":
+        path = store_config.get("path") or os.path.join(config["output_dir"], "jobs.db")
+        return SQLiteJobStore(path, busy_timeout_ms=store_config.get("busy_timeout_ms", 10000))
+    raise ValueError(f"Unknown job store backend '{backend}'")
+
+
+def recover_orphans(store: JobStore) -> List[str]:
+    """Mark jobs whose owning process died (e.g. a restart) as failed"""
+    recovered = []
+
+    def fail(record):
+        if record.get("status") in ACTIVE_STATUSES:
+            record["status"] = "failed"
+            record["error"] = "The service restarted before the job finished"
+            record["current_stage"] = None
+            record["stages_running"] = []
+            record["end_time"] = time.time()
+
+    for record in store.active():
+        if _owner_is_dead(record.get("owner")):
+            store.modify(record["job_id"], fail)
+            recovered.append(record["job_id"])
+    if recovered:
+        logger.warning(f"Marked {len(recovered)} interrupted jobs as failed")
+    return recovered
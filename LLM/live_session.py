@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Live call mode: incremental transcription and sentiment of a streamed call.
+
+A LiveSession is fed audio as it arrives (16-bit or float32 PCM, or a
+WebM/Opus stream as browsers' MediaRecorder produces it, decoded by ffmpeg
+through a pipe). An energy VAD with a running noise floor, on the same
+frame levels as the offline VAD, opens an utterance after min_speech_s of
+speech and closes it after end_silence_s of silence (or at
+max_utterance_s). While an utterance is open, Whisper decodes the audio so
+far every partial_interval_s and a "partial" hypothesis is sent; when it
+closes, a "final" decode is sent, then IndicBERT's sentiment of the
+utterance.
+
+Decoding runs on one thread per session. Finals go before partials, and a
+partial that is waiting is replaced by a newer one instead of queueing, so
+a slow decode never builds a backlog: latency stays bounded by about one
+decode. Latencies are measured from the arrival of the audio they cover
+(for finals, the last speech frame) to the message being sent, and are
+reported as percentiles per session and for the process (live_stats).
+"""
+import time
+import uuid
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, Optional, Callable
+
+import numpy as np
+
+from audio_io import StreamDecoder, SAMPLE_RATE
+from vad import frame_levels_db
+from model_registry import get_whisper_model, get_indicbert
+from pipeline_coordinator import score_sentiment_batched, sentiment_label, whisper_decode_options
+
+logger = logging.getLogger('audio_pipeline.live')
+
+INPUT_FORMATS = ("pcm16", "f32", "webm")
+LATENCY_METRICS = ("partial", "final", "sentiment")
+
+
+class SessionLimitError(Exception):
+    """Raised when a live session is started while max_sessions are running"""
+
+
+def _percentiles(values) -> Optional[Dict[str, float]]:
+    if not values:
+        return None
+    values = np.array(values)
+    return {"count": len(values),
+            "p50": float(np.percentile(values, 50)),
+            "p95": float(np.percentile(values, 95)),
+            "p99": float(np.percentile(values, 99)),
+            "max": float(values.max())}
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 1000):
+        """Recent latencies (ms) of each live message type"""
+        self._lock = threading.Lock()
+        self._latencies = {metric: deque(maxlen=window) for metric in LATENCY_METRICS}
+
+    def add(self, metric: str, latency_ms: float):
+        with self._lock:
+            self._latencies[metric].append(latency_ms)
+
+    def stats(self, target_s: Optional[float] = None) -> Dict[str, Any]:
+        with self._lock:
+            latencies = {metric: list(values) for metric, values in self._latencies.items()}
+        stats = {metric: _percentiles(values) for metric, values in latencies.items()}
+        if target_s is not None and latencies["final"]:
+            stats["final_within_target"] = float(np.mean(np.array(latencies["final"]) <= target_s * 1000))
+        return stats
+
+
+_process_latencies = LatencyTracker()
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def live_stats(config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Latency percentiles of every live session in this process, and the sessions running"""
+    live_config = (config or {}).get("live", {})
+    with _sessions_lock:
+        active = len(_sessions)
+    return dict(_process_latencies.stats(live_config.get("latency_target_s")), active_sessions=active,
+                latency_target_s=live_config.get("latency_target_s"))
+
+
+class LiveSession:
+    def __init__(self, config: Dict[str, Any], emit: Callable[[Dict[str, Any]], None],
+                 input_format: str = "pcm16", sample_rate: int = SAMPLE_RATE,
+                 language: Optional[str] = None, sentiment: Optional[bool] = None):
+        """
+        A live call; emit(message) is called from the session's threads with
+        each partial, final and sentiment message
+        """
+        live_config = config.get("live", {})
+        if input_format not in INPUT_FORMATS:
+            raise ValueError(f"Unknown live input format '{input_format}'; expected one of {INPUT_FORMATS}")
+        if sample_rate <= 0:
+            raise ValueError("sample_rate must be positive")
+
+        self.config = config
+        self.live_config = live_config
+        self.emit_callback = emit
+        self.input_format = input_format
+        self.input_rate = sample_rate
+        self.language = language or live_config.get("language")
+        self.sentiment = live_config.get("sentiment", True) if sentiment is None else sentiment
+        self.session_id = str(uuid.uuid4())
+        self.latencies = LatencyTracker(live_config.get("latency_window", 1000))
+        self.started = time.time()
+
+        with _sessions_lock:
+            if len(_sessions) >= live_config.get("max_sessions", 4):
+                raise SessionLimitError(f"{len(_sessions)} live sessions are running")
+            _sessions[self.session_id] = self
+
+        # VAD state; times are seconds of received audio
+        self.frame_samples = int(SAMPLE_RATE * live_config.get("frame_ms", 30) / 1000)
+        self._frame_s = self.frame_samples / SAMPLE_RATE
+        self._levels = deque(maxlen=max(1, int(live_config.get("noise_window_s", 10.0) / self._frame_s)))
+        self._pending = np.zeros(0, dtype=np.float32)
+        self._pre_roll = deque(maxlen=max(1, int(live_config.get("pre_roll_s", 0.3) / self._frame_s)))
+        self._samples_in = 0
+        self._speech_run = 0
+        self._silence_run = 0
+        self._utterance = None
+        self._utterances = 0
+        self._prompt = None
+
+        # Decode queue: finals in order, at most one (the newest) partial
+        self._lock = threading.Condition()
+        self._finals = deque()
+        self._partial = None
+        self._closing = False
+        self._resample_position = 0.0
+        # Bytes of a sample split across two fed chunks
+        self._remainder = b""
+        self._decoder = None
+        try:
+            self._whisper = get_whisper_model(config, live_config.get("whisper_model", "base"))
+            self._worker = threading.Thread(target=self._run, name=f"live-{self.session_id[:8]}", daemon=True)
+            self._worker.start()
+            if input_format == "webm":
+                self._decoder = StreamDecoder(None, on_samples=self._on_samples, read_size=4096,
+                                              input_options=["-fflags", "nobuffer", "-probesize", "32768"])
+        except BaseException:
+            # Give back the session slot and stop the worker
+            with self._lock:
+                self._closing = True
+                self._lock.notify()
+            with _sessions_lock:
+                _sessions.pop(self.session_id, None)
+            raise
+        logger.info(f"Live session {self.session_id} started ({input_format} at {sample_rate} Hz)")
+
+    def emit(self, message: Dict[str, Any]):
+        try:
+            self.emit_callback(dict(message, session_id=self.session_id))
+        except Exception as e:
+            # The client went away; the session is closed by its owner
+            logger.debug(f"Live session {self.session_id} could not send {message['type']}: {str(e)}")
+
+    # Audio input
+
+    def feed(self, data: bytes):
+        """Add a chunk of audio in the session's input format"""
+        if self._decoder is not None:
+            self._decoder.feed(data)
+            return
+        sample_width = 2 if self.input_format == "pcm16" else 4
+        data = self._remainder + data
+        usable = len(data) - len(data) % sample_width
+        self._remainder = data[usable:]
+        if self.input_format == "pcm16":
+            samples = np.frombuffer(data[:usable], dtype='<i2').astype(np.float32) / 32768.0
+        else:
+            samples = np.frombuffer(data[:usable], dtype='<f4')
+        if self.input_rate != SAMPLE_RATE:
+            samples = self._resample(samples)
+        self._on_samples(samples)
+
+    def _resample(self, samples: np.ndarray) -> np.ndarray:
+        """Linear resampling to 16 kHz, continuous across chunks"""
+        if len(samples) == 0:
+            return np.zeros(0, dtype=np.float32)
+        step = self.input_rate / SAMPLE_RATE
+        positions = np.arange(self._resample_position, len(samples), step)
+        self._resample_position = positions[-1] + step - len(samples) if len(positions) else \
+            self._resample_position - len(samples)
+        return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+    def _on_samples(self, samples: np.ndarray):
+        samples = np.concatenate([self._pending, samples]) if len(self._pending) else samples
+        num_frames = len(samples) // self.frame_samples
+        self._pending = samples[num_frames * self.frame_samples:].copy()
+        if num_frames == 0:
+            return
+        frames = samples[:num_frames * self.frame_samples].reshape(num_frames, self.frame_samples)
+        now = time.time()
+        for frame, level in zip(frames, frame_levels_db(frames.reshape(-1), self.frame_samples)):
+            self._samples_in += self.frame_samples
+            self._on_frame(np.array(frame), float(level), now)
+
+    def _threshold(self) -> float:
+        min_threshold = self.live_config.get("min_threshold_db", -50.0)
+        # The noise floor needs a second of audio before it means anything
+        if len(self._levels) * self._frame_s < 1.0:
+            return min_threshold
+        floor = float(np.percentile(self._levels, 10))
+        return max(floor + self.live_config.get("margin_db", 12.0), min_threshold)
+
+    def _on_frame(self, frame: np.ndarray, level: float, now: float):
+        is_speech = level > self._threshold()
+        # Only non-speech frames move the noise floor, or a long turn would raise it to the speech level
+        if not is_speech:
+            self._levels.append(level)
+        position = self._samples_in / SAMPLE_RATE
+        min_speech_frames = max(1, int(self.live_config.get("min_speech_s", 0.25) / self._frame_s))
+        end_silence_frames = max(1, int(self.live_config.get("end_silence_s", 0.5) / self._frame_s))
+
+        if self._utterance is None:
+            self._pre_roll.append(frame)
+            self._speech_run = self._speech_run + 1 if is_speech else 0
+            if self._speech_run >= min_speech_frames:
+                # Open with the frames before the onset, which hold its start
+                self._utterance = {
+                    "index": self._utterances,
+                    "frames": list(self._pre_roll),
+                    "start": position - len(self._pre_roll) * self._frame_s,
+                    "speech_end": position,
+                    "speech_end_wall": now,
+                    "last_partial": position
+                }
+                self._utterances += 1
+                self._pre_roll.clear()
+                self._silence_run = 0
+            return
+
+        utterance = self._utterance
+        utterance["frames"].append(frame)
+        if is_speech:
+            self._silence_run = 0
+            utterance["speech_end"] = position
+            utterance["speech_end_wall"] = now
+        else:
+            self._silence_run += 1
+
+        length = len(utterance["frames"]) * self._frame_s
+        if self._silence_run >= end_silence_frames or length >= self.live_config.get("max_utterance_s", 15.0):
+            self._close_utterance(now)
+        elif position - utterance["last_partial"] >= self.live_config.get("partial_interval_s", 1.0):
+            utterance["last_partial"] = position
+            self._submit(partial={"index": utterance["index"], "audio": np.concatenate(utterance["frames"]),
+                                  "start": utterance["start"], "end": position, "arrived": now})
+
+    def _close_utterance(self, now: float):
+        utterance, self._utterance = self._utterance, None
+        self._speech_run = self._silence_run = 0
+        # Keep a little of the trailing silence, as the offline VAD pads its regions
+        keep = int(round((utterance["speech_end"] - utterance["start"]) / self._frame_s)) + \
+            int(self.live_config.get("pad_s", 0.2) / self._frame_s)
+        self._submit(final={"index": utterance["index"], "audio": np.concatenate(utterance["frames"][:keep]),
+                            "start": utterance["start"], "end": utterance["speech_end"],
+                            "arrived": utterance["speech_end_wall"], "closed": now})
+
+    def _submit(self, partial: Optional[Dict[str, Any]] = None, final: Optional[Dict[str, Any]] = None):
+        with self._lock:
+            if final is not None:
+                self._finals.append(final)
+                # Partials of a closed utterance are no longer wanted
+                if self._partial is not None and self._partial["index"] == final["index"]:
+                    self._partial = None
+            elif partial is not None:
+                self._partial = partial
+            self._lock.notify()
+
+    # Decoding
+
+    def _transcribe(self, audio: np.ndarray) -> str:
+        options = dict(whisper_decode_options(self.live_config), language=self.language,
+                       condition_on_previous_text=False, without_timestamps=True, fp16=False)
+        if self._prompt:
+            options["initial_prompt"] = self._prompt
+        return self._whisper.transcribe(audio, **options)["text"].strip()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._finals and self._partial is None and not self._closing:
+                    self._lock.wait()
+                if self._finals:
+                    job, is_final = self._finals.popleft(), True
+                elif self._partial is not None:
+                    job, is_final, self._partial = self._partial, False, None
+                else:
+                    return
+            try:
+                self._decode(job, is_final)
+            except Exception as e:
+                logger.error(f"Live session {self.session_id} failed to decode utterance {job['index']}: {str(e)}")
+                self.emit({"type": "error", "utterance": job["index"], "error": str(e)})
+
+    def _decode(self, job: Dict[str, Any], is_final: bool):
+        start_time = time.time()
+        text = self._transcribe(job["audio"])
+        decode_ms = (time.time() - start_time) * 1000
+        if not is_final:
+            with self._lock:
+                # The utterance closed while this was decoding; its final is on the way
+                if any(final["index"] == job["index"] for final in self._finals):
+                    return
+            latency_ms = (time.time() - job["arrived"]) * 1000
+            self._record("partial", latency_ms)
+            self.emit({"type": "partial", "utterance": job["index"], "start": job["start"], "end": job["end"],
+                       "text": text, "latency_ms": latency_ms, "decode_ms": decode_ms})
+            return
+
+        latency_ms = (time.time() - job["arrived"]) * 1000
+        self._record("final", latency_ms)
+        if text:
+            self._prompt = ((self._prompt + " " + text) if self._prompt else text)[-200:]
+        self.emit({"type": "final", "utterance": job["index"], "start": job["start"], "end": job["end"],
+                   "text": text, "latency_ms": latency_ms, "decode_ms": decode_ms,
+                   "endpoint_ms": (job["closed"] - job["arrived"]) * 1000})
+        if not (self.sentiment and text):
+            return
+
+        start_time = time.time()
+        tokenizer, model = get_indicbert(self.config)
+        score = score_sentiment_batched(tokenizer, model, [text], batch_size=1,
+                                        max_length=self.config.get("sentiment", {}).get("max_length", 512))[0]
+        latency_ms = (time.time() - job["arrived"]) * 1000
+        self._record("sentiment", latency_ms)
+        self.emit({"type": "sentiment", "utterance": job["index"], "text": text,
+                   "sentiment": sentiment_label(score), "sentiment_score": score,
+                   "latency_ms": latency_ms, "model_ms": (time.time() - start_time) * 1000})
+
+    def _record(self, metric: str, latency_ms: float):
+        self.latencies.add(metric, latency_ms)
+        _process_latencies.add(metric, latency_ms)
+        target_s = self.live_config.get("latency_target_s")
+        if metric == "final" and target_s and latency_ms > target_s * 1000:
+            logger.warning(f"Live session {self.session_id}: final took {latency_ms:.0f}ms "
+                           f"(target {target_s * 1000:.0f}ms)")
+
+    # Lifecycle
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(self.latencies.stats(self.live_config.get("latency_target_s")),
+                    session_id=self.session_id, utterances=self._utterances,
+                    audio_s=self._samples_in / SAMPLE_RATE, wall_s=time.time() - self.started)
+
+    def close(self, timeout: Optional[float] = 30.0) -> Dict[str, Any]:
+        """Finish the open utterance, wait for its results and send the session's latency stats"""
+        try:
+            if self._decoder is not None:
+                try:
+                    self._decoder.close()
+                except RuntimeError as e:
+                    logger.warning(f"Live session {self.session_id}: {str(e)}")
+            if self._utterance is not None:
+                self._close_utterance(time.time())
+            with self._lock:
+                self._closing = True
+                self._lock.notify()
+            self._worker.join(timeout)
+            stats = self.stats()
+            self.emit({"type": "stats", **stats})
+            logger.info(f"Live session {self.session_id} closed after {stats['audio_s']:.1f}s of audio, "
+                        f"{stats['utterances']} utterances, final latency {stats['final']}")
+            return stats
+        finally:
+            with _sessions_lock:
+                _sessions.pop(self.session_id, None)
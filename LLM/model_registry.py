@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Process-wide model registry for the audio pipeline.
+
+Whisper, the SpeechBrain diarizer, IndicBERT and T5 are loaded once per
+process and shared by every AudioPipeline instance. Entries are kept in LRU
+order and evicted when the estimated resident size goes over the memory
+budget.
+"""
+import os
+import time
+import threading
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Callable, Hashable
+
+logger = logging.getLogger('audio_pipeline.models')
+
+DEFAULT_MEMORY_BUDGET_MB = 4096
+WARMUP_MODELS = ["whisper", "diarization", "indicbert", "t5"]
+DIARIZATION_SOURCE = "speechbrain/speaker-diarization-3x-ECAPA-TDNN"
+DIARIZATION_SAVEDIR = "pretrained_models/speaker-diarization-3x-ECAPA-TDNN"
+SPEAKER_ENCODER_SOURCE = "speechbrain/spkrec-ecapa-voxceleb"
+SPEAKER_ENCODER_SAVEDIR = "pretrained_models/spkrec-ecapa-voxceleb"
+T5_TOKENIZER = "t5-base"
+
+
+def _estimate_size_bytes(obj: Any) -> int:
+    """Estimate the memory held by a model (parameters and buffers)"""
+    if isinstance(obj, (tuple, list)):
+        return sum(_estimate_size_bytes(item) for item in obj)
+
+    size = 0
+    # SpeechBrain pretrained interfaces keep their networks in `mods`
+    modules = getattr(obj, "mods", None)
+    if modules is not None and hasattr(modules, "values"):
+        return sum(_estimate_size_bytes(module) for module in modules.values())
+
+    # ONNX Runtime models hold their weights in the session; use the graph files' size
+    save_dir = getattr(obj, "model_save_dir", None)
+    if save_dir is not None and os.path.isdir(str(save_dir)):
+        return sum(os.path.getsize(os.path.join(str(save_dir), name)) for name in os.listdir(str(save_dir))
+                   if name.endswith((".onnx", ".onnx_data")))
+
+    if hasattr(obj, "parameters"):
+        try:
+            for param in obj.parameters():
+                size += param.numel() * param.element_size()
+            for buf in obj.buffers():
+                size += buf.numel() * buf.element_size()
+        except Exception:
+            pass
+    return size
+
+
+# Per-thread totals of model load time, for stage metrics
+_load_tracking = threading.local()
+
+
+@contextmanager
+def track_load_time():
+    """Accumulate the time this thread spends loading (or waiting for) models"""
+    previous = getattr(_load_tracking, "totals", None)
+    totals = {"load_time": 0.0}
+    _load_tracking.totals = totals
+    try:
+        yield totals
+    finally:
+        _load_tracking.totals = previous
+
+
+def _add_load_time(seconds: float):
+    totals = getattr(_load_tracking, "totals", None)
+    if totals is not None:
+        totals["load_time"] += seconds
+
+
+class ModelRegistry:
+    def __init__(self, memory_budget_mb: Optional[float] = DEFAULT_MEMORY_BUDGET_MB):
+        """Initialize an empty registry with the given memory budget"""
+        self.memory_budget_bytes = int(memory_budget_mb * 1024 * 1024) if memory_budget_mb else None
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._load_locks = {}
+        self._stats = {}
+
+    def _stats_for(self, key: Hashable) -> Dict[str, Any]:
+        name = self._key_name(key)
+        if name not in self._stats:
+            self._stats[name] = {
+                "hits": 0,
+                "misses": 0,
+                "loads": 0,
+                "evictions": 0,
+                "load_time_total": 0.0,
+                "last_load_time": None,
+                "size_mb": 0.0
+            }
+        return self._stats[name]
+
+    @staticmethod
+    def _key_name(key: Hashable) -> str:
+        if isinstance(key, tuple):
+            return "|".join(str(part) for part in key)
+        return str(key)
+
+    def get(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the model for `key`, loading it with `loader` on a miss"""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._stats_for(key)["hits"] += 1
+                return self._entries[key]["model"]
+            self._stats_for(key)["misses"] += 1
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+
+        # Only one thread loads a given model; different models load concurrently
+        wait_start = time.time()
+        with load_lock:
+            with self._lock:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    # Another thread loaded it while this one waited
+                    _add_load_time(time.time() - wait_start)
+                    return self._entries[key]["model"]
+
+            logger.info(f"Loading model {self._key_name(key)}...")
+            start_time = time.time()
+            model = loader()
+            load_time = time.time() - start_time
+            size_bytes = _estimate_size_bytes(model)
+            logger.info(f"Loaded model {self._key_name(key)} in {load_time:.2f} seconds "
+                        f"({size_bytes / (1024 * 1024):.1f} MB)")
+
+            with self._lock:
+                self._entries[key] = {"model": model, "size_bytes": size_bytes, "load_time": load_time}
+                stats = self._stats_for(key)
+                stats["loads"] += 1
+                stats["load_time_total"] += load_time
+                stats["last_load_time"] = load_time
+                stats["size_mb"] = size_bytes / (1024 * 1024)
+                self._evict_over_budget(keep=key)
+            _add_load_time(time.time() - wait_start)
+            return model
+
+    def _evict_over_budget(self, keep: Hashable):
+        """Drop least recently used models until the budget is met (lock held)"""
+        if self.memory_budget_bytes is None:
+            return
+        total = sum(entry["size_bytes"] for entry in self._entries.values())
+        for key in list(self._entries.keys()):
+            if total <= self.memory_budget_bytes:
+                break
+            if key == keep:
+                continue
+            entry = self._entries.pop(key)
+            total -= entry["size_bytes"]
+            self._stats_for(key)["evictions"] += 1
+            logger.info(f"Evicted model {self._key_name(key)} to stay within memory budget")
+
+    def evict(self, key: Hashable) -> bool:
+        """Remove a model from the registry"""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._entries.pop(key)
+            self._stats_for(key)["evictions"] += 1
+            return True
+
+    def clear(self):
+        """Remove all models (statistics are kept)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return per-model hit/miss and load-time statistics"""
+        with self._lock:
+            resident = {self._key_name(key) for key in self._entries}
+            total_bytes = sum(entry["size_bytes"] for entry in self._entries.values())
+            models = {}
+            for name, stats in self._stats.items():
+                models[name] = dict(stats, resident=name in resident)
+            return {
+                "memory_budget_mb": (self.memory_budget_bytes / (1024 * 1024)
+                                     if self.memory_budget_bytes is not None else None),
+                "resident_mb": total_bytes / (1024 * 1024),
+                "models": models
+            }
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_registry(config: Optional[Dict[str, Any]] = None) -> ModelRegistry:
+    """Return the process-wide registry, creating it on first use"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            registry_config = (config or {}).get("model_registry", {})
+            _registry = ModelRegistry(
+                memory_budget_mb=registry_config.get("memory_budget_mb", DEFAULT_MEMORY_BUDGET_MB)
+            )
+        return _registry
+
+
+# Loaders replacing the real ones, e.g. the benchmark suite's stand-in models
+_loader_overrides = {}
+
+
+def override_loader(name: str, loader: Optional[Callable[..., Any]]):
+    """
+    Load model `name` (a MODEL_GETTERS key) with loader(config, **kwargs)
+    instead of the real loader; None restores the real one. Only models
+    loaded afterwards are affected.
+    """
+    if loader is None:
+        _loader_overrides.pop(name, None)
+    else:
+        _loader_overrides[name] = loader
+
+
+def _loader_for(name: str, loader: Callable[[], Any], config: Dict[str, Any], **kwargs) -> Callable[[], Any]:
+    override = _loader_overrides.get(name)
+    if override is None:
+        return loader
+    return lambda: override(config, **kwargs)
+
+
+def get_whisper_model(config: Dict[str, Any], model_name: str = "base"):
+    """Return a shared Whisper model"""
+    download_root = os.path.dirname(config["model_paths"]["whisper"])
+
+    def loader():
+        import whisper
+        return whisper.load_model(model_name, download_root=download_root)
+
+    return get_registry(config).get(("whisper", model_name, download_root),
+                                    _loader_for("whisper", loader, config, model_name=model_name))
+
+
+def get_diarization_model(config: Dict[str, Any]):
+    """Return a shared SpeechBrain speaker diarization model"""
+    def loader():
+        from speechbrain.pretrained import SpeakerDiarization
+        return SpeakerDiarization.from_hparams(source=DIARIZATION_SOURCE, savedir=DIARIZATION_SAVEDIR)
+
+    return get_registry(config).get(("diarization", DIARIZATION_SOURCE),
+                                    _loader_for("diarization", loader, config))
+
+
+def get_speaker_encoder(config: Dict[str, Any]):
+    """Return a shared SpeechBrain ECAPA speaker encoder (192-dim embeddings)"""
+    def loader():
+        from speechbrain.pretrained import EncoderClassifier
+        return EncoderClassifier.from_hparams(source=SPEAKER_ENCODER_SOURCE, savedir=SPEAKER_ENCODER_SAVEDIR)
+
+    return get_registry(config).get(("speaker_encoder", SPEAKER_ENCODER_SOURCE),
+                                    _loader_for("speaker_encoder", loader, config))
+
+
+def get_indicbert(config: Dict[str, Any]):
+    """Return a shared (tokenizer, model) pair for IndicBERT sentiment, on the configured backend"""
+    tokenizer_path = config["model_paths"]["indicbert_tokenizer"]
+    model_path = config["model_paths"]["indicbert_model"]
+    backend = config["model_paths"].get("indicbert_backend") or "torch"
+
+    def loader():
+        from transformers import AutoTokenizer, AutoModelForSequenceClassification
+        from inference_backends import load_model
+        tokenizer = AutoTokenizer.from_pretrained(tokenizer_path)
+        model = load_model(config, "indicbert", model_path, tokenizer,
+                           lambda: AutoModelForSequenceClassification.from_pretrained(model_path).eval(),
+                           task="sequence-classification")
+        return tokenizer, model
+
+    return get_registry(config).get(("indicbert", tokenizer_path, model_path, backend),
+                                    _loader_for("indicbert", loader, config))
+
+
+def get_t5(config: Dict[str, Any]):
+    """Return a shared (tokenizer, model) pair for T5 summarization, on the configured backend"""
+    model_path = config["model_paths"]["t5_model"]
+    backend = config["model_paths"].get("t5_backend") or "torch"
+
+    def loader():
+        from transformers import T5ForConditionalGeneration, T5TokenizerFast
+        from inference_backends import load_model
+        # The fast tokenizer provides the offsets used for chunking
+        tokenizer = T5TokenizerFast.from_pretrained(T5_TOKENIZER)
+        model = load_model(config, "t5", model_path, tokenizer,
+                           lambda: T5ForConditionalGeneration.from_pretrained(model_path).eval(),
+                           task="seq2seq")
+        return tokenizer, model
+
+    return get_registry(config).get(("t5", model_path, backend), _loader_for("t5", loader, config))
+
+
+MODEL_GETTERS = {
+    "whisper": get_whisper_model,
+    "diarization": get_diarization_model,
+    "speaker_encoder": get_speaker_encoder,
+    "indicbert": get_indicbert,
+    "t5": get_t5
+}
+
+
+def warm_up(config: Dict[str, Any], models: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Load the given models (default: WARMUP_MODELS) so the first job does not pay for it"""
+    if models is None:
+        models = config.get("model_registry", {}).get("warm_up", WARMUP_MODELS)
+
+    for name in models:
+        if name not in MODEL_GETTERS:
+            logger.warning(f"Unknown model '{name}' in warm-up list")
+            continue
+        try:
+            MODEL_GETTERS[name](config)
+        except Exception as e:
+            # A missing model should not stop the service; the stage will report it
+            logger.error(f"Warm-up of {name} failed: {str(e)}")
+
+    return get_registry(config).stats()
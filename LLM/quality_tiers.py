@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Named quality tiers and the load-adaptive policy that picks one per job.
+
+A tier is a set of config overrides (Whisper model size, temperature and
+beam settings, T5 beams and max_length, whether sentiment runs), applied to
+a job's config section by section when it is submitted. Tiers are listed
+fastest first in quality_tiers.order.
+
+With quality_tiers.default set to "auto", TierPolicy estimates each tier's
+turnaround for a new job: the queue ahead of it drained by the workers at
+that tier's recent job time, plus the job's own processing time. It picks
+the most accurate tier that meets target_turnaround_s, or the fastest one
+when none does. Job times are moving averages of the finished jobs, seeded
+from expected_job_s.
+"""
+import copy
+import math
+import threading
+import logging
+from typing import Dict, Any, Optional, Tuple
+
+logger = logging.getLogger('audio_pipeline.tiers')
+
+AUTO_TIER = "auto"
+
+
+def tier_names(config: Dict[str, Any]) -> list:
+    """Configured tiers, fastest first"""
+    tiers_config = config.get("quality_tiers", {})
+    return tiers_config.get("order") or list(tiers_config.get("tiers", {}).keys())
+
+
+def apply_tier(config: Dict[str, Any], name: str, selection: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Copy of the config with the tier's overrides applied and the choice recorded in config["quality_tier"]"""
+    tiers = config.get("quality_tiers", {}).get("tiers", {})
+    if name not in tiers:
+        raise ValueError(f"Unknown quality tier '{name}'; expected one of {tier_names(config)}")
+    tiered = copy.deepcopy(config)
+    for section, values in tiers[name].items():
+        if isinstance(values, dict) and isinstance(tiered.get(section), dict):
+            tiered[section].update(copy.deepcopy(values))
+        else:
+            tiered[section] = copy.deepcopy(values)
+    tiered["quality_tier"] = dict(selection or {}, name=name)
+    return tiered
+
+
+class TierPolicy:
+    def __init__(self, config: Dict[str, Any]):
+        """Per-tier moving averages of job wall time and real-time factor"""
+        tiers_config = config.get("quality_tiers", {})
+        self.order = tier_names(config)
+        auto_config = tiers_config.get("auto", {})
+        self.target_turnaround_s = auto_config.get("target_turnaround_s", 600)
+        self.alpha = auto_config.get("ewma_alpha", 0.2)
+        expected = auto_config.get("expected_job_s", {})
+        self._lock = threading.Lock()
+        self._job_s = {name: float(expected.get(name, 60.0)) for name in self.order}
+        self._rtf = {}
+
+    def observe(self, tier: Optional[str], job_s: Optional[float], audio_s: Optional[float] = None):
+        """Fold a finished job's wall time into its tier's averages"""
+        if tier not in self._job_s or not job_s:
+            return
+        with self._lock:
+            self._job_s[tier] += self.alpha * (job_s - self._job_s[tier])
+            if audio_s:
+                rtf = job_s / audio_s
+                previous = self._rtf.get(tier)
+                self._rtf[tier] = rtf if previous is None else previous + self.alpha * (rtf - previous)
+
+    def estimate(self, tier: str, queue_depth: int, num_workers: int, audio_s: Optional[float] = None) -> float:
+        """Seconds from submission to results for a new job at this tier"""
+        with self._lock:
+            job_s = self._job_s[tier]
+            rtf = self._rtf.get(tier)
+        own_s = rtf * audio_s if (rtf is not None and audio_s) else job_s
+        # Jobs ahead are drained num_workers at a time
+        return math.ceil(queue_depth / max(1, num_workers)) * job_s + own_s
+
+    def choose(self, queue_depth: int, num_workers: int, audio_s: Optional[float] = None) -> Tuple[str, Dict[str, Any]]:
+        """The most accurate tier expected to meet the turnaround target, and why"""
+        estimates = {tier: self.estimate(tier, queue_depth, num_workers, audio_s) for tier in self.order}
+        meeting = [tier for tier in self.order if estimates[tier] <= self.target_turnaround_s]
+        tier = meeting[-1] if meeting else self.order[0]
+        return tier, {
+            "selected_by": AUTO_TIER,
+            "queue_depth": queue_depth,
+            "target_turnaround_s": self.target_turnaround_s,
+            "estimated_turnaround_s": round(estimates[tier], 1)
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"target_turnaround_s": self.target_turnaround_s,
+                    "job_s": dict(self._job_s), "rtf": dict(self._rtf)}
@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Content-addressed cache of stage outputs, shared across jobs.
+
+An entry is keyed by a hash of the audio content, the stage name, the
+identity of the models it uses and its parameters (plus the keys of the
+stages it depends on), so a re-uploaded call reuses earlier work while any
+model or config change misses. Entries are evicted least recently used
+first once the cache grows past its size budget.
+"""
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Dict, Any, Optional
+
+logger = logging.getLogger('audio_pipeline.cache')
+
+MANIFEST = "manifest.json"
+# Other processes also store into the cache; their additions are only seen
+# when the directory is walked, which happens at least this often
+RESCAN_INTERVAL_S = 300
+# Eviction frees down to this share of the budget, so a full cache is not
+# walked again on every store
+LOW_WATER = 0.9
+
+
+def hash_file(path: str, block_size: int = 1 << 20) -> str:
+    """SHA-256 of a file's content, read in blocks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def model_identity(path_or_name: str) -> str:
+    """
+    Identify a model by name plus, for local paths, the size and mtime of its
+    files, so retraining a model in place invalidates its cached outputs.
+    """
+    if not os.path.exists(path_or_name):
+        return path_or_name
+    if os.path.isfile(path_or_name):
+        stat = os.stat(path_or_name)
+        return f"{path_or_name}:{stat.st_size}:{int(stat.st_mtime)}"
+    parts = [path_or_name]
+    for name in sorted(os.listdir(path_or_name)):
+        full_path = os.path.join(path_or_name, name)
+        if os.path.isfile(full_path):
+            stat = os.stat(full_path)
+            parts.append(f"{name}:{stat.st_size}:{int(stat.st_mtime)}")
+    return "|".join(parts)
+
+
+def make_key(**parts) -> str:
+    """Stable hash of the key parts (JSON with sorted keys)"""
+    encoded = json.dumps(parts, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, root: str, max_size_mb: float = 10240):
+        """Cache rooted at `root`, evicting beyond max_size_mb"""
+        self.root = root
+        self.max_size_bytes = int(max_size_mb * 1024 * 1024)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        # Size as of the last directory walk plus this process's stores since
+        self._total_size = None
+        self._scanned_at = 0.0
+        os.makedirs(root, exist_ok=True)
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def fetch(self, key: str, outputs: Dict[str, str]) -> Optional[Dict[str, Any]]:
+        """
+        Copy a cached entry's files to the given paths ({name: destination}).
+        Returns the entry's stored details on a hit, None on a miss.
+        """
+        entry_dir = self._entry_dir(key)
+        manifest_path = os.path.join(entry_dir, MANIFEST)
+        try:
+            with open(manifest_path, 'r') as f:
+                manifest = json.load(f)
+            if set(manifest["files"]) != set(outputs):
+                raise FileNotFoundError("cached outputs do not match")
+            for name, destination in outputs.items():
+                os.makedirs(os.path.dirname(destination) or ".", exist_ok=True)
+                # Copies, not links: stages rewrite their outputs in place
+                shutil.copyfile(os.path.join(entry_dir, name), destination)
+            # The manifest mtime is the entry's last use, for LRU eviction
+            os.utime(manifest_path)
+        except (OSError, ValueError, KeyError):
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        with self._lock:
+            self.stats["hits"] += 1
+        return manifest.get("details", {})
+
+    def store(self, key: str, outputs: Dict[str, str], details: Optional[Dict[str, Any]] = None) -> bool:
+        """Add an entry from the given files ({name: source path})"""
+        entry_dir = self._entry_dir(key)
+        if os.path.exists(os.path.join(entry_dir, MANIFEST)):
+            return False
+
+        parent = os.path.dirname(entry_dir)
+        os.makedirs(parent, exist_ok=True)
+        # Build the entry beside its final place, then rename it in atomically
+        temp_dir = tempfile.mkdtemp(prefix=".tmp_", dir=parent)
+        try:
+            size = 0
+            for name, source in outputs.items():
+                shutil.copyfile(source, os.path.join(temp_dir, name))
+                size += os.path.getsize(source)
+            with open(os.path.join(temp_dir, MANIFEST), 'w') as f:
+                json.dump({"files": list(outputs), "size": size, "created": time.time(),
+                           "details": details or {}}, f)
+            os.rename(temp_dir, entry_dir)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(temp_dir, ignore_errors=True)
+            return False
+
+        with self._lock:
+            self.stats["stores"] += 1
+            if self._total_size is not None:
+                self._total_size += size
+            over_budget = self._total_size is None or self._total_size > self.max_size_bytes
+            stale = time.time() - self._scanned_at > RESCAN_INTERVAL_S
+        # Walking the whole cache is only needed when it may be over budget
+        if over_budget or stale:
+            self.evict()
+        return True
+
+    def _entries(self):
+        """(last_used, size, entry_dir) for every complete entry"""
+        entries = []
+        for prefix in os.listdir(self.root):
+            prefix_dir = os.path.join(self.root, prefix)
+            if not os.path.isdir(prefix_dir):
+                continue
+            for key in os.listdir(prefix_dir):
+                manifest_path = os.path.join(prefix_dir, key, MANIFEST)
+                try:
+                    with open(manifest_path, 'r') as f:
+                        size = json.load(f)["size"]
+                    entries.append((os.path.getmtime(manifest_path), size, os.path.join(prefix_dir, key)))
+                except (OSError, ValueError, KeyError):
+                    continue
+        return entries
+
+    def evict(self) -> int:
+        """Remove least recently used entries once the cache is over its budget"""
+        scanned_at = time.time()
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_size_bytes * LOW_WATER if total > self.max_size_bytes else total
+        evicted = 0
+        for _, size, entry_dir in entries:
+            if total <= target:
+                break
+            shutil.rmtree(entry_dir, ignore_errors=True)
+            total -= size
+            evicted += 1
+        with self._lock:
+            self._total_size = total
+            self._scanned_at = scanned_at
+            self.stats["evictions"] += evicted
+        if evicted:
+            logger.info(f"Evicted {evicted} cache entries")
+        return evicted
+
+    def usage(self) -> Dict[str, Any]:
+        """Entry count, size and hit/miss counts"""
+        entries = self._entries()
+        with self._lock:
+            stats = dict(self.stats)
+        return dict(stats,
+                    entries=len(entries),
+                    size_mb=sum(size for _, size, _ in entries) / (1024 * 1024),
+                    max_size_mb=self.max_size_bytes / (1024 * 1024))
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(root: str, max_size_mb: float = 10240) -> ResultCache:
+    """Return the process-wide cache for `root`"""
+    with _caches_lock:
+        if root not in _caches:
+            _caches[root] = ResultCache(root, max_size_mb)
+        return _caches[root]
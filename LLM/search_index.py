@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Full-text and sentiment search over the aligned segments of every job.
+
+    python search_index.py rebuild results/
+    python search_index.py rebuild /data/reprocessed --db /data/reprocessed/search_index.db --clear
+
+Each aligned segment is a row with its job, speaker label (and the identity
+the speaker index gave it), time range and sentiment; an SQLite FTS5 table
+over the segment text is kept in step by triggers. The run_search_index
+stage indexes a job as soon as its alignment (and sentiment) is done,
+replacing whatever the job had indexed before. The database uses WAL mode,
+like the job store, so worker processes index while the API searches.
+
+Text queries are ranked by BM25 and return the matching part of each
+segment with the terms marked. Ranking every match of a common word takes
+seconds over millions of segments, so only the newest max_candidates
+matches that pass the filters are ranked (the FTS index yields matches
+newest first without sorting); results say when that cut applied. A job's
+segments have consecutive row IDs, so a job filter becomes a row ID range
+the FTS index can seek to. Queries with only filters return segments
+ordered by sentiment score, so max_score=0.2 lists the most negative
+segments first.
+
+The rebuild command indexes every job directory under a results directory
+from its job_results.json, or from the individual output files of jobs
+finished before that file existed.
+"""
+import os
+import re
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+
+from segment_store import SegmentStore, segment_records
+
+logger = logging.getLogger('audio_pipeline.search')
+
+SEGMENT_COLUMNS = ("job_id", "segment_index", "speaker", "speaker_identity", "start_s", "end_s",
+                   "sentiment", "sentiment_score", "text")
+HIGHLIGHT_START = "<mark>"
+HIGHLIGHT_END = "</mark>"
+# Tokens of context around the matched terms in a highlight
+SNIPPET_TOKENS = 24
+
+_QUERY_TERM = re.compile(r'"([^"]*)"|(\S+)')
+
+
+def fts_query(text: str) -> str:
+    """
+    An FTS5 query matching every word of text (double-quoted phrases kept
+    together, a trailing * for prefixes), with FTS5 operators taken literally
+    """
+    terms = []
+    for phrase, word in _QUERY_TERM.findall(text):
+        if phrase.strip():
+            terms.append('"' + phrase.strip() + '"')
+        elif word:
+            prefix = word.endswith("*") and len(word) > 1
+            word = word.rstrip("*").replace('"', '""')
+            if word:
+                terms.append(f'"{word}"' + ("*" if prefix else ""))
+    return " ".join(terms)
+
+
+def segment_rows(job_id: str, aligned: List[Dict[str, Any]], sentiments: Optional[List[Dict[str, Any]]] = None,
+                 speakers: Optional[Dict[str, Any]] = None) -> List[tuple]:
+    """Index rows of a job's aligned segments, with the sentiment and speaker identity of each if known"""
+    # Sentiment results are made one per aligned segment, in the same order
+    if sentiments is not None and len(sentiments) != len(aligned):
+        logger.warning(f"Job {job_id}: {len(sentiments)} sentiment results for {len(aligned)} segments, "
+                       f"indexing without sentiment")
+        sentiments = None
+    rows = []
+    for i, segment in enumerate(aligned):
+        sentiment = sentiments[i] if sentiments is not None else {}
+        identity = (speakers or {}).get(segment["speaker"], {}).get("identity")
+        rows.append((job_id, i, segment["speaker"], identity, float(segment["start"]), float(segment["end"]),
+                     sentiment.get("sentiment"), sentiment.get("sentiment_score"), segment.get("text") or ""))
+    return rows
+
+
+class TranscriptIndex:
+    def __init__(self, path: str, busy_timeout_ms: int = 10000, max_candidates: int = 5000):
+        """Segment search index in a SQLite database shared by every process on this host"""
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self.max_candidates = max_candidates
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS indexed_jobs (
+                job_id TEXT PRIMARY KEY,
+                audio_path TEXT,
+                quality_tier TEXT,
+                segments INTEGER NOT NULL,
+                first_id INTEGER,
+                last_id INTEGER,
+                indexed_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS segments (
+                id INTEGER PRIMARY KEY,
+                job_id TEXT NOT NULL,
+                segment_index INTEGER NOT NULL,
+                speaker TEXT NOT NULL,
+                speaker_identity TEXT,
+                start_s REAL NOT NULL,
+                end_s REAL NOT NULL,
+                sentiment TEXT,
+                sentiment_score REAL,
+                text TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS segments_job ON segments (job_id, segment_index);
+            CREATE INDEX IF NOT EXISTS segments_score ON segments (sentiment_score);
+            CREATE INDEX IF NOT EXISTS segments_identity ON segments (speaker_identity);
+            CREATE VIRTUAL TABLE IF NOT EXISTS segments_fts USING fts5(
+                text, content='segments', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE TRIGGER IF NOT EXISTS segments_insert AFTER INSERT ON segments BEGIN
+                INSERT INTO segments_fts (rowid, text) VALUES (new.id, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS segments_delete AFTER DELETE ON segments BEGIN
+                INSERT INTO segments_fts (segments_fts, rowid, text) VALUES ('delete', old.id, old.text);
+            END;
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0, isolation_level=None)
+            connection.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.row_factory = sqlite3.Row
+            self._local.connection = connection
+        return connection
+
+    def add_job(self, job_id: str, rows: List[tuple], audio_path: Optional[str] = None,
+                quality_tier: Optional[str] = None) -> int:
+        """Replace a job's segments with rows (see segment_rows) in one transaction"""
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute("DELETE FROM segments WHERE job_id = ?", (job_id,))
+            connection.executemany(
+                f"INSERT INTO segments ({', '.join(SEGMENT_COLUMNS)}) VALUES ({', '.join('?' * len(SEGMENT_COLUMNS))})",
+                rows
+            )
+            # One writer at a time, so the job's rows got consecutive IDs
+            first_id, last_id = connection.execute(
+                "SELECT MIN(id), MAX(id) FROM segments WHERE job_id = ?", (job_id,)).fetchone()
+            connection.execute(
+                "INSERT OR REPLACE INTO indexed_jobs "
+                "(job_id, audio_path, quality_tier, segments, first_id, last_id, indexed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (job_id, audio_path, quality_tier, len(rows), first_id, last_id, time.time())
+            )
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return len(rows)
+
+    def delete_job(self, job_id: str) -> int:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            removed = connection.execute("DELETE FROM segments WHERE job_id = ?", (job_id,)).rowcount
+            connection.execute("DELETE FROM indexed_jobs WHERE job_id = ?", (job_id,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return removed
+
+    def clear(self):
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        connection.execute("DELETE FROM segments")
+        connection.execute("DELETE FROM indexed_jobs")
+        connection.execute("COMMIT")
+        connection.execute("INSERT INTO segments_fts (segments_fts) VALUES ('optimize')")
+
+    def search(self, query: Optional[str] = None, job_id: Optional[str] = None, speaker: Optional[str] = None,
+               start: Optional[float] = None, end: Optional[float] = None,
+               min_score: Optional[float] = None, max_score: Optional[float] = None,
+               sentiment: Optional[str] = None, limit: int = 20, offset: int = 0) -> Dict[str, Any]:
+        """
+        Segments matching the text query and filters. speaker matches a
+        speaker label or identity; start and end keep the segments that
+        overlap that part of the call.
+        """
+        start_time = time.perf_counter()
+        connection = self._connection()
+        match = fts_query(query) if query else ""
+        conditions, params = [], []
+        if job_id is not None:
+            conditions.append("s.job_id = ?")
+            params.append(job_id)
+            if match:
+                job = connection.execute("SELECT first_id, last_id FROM indexed_jobs WHERE job_id = ?",
+                                         (job_id,)).fetchone()
+                if job is None or job["first_id"] is None:
+                    return self._response(query, match, limit, offset, [], False, start_time)
+                conditions.append("segments_fts.rowid BETWEEN ? AND ?")
+                params.extend([job["first_id"], job["last_id"]])
+        if speaker is not None:
+            conditions.append("(s.speaker = ? OR s.speaker_identity = ?)")
+            params.extend([speaker, speaker])
+        if start is not None:
+            conditions.append("s.end_s > ?")
+            params.append(start)
+        if end is not None:
+            conditions.append("s.start_s < ?")
+            params.append(end)
+        if min_score is not None:
+            conditions.append("s.sentiment_score >= ?")
+            params.append(min_score)
+        if max_score is not None:
+            conditions.append("s.sentiment_score <= ?")
+            params.append(max_score)
+        if sentiment is not None:
+            conditions.append("s.sentiment = ?")
+            params.append(sentiment)
+
+        columns = "s.id, s." + ", s.".join(SEGMENT_COLUMNS)
+        truncated = False
+        if match:
+            filters = "".join(" AND " + condition for condition in conditions)
+            # Rank only the newest max_candidates matches
+            join = " JOIN segments s ON s.id = segments_fts.rowid" if conditions else ""
+            cutoff = connection.execute(
+                f"SELECT segments_fts.rowid FROM segments_fts{join} "
+                f"WHERE segments_fts MATCH ?{filters} ORDER BY segments_fts.rowid DESC LIMIT 1 OFFSET ?",
+                [match] + params + [self.max_candidates - 1]
+            ).fetchone()
+            if cutoff is not None:
+                truncated = True
+                filters += " AND segments_fts.rowid >= ?"
+                params.append(cutoff[0])
+            sql = (f"SELECT {columns}, snippet(segments_fts, 0, ?, ?, '…', {SNIPPET_TOKENS}) AS highlight "
+                   f"FROM segments_fts JOIN segments s ON s.id = segments_fts.rowid "
+                   f"WHERE segments_fts MATCH ?{filters} ORDER BY bm25(segments_fts) LIMIT ? OFFSET ?")
+            params = [HIGHLIGHT_START, HIGHLIGHT_END, match] + params
+        else:
+            if max_score is not None:
+                order = "s.sentiment_score ASC"
+            elif min_score is not None:
+                order = "s.sentiment_score DESC"
+            else:
+                order = "s.id DESC"
+            where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+            sql = f"SELECT {columns}, NULL AS highlight FROM segments s {where}ORDER BY {order} LIMIT ? OFFSET ?"
+        rows = connection.execute(sql, params + [limit, offset]).fetchall()
+        return self._response(query, match, limit, offset, rows, truncated, start_time)
+
+    @staticmethod
+    def _response(query: Optional[str], match: str, limit: int, offset: int, rows: list,
+                  truncated: bool, start_time: float) -> Dict[str, Any]:
+        hits = [{
+            "job_id": row["job_id"],
+            "segment_index": row["segment_index"],
+            "speaker": row["speaker"],
+            "speaker_identity": row["speaker_identity"],
+            "start": row["start_s"],
+            "end": row["end_s"],
+            "sentiment": row["sentiment"],
+            "sentiment_score": row["sentiment_score"],
+            "text": row["text"],
+            "highlight": row["highlight"]
+        } for row in rows]
+        return {
+            "query": query,
+            "fts_query": match or None,
+            "limit": limit,
+            "offset": offset,
+            "hits": hits,
+            # Only the newest max_candidates matches were ranked
+            "truncated": truncated,
+            "took_ms": (time.perf_counter() - start_time) * 1000
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        connection = self._connection()
+        jobs, segments = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(segments), 0) FROM indexed_jobs").fetchone()
+        return {"path": self.path, "jobs": jobs, "segments": segments}
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_transcript_index(config: Dict[str, Any]) -> TranscriptIndex:
+    """The process-wide index of the database in the search_index config section"""
+    index_config = config.get("search_index", {})
+    path = index_config.get("path") or os.path.join(config["output_dir"], "search_index.db")
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = TranscriptIndex(path, busy_timeout_ms=index_config.get("busy_timeout_ms", 10000),
+                                             max_candidates=index_config.get("max_candidates", 5000))
+        return _indexes[path]
+
+
+def _read_json(path: str):
+    if not os.path.exists(path):
+        return None
+    with open(path, 'r') as f:
+        return json.load(f)
+
+
+def load_job_outputs(job_dir: str) -> Optional[Dict[str, Any]]:
+    """A finished job's ID (if recorded), aligned segments, sentiment and speaker matches, or None if it has none"""
+    combined = _read_json(os.path.join(job_dir, "job_results.json"))
+    if combined is not None:
+        outputs = combined.get("outputs", {})
+        info = combined.get("pipeline_info", {})
+        if isinstance(outputs.get("aligned"), list):
+            tier = info.get("quality_tier") or {}
+            return {"job_id": info.get("job_id"),
+                    "aligned": outputs["aligned"],
+                    "sentiment": outputs["sentiment"] if isinstance(outputs.get("sentiment"), list) else None,
+                    "speakers": outputs.get("speakers") if isinstance(outputs.get("speakers"), dict) else None,
+                    "quality_tier": tier.get("name")}
+
+    # Jobs finished before job_results.json existed
+    aligned = _read_json(os.path.join(job_dir, "aligned_transcript.json"))
+    sentiment = _read_json(os.path.join(job_dir, "sentiment_results.json"))
+    segments = SegmentStore(os.path.join(job_dir, "segments"))
+    if aligned is None and segments.has("speaker", "start", "end", "text"):
+        aligned = segment_records(segments, "aligned")
+        if segments.has("sentiment", "sentiment_score"):
+            sentiment = segment_records(segments, "sentiment")
+    if aligned is None:
+        return None
+    return {"job_id": None, "aligned": aligned, "sentiment": sentiment,
+            "speakers": _read_json(os.path.join(job_dir, "speaker_matches.json")), "quality_tier": None}
+
+
+def rebuild(index: TranscriptIndex, results_dir: str, clear: bool = False) -> Dict[str, Any]:
+    """Index every job directory under results_dir"""
+    start_time = time.time()
+    if clear:
+        index.clear()
+    jobs = segments = skipped = 0
+    for name in sorted(os.listdir(results_dir)):
+        job_dir = os.path.join(results_dir, name)
+        if not os.path.isdir(job_dir) or name.startswith("."):
+            continue
+        try:
+            outputs = load_job_outputs(job_dir)
+        except Exception as e:
+            logger.error(f"Could not read the outputs of {job_dir}: {str(e)}")
+            outputs = None
+        if outputs is None:
+            skipped += 1
+            continue
+        # The job ID the pipeline indexed it under; older jobs only have their directory name
+        job_id = outputs["job_id"] or name
+        segments += index.add_job(job_id, segment_rows(job_id, outputs["aligned"], outputs["sentiment"],
+                                                       outputs["speakers"]),
+                                  quality_tier=outputs["quality_tier"])
+        jobs += 1
+    report = {"jobs": jobs, "segments": segments, "skipped": skipped, "time": time.time() - start_time}
+    logger.info(f"Indexed {segments} segments of {jobs} jobs in {report['time']:.1f}s "
+                f"({skipped} directories without aligned outputs)")
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Maintain the transcript search index")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    rebuild_parser = subparsers.add_parser("rebuild", help="index every job directory under a results directory")
+    rebuild_parser.add_argument("results_dir", help="directory with one subdirectory per job")
+    rebuild_parser.add_argument("--db", help="index database (default: <results_dir>/search_index.db)")
+    rebuild_parser.add_argument("--clear", action="store_true", help="drop jobs that are no longer on disk")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    results_dir = os.path.abspath(args.results_dir)
+    index = TranscriptIndex(args.db or os.path.join(results_dir, "search_index.db"))
+    report = rebuild(index, results_dir, clear=args.clear)
+    print(json.dumps(dict(report, **index.stats()), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
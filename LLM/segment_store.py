@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Columnar storage for per-segment pipeline outputs.
+
+Diarization, alignment and sentiment all describe the same speaker turns,
+so in columnar mode they share one directory with a file per column
+instead of four JSON files that each repeat speaker, timestamps and text:
+
+    start.npy, end.npy                  float64 seconds
+    speaker.codes.npy, .labels.json     categorical (also used for sentiment)
+    text.bin, text.offsets.npy          UTF-8 blob with int64 offsets
+    sentiment_score.npy                 float64
+
+Each stage adds its own columns, so stages never rewrite each other's
+files. Columns are memory-mapped and decoded only when read. The JSON
+shapes of the old files are rebuilt on demand by segment_records.
+"""
+import os
+import json
+from typing import Dict, Any, List, Sequence
+
+import numpy as np
+
+# Columns each JSON output is rebuilt from
+OUTPUT_COLUMNS = {
+    "diarization": ["speaker", "start", "end"],
+    "aligned": ["speaker", "start", "end", "text"],
+    "indicbert_input": ["speaker", "start", "end", "text"],
+    "sentiment": ["speaker", "start", "end", "text", "sentiment", "sentiment_score"]
+}
+
+
+def _write_atomic(path: str, write):
+    temp_path = path + ".tmp"
+    with open(temp_path, 'wb') as f:
+        write(f)
+    os.replace(temp_path, path)
+
+
+class TextColumn:
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        """Strings stored back to back; each is decoded when accessed"""
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index: int) -> str:
+        if index < 0:
+            index += len(self)
+        return bytes(self.blob[self.offsets[index]:self.offsets[index + 1]]).decode("utf-8")
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+class CategoryColumn:
+    def __init__(self, codes: np.ndarray, labels: List[str]):
+        """Integer codes into a small list of labels"""
+        self.codes = codes
+        self.labels = labels
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index: int) -> str:
+        return self.labels[self.codes[index]]
+
+    def __iter__(self):
+        for code in self.codes:
+            yield self.labels[code]
+
+
+class SegmentStore:
+    def __init__(self, path: str):
+        """Column files for one job's segments, in directory `path`"""
+        self.path = path
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    @staticmethod
+    def column_files(name: str, kind: str) -> List[str]:
+        """Files making up a column; the last one is written last and marks it complete"""
+        if kind == "text":
+            return [f"{name}.bin", f"{name}.offsets.npy"]
+        if kind == "category":
+            return [f"{name}.labels.json", f"{name}.codes.npy"]
+        return [f"{name}.npy"]
+
+    def write_numeric(self, name: str, values: Sequence[float], dtype=np.float64):
+        os.makedirs(self.path, exist_ok=True)
+        array = np.asarray(values, dtype=dtype)
+        _write_atomic(self._file(f"{name}.npy"), lambda f: np.save(f, array))
+
+    def write_category(self, name: str, values: Sequence[str]):
+        os.makedirs(self.path, exist_ok=True)
+        labels = sorted(set(values))
+        index = {label: code for code, label in enumerate(labels)}
+        codes = np.array([index[value] for value in values], dtype=np.int32)
+        _write_atomic(self._file(f"{name}.labels.json"), lambda f: f.write(json.dumps(labels).encode("utf-8")))
+        _write_atomic(self._file(f"{name}.codes.npy"), lambda f: np.save(f, codes))
+
+    def write_text(self, name: str, values: Sequence[str]):
+        os.makedirs(self.path, exist_ok=True)
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(item) for item in encoded])
+        _write_atomic(self._file(f"{name}.bin"), lambda f: f.write(b"".join(encoded)))
+        _write_atomic(self._file(f"{name}.offsets.npy"), lambda f: np.save(f, offsets))
+
+    def has(self, *names: str) -> bool:
+        """Whether all the named columns are complete"""
+        for name in names:
+            if not any(os.path.exists(self._file(files[-1]))
+                       for files in (self.column_files(name, kind) for kind in ("numeric", "category", "text"))):
+                return False
+        return True
+
+    def column(self, name: str):
+        """A column, memory-mapped; strings are decoded as they are read"""
+        if os.path.exists(self._file(f"{name}.npy")):
+            return np.load(self._file(f"{name}.npy"), mmap_mode='r')
+        if os.path.exists(self._file(f"{name}.codes.npy")):
+            with open(self._file(f"{name}.labels.json"), 'r') as f:
+                labels = json.load(f)
+            return CategoryColumn(np.load(self._file(f"{name}.codes.npy"), mmap_mode='r'), labels)
+        if os.path.exists(self._file(f"{name}.offsets.npy")):
+            offsets = np.load(self._file(f"{name}.offsets.npy"), mmap_mode='r')
+            if offsets[-1] == 0:
+                blob = np.zeros(0, dtype=np.uint8)
+            else:
+                blob = np.memmap(self._file(f"{name}.bin"), dtype=np.uint8, mode='r')
+            return TextColumn(blob, offsets)
+        raise FileNotFoundError(f"No column '{name}' in {self.path}")
+
+    def __len__(self) -> int:
+        return len(self.column("start"))
+
+
+def segment_records(store: SegmentStore, output: str) -> List[Dict[str, Any]]:
+    """Rebuild one of the JSON outputs (see OUTPUT_COLUMNS) from the columns"""
+    columns = {name: store.column(name) for name in OUTPUT_COLUMNS[output]}
+    records = []
+    for i in range(len(columns["start"])):
+        start, end = float(columns["start"][i]), float(columns["end"][i])
+        if output == "diarization":
+            records.append({"speaker": columns["speaker"][i], "start": start, "end": end})
+        elif output == "aligned":
+            records.append({"speaker": columns["speaker"][i], "start": start, "end": end,
+                            "text": columns["text"][i]})
+        else:
+            record = {"speaker": columns["speaker"][i], "timestamp": f"{start:.2f}-{end:.2f}",
+                      "text": columns["text"][i]}
+            if output == "sentiment":
+                record["sentiment"] = columns["sentiment"][i]
+                record["sentiment_score"] = float(columns["sentiment_score"][i])
+            records.append(record)
+    return records
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Speaker embeddings and the index that recognizes recurring speakers.
+
+Each call's speakers are reduced to one L2-normalized float32 centroid
+embedding. SpeakerStore keeps them in SQLite (the same WAL setup as the
+job store, so every worker process can add to it) with 4 bytes per
+dimension. SpeakerIndex mirrors the store in memory and is refreshed
+incrementally: an exact cosine search over one contiguous matrix for small
+sets, and an inverted-file (IVF) index once the set reaches ivf_min_size,
+probing the nprobe lists whose k-means centroids are closest to the query.
+
+A new speaker takes the identity of its best match when the cosine
+similarity reaches match_threshold, and gets a new identity otherwise.
+"""
+import os
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+from collections import deque
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger('audio_pipeline.speakers')
+
+EMBEDDING_DTYPE = np.float32
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """L2-normalize rows (or a single vector) as float32"""
+    vectors = np.asarray(vectors, dtype=EMBEDDING_DTYPE)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class SpeakerStore:
+    def __init__(self, path: str, busy_timeout_ms: int = 10000):
+        """Speaker centroids in a SQLite database shared by every process on this host"""
+        self.path = path
+        self.busy_timeout_ms = busy_timeout_ms
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript("""
+            CREATE TABLE IF NOT EXISTS speakers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                identity TEXT NOT NULL,
+                job_id TEXT NOT NULL,
+                label TEXT NOT NULL,
+                speech_duration REAL,
+                created REAL NOT NULL,
+                embedding BLOB NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS speakers_job ON speakers (job_id);
+            CREATE INDEX IF NOT EXISTS speakers_identity ON speakers (identity);
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout_ms / 1000.0, isolation_level=None)
+            connection.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def add(self, identity: str, job_id: str, label: str, speech_duration: float, embedding: np.ndarray) -> int:
+        cursor = self._connection().execute(
+            "INSERT INTO speakers (identity, job_id, label, speech_duration, created, embedding) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (identity, job_id, label, speech_duration, time.time(),
+             np.ascontiguousarray(embedding, dtype='<f4').tobytes())
+        )
+        return cursor.lastrowid
+
+    def delete_job(self, job_id: str) -> int:
+        """Remove a job's speakers (e.g. before it is reprocessed)"""
+        return self._connection().execute("DELETE FROM speakers WHERE job_id = ?", (job_id,)).rowcount
+
+    def rows_after(self, last_id: int) -> List[Tuple[int, str, str, str, float, np.ndarray]]:
+        rows = self._connection().execute(
+            "SELECT id, identity, job_id, label, speech_duration, embedding FROM speakers WHERE id > ? ORDER BY id",
+            (last_id,)
+        ).fetchall()
+        return [row[:5] + (np.frombuffer(row[5], dtype='<f4'),) for row in rows]
+
+    def count(self) -> int:
+        return self._connection().execute("SELECT COUNT(*) FROM speakers").fetchone()[0]
+
+
+def kmeans(vectors: np.ndarray, num_clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means centroids of normalized vectors"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=num_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        for cluster in range(num_clusters):
+            members = vectors[assignment == cluster]
+            if len(members):
+                centroids[cluster] = members.sum(axis=0)
+        centroids = normalize(centroids)
+    return centroids
+
+
+class SpeakerIndex:
+    def __init__(self, store: SpeakerStore, match_threshold: float = 0.7, ivf_min_size: int = 5000,
+                 nprobe: int = 8, latency_window: int = 1000):
+        """In-memory search over the store's embeddings, refreshed as rows are added"""
+        self.store = store
+        self.match_threshold = match_threshold
+        self.ivf_min_size = ivf_min_size
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._latencies = deque(maxlen=latency_window)
+        self._reset()
+
+    def _reset(self):
+        self._vectors = None
+        self._size = 0
+        self._rows = []
+        self._last_id = 0
+        self._centroids = None
+        self._lists = None
+        self._trained_size = 0
+
+    def refresh(self):
+        """Load rows added since the last refresh (by any process)"""
+        with self._lock:
+            rows = self.store.rows_after(self._last_id)
+            if self._size and self.store.count() < self._size + len(rows):
+                # Rows were deleted (a job reprocessed): rebuild from scratch
+                self._reset()
+                rows = self.store.rows_after(0)
+            if not rows:
+                return
+            new_vectors = np.stack([row[5] for row in rows])
+            if self._vectors is None:
+                self._vectors = np.zeros((max(1024, len(rows)), new_vectors.shape[1]), dtype=EMBEDDING_DTYPE)
+            if self._size + len(rows) > len(self._vectors):
+                # Grow by doubling so adding stays amortized O(1)
+                grown = np.zeros((max(2 * len(self._vectors), self._size + len(rows)), self._vectors.shape[1]),
+                                 dtype=EMBEDDING_DTYPE)
+                grown[:self._size] = self._vectors[:self._size]
+                self._vectors = grown
+            self._vectors[self._size:self._size + len(rows)] = normalize(new_vectors)
+            first_new = self._size
+            self._size += len(rows)
+            self._rows.extend({"id": row[0], "identity": row[1], "job_id": row[2], "label": row[3],
+                               "speech_duration": row[4]} for row in rows)
+            self._last_id = rows[-1][0]
+            self._update_ivf(first_new)
+
+    def _update_ivf(self, first_new: int):
+        """Train the IVF lists once the set is large; retrain when it has doubled (lock held)"""
+        if self._size < self.ivf_min_size:
+            return
+        vectors = self._vectors[:self._size]
+        if self._centroids is None or self._size >= 2 * self._trained_size:
+            num_lists = max(1, int(np.sqrt(self._size)))
+            start_time = time.time()
+            self._centroids = kmeans(vectors, num_lists)
+            assignment = np.argmax(vectors @ self._centroids.T, axis=1)
+            self._lists = [list(np.flatnonzero(assignment == cluster)) for cluster in range(num_lists)]
+            self._trained_size = self._size
+            logger.info(f"Trained speaker IVF index: {num_lists} lists over {self._size} speakers "
+                        f"in {time.time() - start_time:.2f}s")
+            return
+        assignment = np.argmax(vectors[first_new:] @ self._centroids.T, axis=1)
+        for offset, cluster in enumerate(assignment):
+            self._lists[cluster].append(first_new + offset)
+
+    def _candidates(self, query: np.ndarray) -> Optional[np.ndarray]:
+        """Rows in the probed IVF lists, or None for an exact search (lock held)"""
+        if self._centroids is None:
+            return None
+        probes = np.argsort(-(self._centroids @ query))[:self.nprobe]
+        return np.fromiter((row for probe in probes for row in self._lists[probe]), dtype=np.int64)
+
+    def search(self, embedding: np.ndarray, k: int = 5, exclude_job: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Top-k identities by their best-matching embedding, most similar first"""
+        start_time = time.perf_counter()
+        query = normalize(embedding)
+        with self._lock:
+            if self._size == 0:
+                return []
+            candidates = self._candidates(query)
+            if candidates is None:
+                scores = self._vectors[:self._size] @ query
+                rows = np.arange(self._size)
+            else:
+                scores = self._vectors[candidates] @ query
+                rows = candidates
+            # Enough rows to fill k identities in the common case
+            take = min(len(rows), 8 * k)
+            best = np.argpartition(-scores, take - 1)[:take] if take < len(rows) else np.arange(len(rows))
+            best = best[np.argsort(-scores[best])]
+
+            matches = {}
+            for position in best:
+                row = self._rows[rows[position]]
+                if row["job_id"] == exclude_job or row["identity"] in matches:
+                    continue
+                matches[row["identity"]] = dict(row, similarity=float(scores[position]))
+                if len(matches) == k:
+                    break
+            self._latencies.append((time.perf_counter() - start_time) * 1000)
+        return list(matches.values())
+
+    def register(self, job_id: str, speakers: Dict[str, Tuple[np.ndarray, float]]) -> Dict[str, Dict[str, Any]]:
+        """
+        Add a call's speaker centroids ({label: (embedding, speech seconds)}),
+        each under the identity it matches or a new one
+        """
+        if self.store.delete_job(job_id):
+            logger.info(f"Replacing the indexed speakers of job {job_id}")
+        self.refresh()
+        assigned = {}
+        for label, (embedding, speech_duration) in speakers.items():
+            best = self.search(embedding, k=1, exclude_job=job_id)
+            if best and best[0]["similarity"] >= self.match_threshold:
+                identity, similarity, known = best[0]["identity"], best[0]["similarity"], True
+            else:
+                identity = f"spk_{uuid.uuid4().hex[:12]}"
+                similarity, known = (best[0]["similarity"] if best else None), False
+            self.store.add(identity, job_id, label, speech_duration, normalize(embedding))
+            assigned[label] = {"identity": identity, "known": known, "similarity": similarity,
+                               "speech_duration": speech_duration}
+        self.refresh()
+        return assigned
+
+    def delete_job(self, job_id: str) -> int:
+        """Remove a job's speakers; the index reloads on its next refresh"""
+        deleted = self.store.delete_job(job_id)
+        if deleted:
+            with self._lock:
+                self._reset()
+        return deleted
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            latencies = np.array(self._latencies) if self._latencies else None
+            return {
+                "speakers": self._size,
+                "identities": len({row["identity"] for row in self._rows}),
+                "index": "ivf" if self._centroids is not None else "exact",
+                "ivf_lists": len(self._lists) if self._lists is not None else 0,
+                "nprobe": self.nprobe,
+                "queries": len(self._latencies),
+                "latency_ms": {
+                    "mean": float(latencies.mean()),
+                    "p50": float(np.percentile(latencies, 50)),
+                    "p95": float(np.percentile(latencies, 95)),
+                    "p99": float(np.percentile(latencies, 99))
+                } if latencies is not None else None
+            }
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_speaker_index(config: Dict[str, Any]) -> SpeakerIndex:
+    """The process-wide index of the store in the speaker_index config section"""
+    index_config = config.get("speaker_index", {})
+    path = index_config.get("path") or os.path.join(config["output_dir"], "speakers.db")
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = SpeakerIndex(
+                SpeakerStore(path, busy_timeout_ms=index_config.get("busy_timeout_ms", 10000)),
+                match_threshold=index_config.get("match_threshold", 0.7),
+                ivf_min_size=index_config.get("ivf_min_size", 5000),
+                nprobe=index_config.get("nprobe", 8)
+            )
+        return _indexes[path]
+
+
+def speaker_turn_samples(audio: np.ndarray, turns: List[Dict[str, Any]], sample_rate: int,
+                         min_turn_s: float = 1.0, max_turn_s: float = 10.0,
+                         max_speech_s: float = 60.0) -> Dict[str, List[np.ndarray]]:
+    """Audio of each speaker's longest turns, up to max_speech_s per speaker"""
+    by_speaker = {}
+    for turn in sorted(turns, key=lambda turn: turn["end"] - turn["start"], reverse=True):
+        if turn["end"] - turn["start"] < min_turn_s:
+            continue
+        pieces = by_speaker.setdefault(turn["speaker"], [])
+        if sum(len(piece) for piece in pieces) >= max_speech_s * sample_rate:
+            continue
+        start = int(turn["start"] * sample_rate)
+        end = min(int(turn["end"] * sample_rate), start + int(max_turn_s * sample_rate), len(audio))
+        if end > start:
+            pieces.append(np.asarray(audio[start:end], dtype=np.float32))
+    return by_speaker
@@ -0,0 +1,253 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Per-stage instrumentation for the audio pipeline.
+
+StageProbe measures a stage's wall time, CPU time (of the stage's thread
+and of the whole process), peak RSS sampled while it runs, and the time
+spent loading models versus running them. stage_profiler optionally wraps a
+stage in cProfile or pyinstrument, selected by the "profiling" config
+section or the PIPELINE_PROFILE_STAGES environment variable.
+
+PrometheusMetrics aggregates the metrics of finished jobs into histograms
+and counters in the Prometheus text exposition format.
+"""
+import os
+import time
+import threading
+import resource
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any, Optional, List, Tuple
+
+from model_registry import track_load_time
+
+logger = logging.getLogger('audio_pipeline.metrics')
+
+
+def _current_rss_bytes() -> Optional[int]:
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+class StageProbe:
+    def __init__(self, sample_interval_s: float = 0.05):
+        """Context manager measuring the stage run in the current thread"""
+        self.sample_interval_s = sample_interval_s
+        self.metrics = {}
+        self._stop = threading.Event()
+        self._peak_rss = 0
+        self._sampler = None
+        self._load_tracker = None
+
+    def _sample_rss(self):
+        while not self._stop.wait(self.sample_interval_s):
+            rss = _current_rss_bytes()
+            if rss is not None:
+                self._peak_rss = max(self._peak_rss, rss)
+
+    def __enter__(self) -> "StageProbe":
+        self._wall_start = time.time()
+        self._thread_cpu_start = time.thread_time()
+        self._process_cpu_start = time.process_time()
+        rss = _current_rss_bytes()
+        if rss is not None:
+            self._rss_start = self._peak_rss = rss
+            self._sampler = threading.Thread(target=self._sample_rss, name="rss-sampler", daemon=True)
+            self._sampler.start()
+        else:
+            self._rss_start = None
+        self._load_tracker = track_load_time()
+        self._load_totals = self._load_tracker.__enter__()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._load_tracker.__exit__(*exc_info)
+        wall_time = time.time() - self._wall_start
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._peak_rss = max(self._peak_rss, _current_rss_bytes() or 0)
+
+        model_load_time = self._load_totals["load_time"]
+        self.metrics.update({
+            "wall_time": wall_time,
+            "cpu_time": time.thread_time() - self._thread_cpu_start,
+            # Includes other stages running concurrently and torch's worker threads
+            "process_cpu_time": time.process_time() - self._process_cpu_start,
+            "model_load_time": model_load_time,
+            "inference_time": max(0.0, wall_time - model_load_time)
+        })
+        if self._rss_start is not None:
+            self.metrics["rss_start_mb"] = self._rss_start / (1024 * 1024)
+            self.metrics["peak_rss_mb"] = self._peak_rss / (1024 * 1024)
+        else:
+            # Without psutil only the process-lifetime peak is available
+            self.metrics["peak_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return False
+
+
+def _profiled_stages(config: Dict[str, Any]) -> Tuple[List[str], str]:
+    """Stages to profile and the profiler, from the environment or the config"""
+    env_stages = os.environ.get("PIPELINE_PROFILE_STAGES")
+    profile_config = config.get("profiling", {})
+    if env_stages:
+        stages = [stage.strip() for stage in env_stages.split(",") if stage.strip()]
+    elif profile_config.get("enabled", False):
+        stages = profile_config.get("stages") or ["all"]
+    else:
+        stages = []
+    return stages, os.environ.get("PIPELINE_PROFILER") or profile_config.get("tool", "cprofile")
+
+
+@contextmanager
+def stage_profiler(config: Dict[str, Any], func_name: str, metrics: Dict[str, Any]):
+    """Profile the stage if selected; the report path is stored in metrics["profile"]"""
+    stages, tool = _profiled_stages(config)
+    if func_name not in stages and "all" not in stages:
+        yield
+        return
+
+    profile_dir = config.get("profiling", {}).get("dir") or os.path.join(config["output_dir"], "profiles")
+    os.makedirs(profile_dir, exist_ok=True)
+    if tool == "pyinstrument":
+        from pyinstrument import Profiler
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield
+        finally:
+            profiler.stop()
+            path = os.path.join(profile_dir, f"{func_name}.html")
+            with open(path, 'w') as f:
+                f.write(profiler.output_html())
+            metrics["profile"] = path
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            path = os.path.join(profile_dir, f"{func_name}.prof")
+            profiler.dump_stats(path)
+            metrics["profile"] = path
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: List[float], label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = sorted(buckets)
+        self.label_names = label_names
+        self._series = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self._series.setdefault(labels, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series["counts"][i] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+    def _labels(self, labels: Tuple[str, ...], extra: str = "") -> str:
+        parts = [f'{name}="{value}"' for name, value in zip(self.label_names, labels)]
+        if extra:
+            parts.append(extra)
+        return "{" + ",".join(parts) + "}" if parts else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series["counts"]):
+                bucket_labels = self._labels(labels, 'le="%g"' % bound)
+                lines.append(f"{self.name}_bucket{bucket_labels} {count}")
+            inf_labels = self._labels(labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf_labels} {series['count']}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {series['sum']:.6f}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {series['count']}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...] = ()):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self._values = {}
+
+    def inc(self, amount: float = 1, *labels: str):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self._values.items()):
+            label_text = ",".join(f'{name}="{label}"' for name, label in zip(self.label_names, labels))
+            lines.append(f"{self.name}{{{label_text}}} {value:g}" if label_text else f"{self.name} {value:g}")
+        return lines
+
+
+SECONDS_BUCKETS = [0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800, 3600]
+RTF_BUCKETS = [0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5]
+RSS_MB_BUCKETS = [256, 512, 1024, 2048, 4096, 8192, 16384]
+
+
+class PrometheusMetrics:
+    def __init__(self):
+        """Aggregated metrics of the jobs finished in this process"""
+        self._lock = threading.Lock()
+        self.stage_duration = Histogram("pipeline_stage_duration_seconds", "Stage wall time",
+                                        SECONDS_BUCKETS, ("stage",))
+        self.stage_cpu = Histogram("pipeline_stage_cpu_seconds", "CPU time of the stage thread",
+                                   SECONDS_BUCKETS, ("stage",))
+        self.stage_model_load = Histogram("pipeline_stage_model_load_seconds", "Time spent loading models",
+                                          SECONDS_BUCKETS, ("stage",))
+        self.stage_rtf = Histogram("pipeline_stage_real_time_factor", "Stage wall time per second of audio",
+                                   RTF_BUCKETS, ("stage",))
+        self.stage_rss = Histogram("pipeline_stage_peak_rss_megabytes", "Peak resident memory during the stage",
+                                   RSS_MB_BUCKETS, ("stage",))
+        self.job_duration = Histogram("pipeline_job_duration_seconds", "Job wall time", SECONDS_BUCKETS)
+        self.jobs = Counter("pipeline_jobs_total", "Finished jobs by status", ("status",))
+        self.jobs_by_tier = Counter("pipeline_jobs_by_quality_tier_total", "Finished jobs by quality tier",
+                                    ("tier",))
+        self.stage_cache_hits = Counter("pipeline_stage_cache_hits_total", "Stages restored from the result cache",
+                                        ("stage",))
+        self.tokens = Counter("pipeline_tokens_total", "Model tokens processed", ("stage", "kind"))
+
+    def observe_job(self, status: str, duration: Optional[float], results: Optional[Dict[str, Any]]):
+        with self._lock:
+            self.jobs.inc(1, status)
+            if duration is not None:
+                self.job_duration.observe(duration)
+            tier = ((results or {}).get("quality_tier") or {}).get("name")
+            if tier:
+                self.jobs_by_tier.inc(1, tier)
+            for stage, metrics in ((results or {}).get("stage_metrics") or {}).items():
+                self.stage_duration.observe(metrics["wall_time"], stage)
+                self.stage_cpu.observe(metrics["cpu_time"], stage)
+                self.stage_model_load.observe(metrics["model_load_time"], stage)
+                if metrics.get("rtf") is not None:
+                    self.stage_rtf.observe(metrics["rtf"], stage)
+                if metrics.get("peak_rss_mb") is not None:
+                    self.stage_rss.observe(metrics["peak_rss_mb"], stage)
+                if metrics.get("cached"):
+                    self.stage_cache_hits.inc(1, stage)
+                for kind in ("input_tokens", "output_tokens"):
+                    if metrics.get(kind):
+                        self.tokens.inc(metrics[kind], stage, kind.split("_")[0])
+
+    def render(self, gauges: Optional[Dict[str, float]] = None) -> str:
+        """Text exposition; gauges are current values such as the queue depth"""
+        lines = []
+        with self._lock:
+            for metric in (self.stage_duration, self.stage_cpu, self.stage_model_load, self.stage_rtf,
+                           self.stage_rss, self.job_duration, self.jobs, self.jobs_by_tier, self.stage_cache_hits,
+                           self.tokens):
+                lines.extend(metric.render())
+        for name, value in (gauges or {}).items():
+            lines.extend([f"# TYPE {name} gauge", f"{name} {value:g}"])
+        return "\n".join(lines) + "\n"
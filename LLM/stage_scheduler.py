@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DAG scheduler for pipeline stages.
+
+Each stage names the stages it depends on. A stage is started as soon as
+all of its dependencies have succeeded, so independent stages (diarization
+and Whisper, sentiment and summarization) run at the same time. A stage
+whose dependency failed is skipped. Stages listed under "after" only have
+to finish, successfully or not, before the stage starts.
+"""
+import os
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, Optional, List, Callable
+
+logger = logging.getLogger('audio_pipeline.scheduler')
+
+# Worker processes are kept alive between runs so their models stay loaded
+_process_pools = {}
+_process_pools_lock = threading.Lock()
+
+
+def _get_process_pool(max_workers: int) -> ProcessPoolExecutor:
+    with _process_pools_lock:
+        if max_workers not in _process_pools:
+            _process_pools[max_workers] = ProcessPoolExecutor(max_workers=max_workers)
+        return _process_pools[max_workers]
+
+
+def _set_torch_threads(num_threads: int):
+    try:
+        import torch
+        torch.set_num_threads(max(1, int(num_threads)))
+    except ImportError:
+        pass
+
+
+# torch has one intra-op pool per process; in thread mode it is sized once
+_shared_threads_size = None
+_shared_threads_lock = threading.Lock()
+
+
+def _size_shared_threads(num_threads: int):
+    """Size the process's torch pool on first use; later schedulers keep it"""
+    global _shared_threads_size
+    with _shared_threads_lock:
+        if _shared_threads_size is None:
+            _shared_threads_size = num_threads
+            _set_torch_threads(num_threads)
+            logger.info(f"Using {num_threads} torch threads for concurrently running stages")
+
+
+def _call_with_torch_threads(run_stage: Callable[[str], Dict[str, Any]], name: str,
+                             num_threads: Optional[int]) -> Dict[str, Any]:
+    """Run a stage in a worker process with its own torch thread count"""
+    if num_threads:
+        _set_torch_threads(num_threads)
+    return run_stage(name)
+
+
+class StageScheduler:
+    def __init__(self,
+                 stages: List[Dict[str, Any]],
+                 max_workers: int = 2,
+                 executor: str = "thread",
+                 torch_threads: Optional[Dict[str, int]] = None):
+        """
+        stages: list of {"name": ..., "depends_on": [...], "after": [...]} in topological order
+        executor: "thread" (models shared in-process) or "process"
+        torch_threads: per-stage torch intra-op thread counts
+        """
+        if executor not in ("thread", "process"):
+            raise ValueError(f"Unknown executor type: {executor}")
+        self.stages = stages
+        self.max_workers = max(1, int(max_workers))
+        self.executor = executor
+        self.torch_threads = torch_threads or {}
+
+    def _shared_threads(self) -> int:
+        """
+        Thread mode shares the process's one torch pool, so it is set once
+        (torch.set_num_threads is process-global and stages calling it would
+        overwrite each other) to the budgets of the max_workers largest
+        stages, capped at the CPU count
+        """
+        budgets = sorted((self.torch_threads.get(stage["name"], 1) for stage in self.stages), reverse=True)
+        total = sum(budgets[:self.max_workers])
+        return min(total, os.cpu_count() or total)
+
+    def run(self,
+            run_stage: Callable[[str], Dict[str, Any]],
+            should_stop: Optional[Callable[[], bool]] = None,
+            on_complete: Optional[Callable[[str, Dict[str, Any]], None]] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Run all stages and return their outcomes keyed by stage name.
+
+        run_stage(name) must return a dict with at least a "success" key. In
+        process mode it must be picklable (a module-level function or partial).
+        should_stop() is checked before starting each stage; once it returns
+        True no new stages start and the pending ones are marked cancelled.
+        on_complete(name, outcome) is called on this thread as each stage
+        finishes, before any stage depending on it starts.
+        """
+        pending = {stage["name"]: stage for stage in self.stages}
+        outcomes = {}
+        running = {}
+
+        if self.executor == "process":
+            pool = _get_process_pool(self.max_workers)
+            owns_pool = False
+        else:
+            pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="stage")
+            owns_pool = True
+            if self.torch_threads:
+                _size_shared_threads(self._shared_threads())
+
+        try:
+            while pending or running:
+                if pending and should_stop is not None and should_stop():
+                    logger.info(f"Stopping before {', '.join(pending)}")
+                    for name in list(pending):
+                        outcomes[name] = {"success": False, "skipped": True, "cancelled": True,
+                                          "error": None, "duration": 0.0}
+                    pending.clear()
+
+                progressed = False
+                for name, stage in list(pending.items()):
+                    deps = stage.get("depends_on", [])
+                    after = stage.get("after", [])
+                    failed = [dep for dep in deps if dep in outcomes and not outcomes[dep]["success"]]
+                    if failed:
+                        logger.error(f"Skipping {name}: {', '.join(failed)} did not succeed")
+                        outcomes[name] = {"success": False, "skipped": True, "error": None, "duration": 0.0}
+                        del pending[name]
+                        progressed = True
+                    elif all(dep in outcomes for dep in deps + after):
+                        if self.executor == "process":
+                            future = pool.submit(_call_with_torch_threads, run_stage, name,
+                                                 self.torch_threads.get(name))
+                        else:
+                            future = pool.submit(run_stage, name)
+                        running[future] = (name, time.time())
+                        del pending[name]
+                        progressed = True
+
+                if not running:
+                    if not progressed and pending:
+                        # Unknown dependency names would otherwise loop forever
+                        for name in list(pending):
+                            outcomes[name] = {"success": False, "skipped": True,
+                                              "error": f"Unresolvable dependencies for {name}",
+                                              "duration": 0.0}
+                        pending.clear()
+                    continue
+
+                done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in done:
+                    name, start_time = running.pop(future)
+                    try:
+                        outcomes[name] = future.result()
+                    except Exception as e:
+                        outcomes[name] = {"success": False, "error": str(e),
+                                          "duration": time.time() - start_time}
+                    if on_complete is not None:
+                        on_complete(name, outcomes[name])
+        finally:
+            if owns_pool:
+                pool.shutdown(wait=True)
+
+        return outcomes
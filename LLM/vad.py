@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Energy-based voice activity detection.
+
+Frames whose RMS level is well above the call's noise floor count as
+speech. Short gaps are bridged, short blips dropped and regions padded, so
+hold music at low level and long silences are cut while speech is kept
+intact. TimelineMap translates times in the speech-only audio back to the
+original recording.
+"""
+import bisect
+import logging
+from typing import Dict, Any, List, Tuple, Iterable
+
+import numpy as np
+
+logger = logging.getLogger('audio_pipeline.vad')
+
+
+def frame_levels_db(samples: np.ndarray, frame_samples: int) -> np.ndarray:
+    """RMS level in dBFS of each complete frame"""
+    num_frames = len(samples) // frame_samples
+    if num_frames == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:num_frames * frame_samples].reshape(num_frames, frame_samples)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float32), axis=1))
+    return 20.0 * np.log10(np.maximum(rms, 1e-10))
+
+
+def detect_speech_regions(levels_db: np.ndarray,
+                          frame_s: float,
+                          margin_db: float = 12.0,
+                          min_threshold_db: float = -50.0,
+                          min_speech_s: float = 0.25,
+                          min_silence_s: float = 0.5,
+                          pad_s: float = 0.2,
+                          total_s: float = None) -> List[Tuple[float, float]]:
+    """
+    Return speech regions as (start, end) seconds.
+
+    The threshold is the 10th percentile level (the noise floor) plus
+    margin_db, and never below min_threshold_db.
+    """
+    if len(levels_db) == 0:
+        return []
+    threshold = max(float(np.percentile(levels_db, 10)) + margin_db, min_threshold_db)
+    speech = levels_db > threshold
+
+    # Runs of speech frames as (start_frame, end_frame)
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], speech.astype(np.int8), [0]])))
+    runs = list(zip(edges[0::2], edges[1::2]))
+
+    regions = []
+    for start_frame, end_frame in runs:
+        start, end = float(start_frame * frame_s), float(end_frame * frame_s)
+        if regions and start - regions[-1][1] < min_silence_s:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    regions = [(start, end) for start, end in regions if end - start >= min_speech_s]
+
+    # Pad and merge regions the padding made touch
+    total_s = total_s if total_s is not None else len(levels_db) * frame_s
+    padded = []
+    for start, end in regions:
+        start, end = max(0.0, start - pad_s), min(total_s, end + pad_s)
+        if padded and start <= padded[-1][1]:
+            padded[-1] = (padded[-1][0], end)
+        else:
+            padded.append((start, end))
+    return padded
+
+
+class TimelineMap:
+    def __init__(self, regions: List[Tuple[float, float]]):
+        """Map between speech-only audio (regions back to back) and the original timeline"""
+        self.regions = [(float(start), float(end)) for start, end in regions]
+        self.compact_starts = []
+        position = 0.0
+        for start, end in self.regions:
+            self.compact_starts.append(position)
+            position += end - start
+        self.speech_duration = position
+
+    def to_original(self, t: float) -> float:
+        """Original time of a point in the speech-only audio"""
+        if not self.regions:
+            return t
+        index = max(0, bisect.bisect_right(self.compact_starts, t) - 1)
+        start, end = self.regions[index]
+        return min(start + (t - self.compact_starts[index]), end)
+
+    def map_interval(self, start: float, end: float) -> List[Tuple[float, float]]:
+        """Original-time pieces of an interval, split where silence was cut out"""
+        if not self.regions:
+            return [(start, end)]
+        first = max(0, bisect.bisect_right(self.compact_starts, start) - 1)
+        last = max(0, bisect.bisect_right(self.compact_starts, end) - 1)
+        pieces = []
+        for index in range(first, last + 1):
+            region_start, region_end = self.regions[index]
+            compact_start = self.compact_starts[index]
+            piece_start = region_start + max(0.0, start - compact_start)
+            piece_end = min(region_end, region_start + (end - compact_start))
+            if piece_end > piece_start:
+                pieces.append((piece_start, piece_end))
+        return pieces
+
+    def remap_triples(self, triples: Iterable[List[Any]]) -> List[List[Any]]:
+        """Map [start, end, text] triples back to the original timeline"""
+        return [[round(self.to_original(start), 2), round(self.to_original(end), 2), text]
+                for start, end, text in triples]
+
+
+def vad_report(regions: List[Tuple[float, float]], total_s: float) -> Dict[str, Any]:
+    """How much of the recording was kept and skipped"""
+    speech_s = sum(end - start for start, end in regions)
+    return {
+        "total_duration": total_s,
+        "speech_duration": speech_s,
+        "skipped_duration": max(0.0, total_s - speech_s),
+        "skipped_ratio": (max(0.0, total_s - speech_s) / total_s) if total_s > 0 else 0.0,
+        "regions": len(regions)
+    }